@@ -0,0 +1,331 @@
+from babel.numbers import format_percent
+from sqlalchemy import and_, case, exists, func, or_
+from sqlalchemy.orm import aliased
+
+from app import db, util
+from app.models import Payment, Project, Subproject
+
+
+# The functions in this module calculate the same amounts as
+# util.calculate_project_amounts and util.calculate_subproject_amounts, but
+# do the summing in the database using a couple of grouped queries instead
+# of loading every payment into Python. This keeps the work for the index
+# and project pages proportional to the number of (sub)projects instead of
+# the number of payments. Amounts are NUMERIC columns, so the database sums
+# them exactly and they are returned as Decimals.
+
+
+# Returns a SQL expression which is true if the payment doesn't come from or
+# go to the IBAN of the project that the payment's subproject belongs to. If
+# the project has no IBAN then all payments are counted.
+def _not_from_or_to_project_iban():
+    return or_(
+        Project.iban.is_(None),
+        Project.iban == '',
+        Payment.counterparty_alias_value.is_(None),
+        Payment.counterparty_alias_value != Project.iban
+    )
+
+
+# Returns a SQL expression which is true if the payment comes from an IBAN
+# of one of the subprojects of the payment's project
+def _from_own_subproject_iban():
+    own_subproject = aliased(Subproject)
+    return exists().where(
+        and_(
+            own_subproject.project_id == Payment.project_id,
+            or_(
+                own_subproject.iban == Payment.counterparty_alias_value,
+                and_(
+                    own_subproject.iban.is_(None),
+                    Payment.counterparty_alias_value.is_(None)
+                )
+            )
+        )
+    )
+
+
+# Sum the payments which are directly linked to projects, grouped per project.
+# Returns a dict of project_id -> {'awarded': ..., 'spent': ...}
+def _sum_project_payments(project_ids):
+    query = db.session.query(
+        Payment.project_id,
+        func.coalesce(
+            func.sum(
+                case(
+                    [
+                        (
+                            and_(
+                                Payment.amount_value > 0,
+                                ~_from_own_subproject_iban()
+                            ),
+                            Payment.amount_value
+                        )
+                    ],
+                    else_=0
+                )
+            ),
+            0
+        ),
+        func.coalesce(
+            func.sum(
+                case(
+                    [(Payment.amount_value < 0, -Payment.amount_value)],
+                    else_=0
+                )
+            ),
+            0
+        )
+    ).filter(
+        Payment.project_id.in_(project_ids)
+    ).group_by(
+        Payment.project_id
+    )
+
+    return {
+        project_id: {'awarded': awarded, 'spent': spent}
+        for project_id, awarded, spent in query
+    }
+
+
+# Sum the payments of subprojects, grouped per subproject. Both the plain sum
+# of incoming payments (used for the subproject itself) and the sum of
+# incoming payments which don't come from the project IBAN (used for the
+# project totals) are returned.
+# Returns a dict of subproject_id -> {'project_id': ..., 'awarded': ...,
+# 'awarded_external': ..., 'spent': ...}
+def _sum_subproject_payments(filter_expression):
+    query = db.session.query(
+        Subproject.id,
+        Subproject.project_id,
+        func.coalesce(
+            func.sum(
+                case(
+                    [(Payment.amount_value > 0, Payment.amount_value)],
+                    else_=0
+                )
+            ),
+            0
+        ),
+        func.coalesce(
+            func.sum(
+                case(
+                    [
+                        (
+                            and_(
+                                Payment.amount_value > 0,
+                                _not_from_or_to_project_iban()
+                            ),
+                            Payment.amount_value
+                        )
+                    ],
+                    else_=0
+                )
+            ),
+            0
+        ),
+        func.coalesce(
+            func.sum(
+                case(
+                    [
+                        (
+                            and_(
+                                Payment.amount_value < 0,
+                                _not_from_or_to_project_iban()
+                            ),
+                            -Payment.amount_value
+                        )
+                    ],
+                    else_=0
+                )
+            ),
+            0
+        )
+    ).join(
+        Payment, Payment.subproject_id == Subproject.id
+    ).join(
+        Project, Project.id == Subproject.project_id
+    ).filter(
+        filter_expression
+    ).group_by(
+        Subproject.id,
+        Subproject.project_id
+    )
+
+    return {
+        subproject_id: {
+            'project_id': project_id,
+            'awarded': awarded,
+            'awarded_external': awarded_external,
+            'spent': spent
+        }
+        for (subproject_id, project_id, awarded, awarded_external, spent)
+        in query
+    }
+
+
+# Format the awarded and spent amounts of a project in the same way as
+# util.calculate_project_amounts
+def format_project_amounts(project, awarded, spent):
+    amounts = {
+        'id': project.id,
+        'awarded': awarded,
+        'awarded_str': util.format_currency(awarded),
+        'spent': spent
+    }
+
+    # Calculate percentage spent
+    denominator = amounts['awarded']
+    if project.budget:
+        denominator = project.budget
+
+    if denominator == 0:
+        amounts['percentage_spent_str'] = format_percent(0)
+    else:
+        amounts['percentage_spent_str'] = format_percent(
+            amounts['spent'] / denominator
+        )
+
+    amounts['spent_str'] = util.format_currency(amounts['spent'])
+
+    amounts['left_str'] = util.format_currency(
+        round(amounts['awarded']) - round(amounts['spent'])
+    )
+    if project.budget:
+        amounts['left_str'] = util.format_currency(
+            round(project.budget) - round(amounts['spent'])
+        )
+
+    return amounts
+
+
+# Format the awarded and spent amounts of a subproject in the same way as
+# util.calculate_subproject_amounts
+def format_subproject_amounts(subproject, awarded, spent):
+    amounts = {
+        'id': subproject.id,
+        'awarded': awarded,
+        'awarded_str': util.format_currency(awarded),
+        'spent': spent
+    }
+
+    # Calculate percentage spent
+    if amounts['awarded'] == 0:
+        amounts['percentage_spent_str'] = format_percent(0)
+    else:
+        amounts['percentage_spent_str'] = format_percent(
+            amounts['spent'] / amounts['awarded']
+        )
+        if subproject.budget:
+            amounts['percentage_spent_str'] = format_percent(
+                amounts['spent'] / subproject.budget
+            )
+
+    amounts['spent_str'] = util.format_currency(amounts['spent'])
+
+    amounts['left_str'] = util.format_currency(
+        round(amounts['awarded']) - round(amounts['spent'])
+    )
+    if subproject.budget:
+        amounts['left_str'] = util.format_currency(
+            round(subproject.budget) - round(amounts['spent'])
+        )
+
+    return amounts
+
+
+# Sum the amounts awarded and spent of multiple projects at once. Returns a
+# dict of project_id -> (awarded, spent).
+def calculate_projects_sums(projects):
+    projects = list(projects)
+    if not projects:
+        return {}
+    project_ids = [project.id for project in projects]
+
+    project_sums = _sum_project_payments(project_ids)
+    subproject_sums = _sum_subproject_payments(
+        Subproject.project_id.in_(project_ids)
+    )
+
+    all_sums = {}
+    for project in projects:
+        project_sum = project_sums.get(project.id, {'awarded': 0, 'spent': 0})
+
+        # Incoming payments on the project itself (excluding those coming
+        # from its own subprojects)
+        awarded = project_sum['awarded']
+        spent = 0
+        if project.contains_subprojects:
+            # Also add incoming payments of the subprojects which don't come
+            # from the project IBAN and only count outgoing payments of the
+            # subprojects which don't go to the project IBAN
+            for subproject_sum in subproject_sums.values():
+                if subproject_sum['project_id'] != project.id:
+                    continue
+                awarded += subproject_sum['awarded_external']
+                spent += subproject_sum['spent']
+        else:
+            spent = project_sum['spent']
+
+        all_sums[project.id] = (awarded, spent)
+
+    return all_sums
+
+
+# Calculate the amounts of multiple projects at once. Returns a dict of
+# project_id -> amounts, where amounts has the same shape as the result of
+# util.calculate_project_amounts.
+def calculate_projects_amounts(projects):
+    projects = list(projects)
+    all_sums = calculate_projects_sums(projects)
+    return {
+        project.id: format_project_amounts(project, *all_sums[project.id])
+        for project in projects
+    }
+
+
+def calculate_project_amounts(project_id):
+    project = Project.query.get(project_id)
+    return calculate_projects_amounts([project])[project.id]
+
+
+# Sum the amounts awarded and spent of multiple subprojects at once. Returns
+# a dict of subproject_id -> (awarded, spent).
+def calculate_subprojects_sums(subprojects):
+    subprojects = list(subprojects)
+    if not subprojects:
+        return {}
+
+    subproject_sums = _sum_subproject_payments(
+        Subproject.id.in_([subproject.id for subproject in subprojects])
+    )
+
+    all_sums = {}
+    for subproject in subprojects:
+        subproject_sum = subproject_sums.get(
+            subproject.id, {'awarded': 0, 'spent': 0}
+        )
+        all_sums[subproject.id] = (
+            subproject_sum['awarded'], subproject_sum['spent']
+        )
+
+    return all_sums
+
+
+# Calculate the amounts of multiple subprojects at once. Returns a dict of
+# subproject_id -> amounts, where amounts has the same shape as the result
+# of util.calculate_subproject_amounts.
+def calculate_subprojects_amounts(subprojects):
+    subprojects = list(subprojects)
+    all_sums = calculate_subprojects_sums(subprojects)
+    return {
+        subproject.id: format_subproject_amounts(
+            subproject, *all_sums[subproject.id]
+        )
+        for subproject in subprojects
+    }
+
+
+def calculate_subproject_amounts(subproject_id):
+    subproject = Subproject.query.get(subproject_id)
+    return calculate_subprojects_amounts([subproject])[subproject.id]
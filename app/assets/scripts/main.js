@@ -7,8 +7,6 @@ import 'bootstrap-table';
 import 'bootstrap-table/dist/locale/bootstrap-table-nl-NL.min.js';
 import 'bootstrap-table/dist/extensions/sticky-header/bootstrap-table-sticky-header.min.js';
 import 'bootstrap-table/dist/extensions/mobile/bootstrap-table-mobile.min.js';
-import 'tableexport.jquery.plugin/tableExport.min.js';
-import 'bootstrap-table/dist/extensions/export/bootstrap-table-export.min.js';
 import 'bootstrap-table/dist/extensions/cookie/bootstrap-table-cookie.min.js';
 import naturalSort from 'javascript-natural-sort';
 import moment from 'moment';
@@ -67,6 +65,110 @@ window.detailFormatter = function(index, row) {
   return $('#detail-' + id).html()
 }
 
+// The functions below are used by the server-side payment tables (see
+// partials/server_side_payment_table.html), which load their rows from the
+// payments.json routes. Values passed to the formatters are already escaped
+// by bootstrap-table, other fields of the row are not.
+var escapeHtml = function(value) {
+  return $('<div>').text(value === null || value === undefined ? '' : value).html();
+};
+
+// Add the date and category filters to the request of a server-side payment table
+window.paymentTableQueryParams = function(params) {
+  $('.payment-table-filter').each(function() {
+    if ($(this).val()) {
+      params[$(this).attr('name')] = $(this).val();
+    }
+  });
+  return params;
+};
+
+window.paymentRowStyle = function(row) {
+  if (row.type === 'MANUAL') {
+    return {classes: 'manual-payment'};
+  }
+  return {};
+};
+
+window.cellFormatter = function(value) {
+  return '<div class="cell">' + (value || '') + '</div>';
+};
+
+window.subprojectFormatter = function(value, row) {
+  if (!row.initiatief_url) {
+    return window.cellFormatter('');
+  }
+  return '<div class="cell"><a href="' + escapeHtml(row.initiatief_url) + '">' + value + '</a></div>';
+};
+
+window.amountFormatter = function(value, row) {
+  var html = '<div class="cell justify-content-end">';
+  if (row.hidden) {
+    html += '<i>Deze transactie is verborgen&nbsp;&nbsp;</i>';
+  }
+  if (row.bedrag >= 0) {
+    html += '<h1 class="text-blue text-right">+' + escapeHtml(row.bedrag_formatted) + '</h1>';
+  } else {
+    html += '<h1 class="text-red text-right">' + escapeHtml(row.bedrag_formatted) + '</h1>';
+  }
+  return html + '</div>';
+};
+
+window.descriptionFormatter = function(value) {
+  return window.cellFormatter(value || '<i>nog niet toegevoegd</i>');
+};
+
+window.mediaFormatter = function(value, row) {
+  var icons = [];
+  if (row.bonnen) {
+    icons.push('<i class="fas fa-2x fa-receipt"></i>');
+  }
+  if (row.media) {
+    icons.push('<i class="fas fa-2x fa-camera"></i>');
+  }
+  return '<div class="cell justify-content-center">' + icons.join('&nbsp;') + '</div>';
+};
+
+window.detailButtonFormatter = function() {
+  return '<div class="cell last-cell justify-content-center"><button type="button" class="btn button-detail"><i class="fas fa-chevron-down"></i></button></div>';
+};
+
+window.serverDetailFormatter = function(index, row) {
+  return row.detail;
+};
+
+// Reload a server-side payment table from its first page when a filter changes
+$(document).on('change', '.payment-table-filter', function() {
+  $('.payment-table').bootstrapTable('selectPage', 1);
+});
+
+// Export the payments matching the search, filters and sort order of the
+// payment table (see export.py)
+$(document).on('click', '.payment-export', function(e) {
+  var options = $('.payment-table').bootstrapTable('getOptions');
+  var params = window.paymentTableQueryParams({});
+  if (options.searchText) {
+    params.search = options.searchText;
+  }
+  if (options.sortName) {
+    params.sort = options.sortName;
+    params.order = options.sortOrder;
+  }
+  window.location = $(this).attr('href') + '?' + $.param(params);
+  e.preventDefault();
+});
+
+// Load the edit form of a payment when its detail view is opened (only used
+// for large projects, see use_lazy_payment_forms in form_processing.py)
+$(document).on('expand-row.bs.table', '.payment-table', function(e, index, row, $detail) {
+  $detail.find('.lazy-payment-form').each(function() {
+    var $placeholder = $(this);
+    $.get($placeholder.data('url'), function(html) {
+      $placeholder.replaceWith(html);
+    });
+  });
+});
+
 // Create a donut with of the spent percentage
 window.donut = function(thisObj) {
   // Clear HTML, otherwise you generate more donuts when resizing the window
@@ -18,13 +18,18 @@ export default {
     );
 
     // We need JavaScript to set the rounded border of the last visible element in a tr
-    $('.payment-table tr').find('td:not(.d-none):last').css(
-      {
-        'border-right-style': 'solid',
-        'border-bottom-right-radius': '35px',
-        'border-top-right-radius': '35px'
-      }
-    )
+    var roundLastCells = function() {
+      $('.payment-table tr').find('td:not(.d-none):last').css(
+        {
+          'border-right-style': 'solid',
+          'border-bottom-right-radius': '35px',
+          'border-top-right-radius': '35px'
+        }
+      )
+    };
+    roundLastCells();
+    // Server-side payment tables render their rows after each page is loaded
+    $('.payment-table').on('post-body.bs.table', roundLastCells);
   },
   finalize() {
     // JavaScript to be fired on all pages, after page specific JS is fired
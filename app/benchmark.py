@@ -0,0 +1,421 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+from tempfile import mkdtemp
+from time import perf_counter
+import random
+import shutil
+import statistics
+
+from sqlalchemy import event
+
+from app import app, db, aggregation, totals, util
+from app.models import (
+    Category, File, Payment, Project, Subproject, User, payment_attachment
+)
+
+
+# Benchmarks of the pages and the sync and aggregation functions on a
+# database filled with synthetic data of a realistic size, to see the
+# effect of a change on the latency and the number of queries before it is
+# deployed. The benchmarks run on a separate database (an in-memory SQLite
+# database by default, or e.g. a local PostgreSQL database), which is
+# created, filled and removed again; see 'flask benchmark run'.
+#
+# Every benchmark is run a number of rounds after one warm-up round and
+# reports the same statistics as pytest-benchmark, plus the number of
+# queries per round.
+
+
+BENCHMARK_PASSWORD = 'benchmark-wachtwoord'
+
+# Number of rows inserted at a time while seeding
+SEED_BATCH_SIZE = 1000
+
+BenchmarkResult = namedtuple(
+    'BenchmarkResult',
+    ['name', 'rounds', 'min', 'max', 'mean', 'stddev', 'median', 'queries']
+)
+
+
+def _iban(number):
+    return 'NL%02dBENC%010d' % (number % 100, number)
+
+
+# Insert rows in batches. All rows get the same columns, which is required
+# to insert them with one statement.
+def _insert(table, rows):
+    if not rows:
+        return
+    columns = set().union(*rows)
+    rows = [{column: row.get(column) for column in columns} for row in rows]
+    for i in range(0, len(rows), SEED_BATCH_SIZE):
+        db.session.execute(table.insert(), rows[i:i + SEED_BATCH_SIZE])
+
+
+# The seeded rows have explicit ids, so on PostgreSQL the sequences of these
+# tables have to continue after them
+def _reset_sequences(tables):
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        db.session.execute(
+            "SELECT setval(pg_get_serial_sequence('%s', 'id'), "
+            "coalesce(max(id), 0) + 1, false) FROM %s" % (table, table)
+        )
+
+
+# Fill the (empty) database with projects, each with subprojects which have
+# categories, payments and attachments, and an admin user. The data is the
+# same for the same random_seed. Returns the admin user.
+def seed(projects=10, subprojects=10, payments=1000, categories=5,
+         attachments=100, random_seed=0):
+    rng = random.Random(random_seed)
+    now = datetime.now(app.config['TZ'])
+
+    user = User(
+        email='benchmark@example.com',
+        first_name='Benchmark',
+        last_name='Gebruiker',
+        biography='Gebruiker voor de benchmarks',
+        admin=True
+    )
+    user.set_password(BENCHMARK_PASSWORD)
+    db.session.add(user)
+
+    subproject_id = 0
+    category_id = 0
+    payment_id = 0
+    file_id = 0
+    category_rows = []
+    payment_rows = []
+    file_rows = []
+    attachment_rows = []
+    for project_id in range(1, projects + 1):
+        project_iban = _iban(project_id)
+        db.session.add(
+            Project(
+                id=project_id,
+                name='Project %s' % project_id,
+                description='Een project met synthetische betalingen',
+                iban=project_iban,
+                iban_name='Project %s' % project_id,
+                contains_subprojects=subprojects > 0
+            )
+        )
+
+        for _ in range(subprojects):
+            subproject_id += 1
+            subproject_iban = _iban(100000 + subproject_id)
+            db.session.add(
+                Subproject(
+                    id=subproject_id,
+                    project_id=project_id,
+                    name='Initiatief %s' % subproject_id,
+                    description='Een initiatief met synthetische betalingen',
+                    iban=subproject_iban,
+                    iban_name='Initiatief %s' % subproject_id,
+                    budget=rng.choice([None, 1000, 5000, 25000])
+                )
+            )
+
+            subproject_category_ids = []
+            for i in range(categories):
+                category_id += 1
+                subproject_category_ids.append(category_id)
+                category_rows.append({
+                    'id': category_id,
+                    'subproject_id': subproject_id,
+                    'name': 'Categorie %s' % (i + 1)
+                })
+
+            # The project funds the subproject, which spends most of it
+            funding = Decimal(payments * 20)
+            for amount, alias_value, counterparty_alias_value, own in [
+                    (-funding, project_iban, subproject_iban, False),
+                    (funding, subproject_iban, project_iban, True)]:
+                payment_id += 1
+                payment_rows.append({
+                    'id': payment_id,
+                    'bank_payment_id': payment_id,
+                    'project_id': None if own else project_id,
+                    'subproject_id': subproject_id if own else None,
+                    'alias_value': alias_value,
+                    'counterparty_alias_value': counterparty_alias_value,
+                    'counterparty_alias_name': 'Project %s' % project_id,
+                    'amount_value': amount,
+                    'amount_currency': 'EUR',
+                    'created': now - timedelta(days=730),
+                    'description': 'Financiering',
+                    'hidden': False,
+                    'type': 'BUNQ',
+                    'route': 'subsidie'
+                })
+
+            subproject_payment_ids = []
+            for i in range(payments):
+                payment_id += 1
+                subproject_payment_ids.append(payment_id)
+                payment_rows.append({
+                    'id': payment_id,
+                    'bank_payment_id': payment_id,
+                    'subproject_id': subproject_id,
+                    'category_id': rng.choice(
+                        subproject_category_ids + [None]
+                    ),
+                    'alias_name': 'Initiatief %s' % subproject_id,
+                    'alias_value': subproject_iban,
+                    'counterparty_alias_name': 'Winkel %s' % rng.randint(
+                        1, 500
+                    ),
+                    'counterparty_alias_value': _iban(
+                        200000 + rng.randint(1, 500)
+                    ),
+                    'amount_value': Decimal(
+                        rng.randint(-25000, 2500)
+                    ) / 100,
+                    'amount_currency': 'EUR',
+                    'created': now - timedelta(
+                        minutes=rng.randint(0, 729 * 24 * 60)
+                    ),
+                    'description': 'Betaling %s' % payment_id,
+                    'short_user_description': 'Uitgave %s' % i,
+                    'hidden': rng.random() < 0.05,
+                    'type': rng.choice(['BUNQ', 'MASTERCARD', 'IDEAL']),
+                    'route': 'subsidie'
+                })
+
+            for i in range(attachments):
+                file_id += 1
+                image = i % 2 == 0
+                file_rows.append({
+                    'id': file_id,
+                    'filename': '%064x.%s' % (
+                        file_id, 'jpg' if image else 'pdf'
+                    ),
+                    'mimetype': 'image/jpeg' if image else 'application/pdf',
+                    'mediatype': 'media' if image else 'bon',
+                    'thumbnails': True if image else None
+                })
+                if subproject_payment_ids:
+                    attachment_rows.append({
+                        'payment_id': subproject_payment_ids[
+                            i % len(subproject_payment_ids)
+                        ],
+                        'file_id': file_id
+                    })
+
+    db.session.flush()
+    _insert(Category.__table__, category_rows)
+    _insert(Payment.__table__, payment_rows)
+    _insert(File.__table__, file_rows)
+    _insert(payment_attachment, attachment_rows)
+    _reset_sequences(['project', 'subproject', 'category', 'payment', 'file'])
+    db.session.commit()
+
+    totals.rebuild_totals()
+    return user
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context,
+                 executemany):
+        self.count += 1
+
+
+# Run function once to warm up and then the given number of rounds. Returns
+# the BenchmarkResult.
+def run_benchmark(name, function, rounds=10):
+    function()
+    db.session.remove()
+
+    durations = []
+    query_counter = _QueryCounter()
+    event.listen(db.engine, 'before_cursor_execute', query_counter)
+    try:
+        for _ in range(rounds):
+            start = perf_counter()
+            function()
+            durations.append(perf_counter() - start)
+            # Every round (like every request) starts with an empty session
+            db.session.remove()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', query_counter)
+
+    return BenchmarkResult(
+        name=name,
+        rounds=rounds,
+        min=min(durations),
+        max=max(durations),
+        mean=statistics.mean(durations),
+        stddev=statistics.stdev(durations) if rounds > 1 else 0,
+        median=statistics.median(durations),
+        queries=query_counter.count / rounds
+    )
+
+
+def _get(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(
+            'GET %s returned status %s' % (url, response.status_code)
+        )
+
+
+def _login(client):
+    response = client.post('/login', data={
+        'login_form-email': 'benchmark@example.com',
+        'login_form-Wachtwoord': BENCHMARK_PASSWORD
+    })
+    if response.status_code != 302 or not response.location.endswith('/'):
+        raise RuntimeError('Logging in failed')
+
+
+# Returns the (name, function) pairs of the benchmarks. The pages are
+# requested for the project and the subproject with the most payments.
+def get_benchmarks():
+    project_id = db.session.query(Subproject.project_id).join(
+        Payment, Payment.subproject_id == Subproject.id
+    ).group_by(
+        Subproject.project_id
+    ).order_by(
+        db.func.count().desc(), Subproject.project_id
+    ).limit(1).scalar()
+    subproject_id = db.session.query(Payment.subproject_id).filter(
+        Payment.subproject_id.isnot(None)
+    ).group_by(
+        Payment.subproject_id
+    ).order_by(
+        db.func.count().desc(), Payment.subproject_id
+    ).limit(1).scalar()
+    if subproject_id is None:
+        raise ValueError('The benchmarks need subprojects with payments')
+    subproject = Subproject.query.get(subproject_id)
+    subproject_iban = subproject.iban
+    project_url = '/project/%s' % project_id
+    subproject_url = '/project/%s/subproject/%s' % (
+        subproject.project_id, subproject.id
+    )
+    db.session.remove()
+
+    admin_client = app.test_client()
+    _login(admin_client)
+
+    # Every sync round saves a new page of payments like a Bunq sync does
+    bank_payment_ids = iter(range(
+        (db.session.query(db.func.max(Payment.bank_payment_id)).scalar() or 0)
+        + 1,
+        2 ** 31
+    ))
+
+    def save_payments_page():
+        util._save_payments(
+            [
+                {
+                    'bank_payment_id': next(bank_payment_ids),
+                    'alias_value': subproject_iban,
+                    'counterparty_alias_value': _iban(300000),
+                    'amount_value': '-12.50',
+                    'amount_currency': 'EUR',
+                    'created': datetime.now(app.config['TZ']),
+                    'type': 'BUNQ'
+                }
+                for _ in range(util.BUNQ_PAYMENTS_PAGE_SIZE)
+            ],
+            util._get_iban_map()
+        )
+
+    return [
+        ('index', lambda: _get(app.test_client(), '/')),
+        ('project', lambda: _get(app.test_client(), project_url)),
+        ('subproject', lambda: _get(app.test_client(), subproject_url)),
+        ('project (admin)', lambda: _get(admin_client, project_url)),
+        ('subproject (admin)', lambda: _get(admin_client, subproject_url)),
+        ('login', lambda: _login(app.test_client())),
+        ('sync: save payments page', save_payments_page),
+        (
+            'aggregation: projects sums',
+            lambda: aggregation.calculate_projects_sums(Project.query.all())
+        ),
+        (
+            'aggregation: refresh project totals',
+            lambda: totals.refresh_project_totals([project_id])
+        ),
+        ('aggregation: rebuild totals', totals.rebuild_totals)
+    ]
+
+
+# Returns the BenchmarkResults of all benchmarks, or only those whose name
+# contains one of names
+def run_benchmarks(rounds=10, names=None):
+    results = []
+    for name, function in get_benchmarks():
+        if names and not any(n in name for n in names):
+            continue
+        results.append(run_benchmark(name, function, rounds))
+    return results
+
+
+# Returns the results as a table in the style of pytest-benchmark, with the
+# times in milliseconds
+def format_results(results):
+    headers = [
+        'Name (time in ms)', 'Min', 'Max', 'Mean', 'StdDev', 'Median',
+        'Rounds', 'Queries'
+    ]
+    rows = [
+        [result.name] + [
+            '%.2f' % (getattr(result, field) * 1000)
+            for field in ['min', 'max', 'mean', 'stddev', 'median']
+        ] + [str(result.rounds), '%g' % result.queries]
+        for result in results
+    ]
+    widths = [
+        max(len(row[i]) for row in [headers] + rows)
+        for i in range(len(headers))
+    ]
+
+    lines = [
+        '  '.join(
+            value.ljust(width) if i == 0 else value.rjust(width)
+            for i, (value, width) in enumerate(zip(row, widths))
+        )
+        for row in [headers] + rows
+    ]
+    separator = '-' * len(lines[0])
+    return '\n'.join([separator, lines[0], separator] + lines[1:] + [separator])
+
+
+# Create the tables in database_uri, fill them using seed_options (see
+# seed), run the benchmarks and remove the tables again. Returns the
+# BenchmarkResults. The page cache is disabled and CSRF checks are turned
+# off (for logging in) while the benchmarks run. The cache generation is
+# kept in a temporary directory, so the benchmarks don't invalidate the page
+# cache of the app.
+def run(database_uri, seed_options, rounds=10, names=None):
+    overrides = {
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'PAGE_CACHE_DIR': mkdtemp(),
+        'PAGE_CACHE_TIMEOUT': 0,
+        'WTF_CSRF_ENABLED': False
+    }
+    original_config = {
+        key: app.config[key] for key in overrides if key in app.config
+    }
+    app.config.update(overrides)
+    try:
+        db.create_all()
+        try:
+            seed(**seed_options)
+            return run_benchmarks(rounds, names)
+        finally:
+            db.session.remove()
+            db.drop_all()
+    finally:
+        for key in overrides:
+            app.config.pop(key, None)
+        app.config.update(original_config)
+        shutil.rmtree(overrides['PAGE_CACHE_DIR'], ignore_errors=True)
@@ -0,0 +1,146 @@
+from base64 import b64decode
+import hashlib
+import hmac
+import json
+
+from Cryptodome.Hash import SHA256
+from Cryptodome.Signature import pkcs1_15
+from bunq.sdk.model.generated import endpoint
+from bunq.sdk.model.generated.object_ import NotificationFilterUrl
+from flask import url_for
+
+from app import app, bunq_contexts, totals, util
+
+
+# Bunq can send a callback (a 'notification') to a URL for every mutation on
+# a monetary account. Instead of waiting for the next periodic sync, the
+# payment in such a callback is queued right away and saved by a job worker
+# (see jobs.py) using the same transform as the payments retrieved via
+# util.get_new_payments. The callback request itself doesn't contact Bunq or
+# write payments, so Bunq gets its response immediately.
+#
+# Each project gets its own callback URL which contains a secret token, so
+# only Bunq (which received the URL from us) knows it. On top of that Bunq
+# signs each callback with its server key, which is checked against the
+# server public key stored in the API context of the project.
+
+
+NOTIFICATION_CATEGORY_MUTATION = 'MUTATION'
+
+# Header containing the base64 encoded signature of the callback body
+SERVER_SIGNATURE_HEADER = 'X-Bunq-Server-Signature'
+
+
+# Returns the secret token used in the callback URL of a project
+def get_callback_token(project_id):
+    return hmac.new(
+        app.config['SECRET_KEY'].encode('utf-8'),
+        ('bunq-callback-%s' % project_id).encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def get_callback_url(project_id):
+    return url_for(
+        'bunq_callback',
+        project_id=project_id,
+        token=get_callback_token(project_id),
+        _external=True,
+        _scheme='https'
+    )
+
+
+def is_valid_callback_token(project_id, token):
+    return hmac.compare_digest(get_callback_token(project_id), token)
+
+
+# Check that the callback body was signed by Bunq
+def is_valid_signature(project_id, body, signature):
+    if not signature:
+        return False
+
+    public_key_server = bunq_contexts.get_server_public_key(project_id)
+    if public_key_server is None:
+        return False
+
+    # pkcs1_15 raises a ValueError for an invalid signature (unlike the
+    # legacy PKCS1_v1_5 module, whose verify returns False)
+    try:
+        pkcs1_15.new(public_key_server).verify(
+            SHA256.new(body), b64decode(signature)
+        )
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+# Returns the JSON of the payment contained in a Bunq MUTATION callback, or
+# None if the callback doesn't contain a payment
+def get_callback_payment(body):
+    try:
+        notification = json.loads(body).get('NotificationUrl', {})
+    except (ValueError, AttributeError):
+        return None
+    if notification.get('category') != NOTIFICATION_CATEGORY_MUTATION:
+        return None
+
+    return notification.get('object', {}).get('Payment') or None
+
+
+# Save the payment of a Bunq callback (see get_callback_payment). Returns the
+# number of saved payments (0 if the payment was already saved).
+#
+# The sync state of the monetary account is deliberately left alone: a
+# callback can arrive while earlier callbacks were missed, so the next
+# periodic sync still checks for payments newer than the last synced one.
+def save_callback_payment(project_id, payment_json):
+    payment = endpoint.Payment.from_json(json.dumps(payment_json))
+    inserted_count, changed_project_ids = util._save_payments(
+        [util._transform_payment(payment)], util._get_iban_map()
+    )
+    totals.refresh_project_totals(changed_project_ids)
+
+    app.logger.info(
+        'Project %s: saved %s payments from a Bunq callback' % (
+            project_id, inserted_count
+        )
+    )
+    return inserted_count
+
+
+# Make Bunq send a callback for every mutation on each active monetary
+# account of the project. Other callbacks set on these monetary accounts are
+# kept. Returns the number of monetary accounts the callback was set on.
+#
+# BunqLib.add_callback_url sets the callback on the user instead, which isn't
+# possible with the OAuth access tokens used for projects.
+def register_callbacks(project_id):
+    callback_url = get_callback_url(project_id)
+
+    monetary_accounts_count = 0
+    for monetary_account in util.get_all_monetary_account_active(project_id):
+        notification_filters = [
+            NotificationFilterUrl(
+                notification_filter.category,
+                notification_filter.notification_target
+            )
+            for notification_filter in util.call_bunq(
+                project_id,
+                endpoint.NotificationFilterUrlMonetaryAccount.list,
+                monetary_account_id=monetary_account._id_
+            ).value
+            if notification_filter.notification_target != callback_url
+        ]
+        notification_filters.append(
+            NotificationFilterUrl(NOTIFICATION_CATEGORY_MUTATION, callback_url)
+        )
+
+        util.call_bunq(
+            project_id,
+            endpoint.NotificationFilterUrlMonetaryAccount.create,
+            monetary_account_id=monetary_account._id_,
+            notification_filters=notification_filters
+        )
+        monetary_accounts_count += 1
+
+    return monetary_accounts_count
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+from os.path import exists
+from threading import Lock
+from uuid import uuid4
+import os
+
+from bunq.sdk.context.bunq_context import ApiContext, BunqContext
+
+from app import app, util
+
+
+# Process wide cache of restored Bunq API contexts, one per project. Before,
+# every Bunq call constructed a BunqLib, which restores the API context from
+# its .conf file, checks the session, saves the .conf file again and
+# retrieves the current user before doing anything useful. Now the restored
+# API contexts are kept in memory and their session is only reset (and the
+# .conf file only written) when it is about to expire.
+#
+# _lock only guards the cache itself and is never held while talking to
+# Bunq. Sessions are reset while holding the lock of their .conf file, so a
+# rate limit backoff for one project doesn't hold up the other projects. The
+# .conf file is replaced atomically, as other processes (uWSGI workers, the
+# job worker and the sync pool) may refresh the same file at the same time.
+
+
+# Reset a session when it expires within this many seconds
+SESSION_REFRESH_MARGIN = 300
+
+_api_contexts = {}
+_lock = Lock()
+# One lock per .conf file, held while resetting its session
+_file_locks = {}
+# Held while loading an API context into the Bunq SDK
+_load_lock = Lock()
+# The project whose API context is currently loaded in the (process global)
+# BunqContext of the Bunq SDK
+_loaded_project_id = None
+
+
+def _get_filename(project_id):
+    return util.get_bunq_api_config_filename(
+        app.config['BUNQ_ENVIRONMENT_TYPE'], project_id
+    )
+
+
+def _get_file_lock(filename):
+    with _lock:
+        return _file_locks.setdefault(filename, Lock())
+
+
+# Write the API context to filename via a temporary file, so the .conf file
+# is never read half written
+def _save_api_context(api_context, filename):
+    temp_filename = '%s.%s' % (filename, uuid4().hex)
+    try:
+        api_context.save(temp_filename)
+        os.replace(temp_filename, filename)
+    finally:
+        if exists(temp_filename):
+            os.remove(temp_filename)
+
+
+def _session_expires_soon(api_context):
+    if api_context.session_context is None:
+        return True
+    time_to_expiry = api_context.session_context.expiry_time - datetime.now()
+    return time_to_expiry < timedelta(seconds=SESSION_REFRESH_MARGIN)
+
+
+# Returns the cached API context of the given project without checking its
+# session, restoring it from the .conf file if needed. Returns None if the
+# project has no Bunq API .conf file.
+def _get_cached_api_context(project_id):
+    filename = _get_filename(project_id)
+    with _lock:
+        api_context = _api_contexts.get(project_id)
+        if api_context is None:
+            if not exists(filename):
+                return None
+            api_context = ApiContext.restore(filename)
+            _api_contexts[project_id] = api_context
+    return api_context
+
+
+# Returns the API context of the given project with an active session, or
+# None if the project has no Bunq API .conf file
+def get_api_context(project_id):
+    project_id = int(project_id)
+    api_context = _get_cached_api_context(project_id)
+    if api_context is None:
+        return None
+
+    filename = _get_filename(project_id)
+    with _get_file_lock(filename):
+        # Another thread may have reset the session while this one waited
+        if _session_expires_soon(api_context):
+            util.call_bunq(project_id, api_context.reset_session)
+            _save_api_context(api_context, filename)
+
+    return api_context
+
+
+# Returns the public key Bunq signs its responses and callbacks of the given
+# project with, or None if the project has no Bunq API .conf file. The key
+# is part of the installation, so unlike get_api_context this never needs to
+# contact Bunq.
+def get_server_public_key(project_id):
+    api_context = _get_cached_api_context(int(project_id))
+    if api_context is None:
+        return None
+    return api_context.installation_context.public_key_server
+
+
+# Make the Bunq SDK use the API context of the given project for the
+# following calls. Returns False if the project has no Bunq API .conf file.
+def load_api_context(project_id):
+    global _loaded_project_id
+
+    project_id = int(project_id)
+    api_context = get_api_context(project_id)
+    if api_context is None:
+        return False
+
+    # Loading the API context into the SDK also retrieves the user, so skip it
+    # if the SDK already uses this API context
+    with _load_lock:
+        if (_loaded_project_id != project_id
+                or BunqContext.api_context() is not api_context):
+            util.call_bunq(
+                project_id, BunqContext.load_api_context, api_context
+            )
+            _loaded_project_id = project_id
+
+    return True
+
+
+# Remove the cached API context of the given project, e.g., after its .conf
+# file is recreated
+def invalidate(project_id):
+    global _loaded_project_id
+
+    project_id = int(project_id)
+    with _lock:
+        _api_contexts.pop(project_id, None)
+    with _load_lock:
+        if _loaded_project_id == project_id:
+            _loaded_project_id = None
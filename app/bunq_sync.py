@@ -0,0 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import monotonic
+import multiprocessing
+
+from app import app, db, util
+
+
+# Retrieving new payments from Bunq for many projects one after the other
+# takes the sum of the time needed for each project, mostly spent waiting on
+# the Bunq rate limits. These limits apply per API context (i.e., per
+# project), so the projects are synced concurrently instead. A pool of
+# processes is used instead of threads, because the Bunq SDK stores the
+# active API context globally per process.
+
+
+# Sync a single project. Returns the number of seconds it took and the
+# counters of the Bunq rate limiter of the project.
+def _sync_project(project_id):
+    start = monotonic()
+    with app.app_context():
+        try:
+            util.get_new_payments(project_id)
+        finally:
+            db.session.remove()
+    return (
+        monotonic() - start,
+        util.get_bunq_rate_limiter(project_id).stats()
+    )
+
+
+# Retrieve new payments for all given projects using 'workers' concurrent
+# processes. Returns a dict of project_id -> (seconds it took to sync the
+# project, rate limiter counters), or None if syncing the project failed.
+def sync_projects(project_ids, workers=None):
+    if workers is None:
+        workers = app.config.get('BUNQ_SYNC_WORKERS', 4)
+
+    results = {}
+    if workers <= 1:
+        for project_id in project_ids:
+            results[project_id] = _sync_project(project_id)
+        return results
+
+    # Database connections can't be shared with the worker processes, so
+    # make sure they each open their own
+    db.session.remove()
+    db.engine.dispose()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('fork')
+    ) as executor:
+        futures = {
+            executor.submit(_sync_project, project_id): project_id
+            for project_id in project_ids
+        }
+        for future in as_completed(futures):
+            project_id = futures[future]
+            try:
+                results[project_id] = future.result()
+            except Exception as e:
+                app.logger.error(
+                    'Syncing project %s resulted in an exception:\n%s' % (
+                        project_id, repr(e)
+                    )
+                )
+                results[project_id] = None
+
+    return results
+
+
+# Returns the sum of the rate limiter counters of the given sync results
+def sum_stats(results):
+    stats = {
+        'requests': 0,
+        'throttled': 0,
+        'wait_time': 0,
+        'backoff_time': 0,
+        'throttled_time': 0
+    }
+    for result in results.values():
+        if result is None:
+            continue
+        for key, value in result[1].items():
+            stats[key] += value
+    return stats
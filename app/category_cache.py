@@ -0,0 +1,101 @@
+from threading import Lock
+from time import monotonic
+
+from flask import g, has_app_context
+
+from app import app, page_data
+
+
+# Cache of category select options (see Project.make_category_select_options)
+# keyed by (project_id, subproject_id), where subproject_id is None for the
+# categories of a project itself. Building the payment forms of a page needs
+# the options for every payment, but only a couple of distinct keys exist.
+#
+# Options are always cached for the current request (in flask.g). If
+# CATEGORY_CACHE_TIMEOUT is set they are also cached in the process for that
+# many seconds. Edits via process_category_form invalidate the cache of the
+# process handling the edit, but other (uWSGI) processes might show the old
+# options until their entries expire, which is why it is disabled by default.
+
+
+_process_cache = {}
+_process_cache_lock = Lock()
+
+
+def _request_cache():
+    if not has_app_context():
+        return {}
+    if 'category_select_options' not in g:
+        g.category_select_options = {}
+    return g.category_select_options
+
+
+def _get_cached(key):
+    request_cache = _request_cache()
+    if key in request_cache:
+        return request_cache[key]
+
+    with _process_cache_lock:
+        expires, select_options = _process_cache.get(key, (0, None))
+    if expires > monotonic():
+        request_cache[key] = select_options
+        return select_options
+
+    return None
+
+
+def _set_cached(key, select_options):
+    _request_cache()[key] = select_options
+
+    timeout = app.config.get('CATEGORY_CACHE_TIMEOUT', 0)
+    if timeout:
+        with _process_cache_lock:
+            _process_cache[key] = (monotonic() + timeout, select_options)
+
+
+# Returns the category select options of a project and of the given
+# subprojects as a dict keyed by (project_id, subproject_id). Missing options
+# are loaded with a single query.
+def get_all_category_select_options(project_id, subproject_ids):
+    keys = [(project_id, None)] + [
+        (project_id, subproject_id) for subproject_id in subproject_ids
+    ]
+
+    all_select_options = {key: _get_cached(key) for key in keys}
+    if any(
+            select_options is None
+            for select_options in all_select_options.values()):
+        all_select_options = page_data.load_category_select_options(
+            project_id, subproject_ids
+        )
+        for key, select_options in all_select_options.items():
+            _set_cached(key, select_options)
+
+    return all_select_options
+
+
+# Returns the category select options of a project (if subproject_id is
+# None) or of one of its subprojects
+def get_category_select_options(project_id, subproject_id=None):
+    if project_id is None:
+        return [('', '')]
+
+    key = (project_id, subproject_id)
+    select_options = _get_cached(key)
+    if select_options is None:
+        subproject_ids = []
+        if subproject_id is not None:
+            subproject_ids = [subproject_id]
+        select_options = get_all_category_select_options(
+            project_id, subproject_ids
+        )[key]
+    return select_options
+
+
+# Remove the cached options of a project or subproject after its categories
+# changed
+def invalidate(project_id, subproject_id=None):
+    key = (project_id, subproject_id)
+    _request_cache().pop(key, None)
+    with _process_cache_lock:
+        _process_cache.pop(key, None)
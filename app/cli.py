@@ -5,6 +5,7 @@ from flask import url_for
 from os import urandom
 from os.path import abspath, join, dirname
 from pprint import pprint
+from time import time
 import click
 import json
 import sys
@@ -15,7 +16,10 @@ from bunq.sdk.context.api_environment_type import ApiEnvironmentType
 from libs.bunq_lib import BunqLib
 from libs.share_lib import ShareLib
 
-from app import util
+from app import (
+    benchmark, bunq_callbacks, bunq_sync, jobs, page_cache, query_plans,
+    totals, util
+)
 
 
 # Bunq commands
@@ -33,13 +37,95 @@ def bunq():
 def get_new_payments_project(project_id):
     """Get new payments from all IBANs belonging to one Bunq account"""
     util.get_new_payments(project_id)
+    stats = util.get_bunq_rate_limiter(project_id).stats()
+    app.logger.info(
+        'Project %s: %s Bunq requests, %s throttled by Bunq, %.1f seconds '
+        'spent waiting on rate limits' % (
+            project_id,
+            stats['requests'],
+            stats['throttled'],
+            stats['throttled_time']
+        )
+    )
 
 
 @bunq.command()
-def get_new_payments_all():
+@click.option(
+    '-w', '--workers', type=int,
+    help='Number of projects to sync concurrently (default: BUNQ_SYNC_WORKERS)'
+)
+def get_new_payments_all(workers):
     """Get all payments from all IBANs belonging to all projects"""
+    start = time()
+    results = bunq_sync.sync_projects(
+        [project.id for project in Project.query.all()],
+        workers
+    )
+    durations = [r[0] for r in results.values() if r is not None]
+    stats = bunq_sync.sum_stats(results)
+    app.logger.info(
+        'Synced %s projects in %.1f seconds (slowest project took %.1f '
+        'seconds); %s Bunq requests, %s throttled by Bunq, %.1f seconds '
+        'spent waiting on rate limits' % (
+            len(results),
+            time() - start,
+            max(durations or [0]),
+            stats['requests'],
+            stats['throttled'],
+            stats['throttled_time']
+        )
+    )
+
+
+@bunq.command()
+@click.argument('project_id')
+def reset_sync_state(project_id):
+    """Retrieve the whole payment history of a project again on the next sync"""
+    util.reset_sync_state(project_id)
+    print('Reset the sync state of project %s' % (project_id))
+
+
+@bunq.command()
+@click.argument('project_id')
+def register_callbacks_project(project_id):
+    """Let Bunq send new payments of a project to Open Poen right away"""
+    monetary_accounts_count = bunq_callbacks.register_callbacks(project_id)
+    print(
+        'Registered callbacks for %s monetary accounts of project %s' % (
+            monetary_accounts_count, project_id
+        )
+    )
+
+
+@bunq.command()
+def register_callbacks_all():
+    """Let Bunq send new payments of all projects to Open Poen right away"""
     for project in Project.query.all():
-        util.get_new_payments(project.id)
+        if not project.bunq_access_token:
+            continue
+        try:
+            monetary_accounts_count = bunq_callbacks.register_callbacks(
+                project.id
+            )
+        except Exception as e:
+            app.logger.error(
+                'Project %s: registering Bunq callbacks resulted in an '
+                'exception:\n%s' % (project.id, repr(e))
+            )
+            continue
+        print(
+            'Registered callbacks for %s monetary accounts of project "%s"' % (
+                monetary_accounts_count, project.name
+            )
+        )
+
+
+@bunq.command()
+@click.argument('project_id')
+def enqueue_get_new_payments_project(project_id):
+    """Let a worker get the new payments of a project in the background"""
+    job = jobs.enqueue(jobs.JOB_GET_NEW_PAYMENTS, int(project_id))
+    print('Queued job %s' % (job.id))
 
 
 @bunq.command()
@@ -126,6 +212,81 @@ def show_all_payments():
         pprint(vars(payment))
 
 
+@database.command()
+def rebuild_totals():
+    """
+    Remove and recalculate the stored amounts awarded and spent of all
+    projects and subprojects and verify them against the live calculation
+    """
+    totals.rebuild_totals()
+    print('Rebuilt the totals of all projects and subprojects')
+    _print_totals_differences()
+
+
+@database.command()
+def verify_totals():
+    """
+    Verify the stored amounts awarded and spent of all projects and
+    subprojects against the live calculation
+    """
+    _print_totals_differences()
+
+
+def _print_totals_differences():
+    differences = totals.verify_totals()
+    for difference in differences:
+        print(difference)
+    if differences:
+        print(
+            'Found %s differences, run "flask database rebuild-totals" to '
+            'fix them' % (len(differences))
+        )
+    else:
+        print('All stored totals match the live calculation')
+
+
+@database.command()
+def clear_page_cache():
+    """
+    Make all cached pages stale, e.g., after changing the database manually
+    """
+    page_cache.invalidate()
+    print('Cleared the page cache')
+
+
+@database.command()
+@click.option(
+    '--disable-seqscan', is_flag=True,
+    help='Let PostgreSQL avoid sequential scans, e.g., for a small database'
+)
+@click.option('-v', '--verbose', is_flag=True, help='Show all query plans')
+def check_query_plans(disable_seqscan, verbose):
+    """
+    Check that the payment queries of the project and subproject pages use
+    the payment indexes; exits with status 1 if one of them doesn't
+    """
+    results = query_plans.check_query_plans(disable_seqscan)
+    failed = 0
+    for description, plan, indexes, uses_index in results:
+        if uses_index:
+            print('OK   %s' % (description))
+        else:
+            failed += 1
+            print(
+                'FAIL %s does not use %s' % (description, ' or '.join(indexes))
+            )
+        if verbose or not uses_index:
+            print('     ' + plan.replace('\n', '\n     '))
+
+    if not results:
+        print('There are no payments to check the queries of')
+    elif failed:
+        print('%s of %s queries do not use an index' % (failed, len(results)))
+        sys.exit(1)
+    else:
+        print('All %s queries use an index' % (len(results)))
+
+
 @database.command()
 @click.option('-e', '--email', required=True)
 @click.option('-a', '--admin', is_flag=True)
@@ -161,3 +322,88 @@ def create_user_invite_link(email):
             url_for('reset_wachtwoord', token=token, _external=True)
         )
     )
+
+
+# Job queue commands
+@app.cli.group('jobs')
+def jobs_group():
+    """Background job related commands"""
+    pass
+
+
+@jobs_group.command()
+@click.option(
+    '-i', '--poll-interval', type=int, default=5,
+    help='Seconds to wait before checking an empty queue again'
+)
+def worker(poll_interval):
+    """Keep running queued jobs (e.g., initial Bunq imports)"""
+    app.logger.info('Job worker started')
+    jobs.work(poll_interval)
+
+
+@jobs_group.command()
+def run_pending():
+    """Run all queued jobs and stop once the queue is empty"""
+    jobs_count = jobs.run_pending_jobs()
+    print('Ran %s jobs' % (jobs_count))
+
+
+# Benchmark commands
+@app.cli.group('benchmark')
+def benchmark_group():
+    """Performance benchmark related commands"""
+    pass
+
+
+@benchmark_group.command()
+@click.option(
+    '-d', '--database-uri', default='sqlite://',
+    help='Database to run the benchmarks in, which must not be the database '
+    'of the app as its tables are removed afterwards (default: an in-memory '
+    'SQLite database)'
+)
+@click.option('--projects', type=int, default=10, help='Number of projects')
+@click.option(
+    '--subprojects', type=int, default=10, help='Subprojects per project'
+)
+@click.option(
+    '--payments', type=int, default=1000, help='Payments per subproject'
+)
+@click.option(
+    '--categories', type=int, default=5, help='Categories per subproject'
+)
+@click.option(
+    '--attachments', type=int, default=100, help='Attachments per subproject'
+)
+@click.option(
+    '-r', '--rounds', type=int, default=10,
+    help='Number of times each benchmark is run'
+)
+@click.option(
+    '-k', '--name', 'names', multiple=True,
+    help='Only run the benchmarks whose name contains this'
+)
+def run(database_uri, projects, subprojects, payments, categories,
+        attachments, rounds, names):
+    """
+    Fill a separate database with synthetic projects and payments and time
+    the pages and the sync and aggregation functions
+    """
+    if database_uri == app.config['SQLALCHEMY_DATABASE_URI']:
+        print('Use a separate database for the benchmarks')
+        sys.exit(1)
+
+    results = benchmark.run(
+        database_uri,
+        {
+            'projects': projects,
+            'subprojects': subprojects,
+            'payments': payments,
+            'categories': categories,
+            'attachments': attachments
+        },
+        rounds,
+        names
+    )
+    print(benchmark.format_results(results))
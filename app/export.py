@@ -0,0 +1,167 @@
+from datetime import datetime
+from decimal import Decimal
+from tempfile import TemporaryFile
+import csv
+import json
+
+from flask import Response, stream_with_context
+from werkzeug.utils import secure_filename
+import xlsxwriter
+
+from app import app, payment_table
+from app.models import Category, Payment, Subproject
+
+
+# Exports of the payments of a project or subproject. Payments are read from
+# the database in batches (using a server-side cursor on PostgreSQL) and
+# written to the response while they are read, so the memory used doesn't
+# depend on the number of payments. Only XLSX files need to be written
+# completely before they can be sent, which is done in a temporary file.
+
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'xlsx': (
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+}
+
+# Number of payments fetched from the database at a time
+EXPORT_BATCH_SIZE = 1000
+# Number of bytes of an XLSX file sent at a time
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+# Returns the (header, column) pairs of the export; the same columns the
+# payment table shows or used to export
+def _get_columns(show_subproject):
+    columns = [('id', Payment.id)]
+    if show_subproject:
+        columns.append(('initiatief', Subproject.name))
+    return columns + [
+        ('bedrag €', Payment.amount_value),
+        ('ontvanger', Payment.counterparty_alias_name),
+        ('initiatiefnemer', Payment.alias_name),
+        ('omschrijving', Payment.short_user_description),
+        ('datum', Payment.created),
+        ('betaalomschrijving', Payment.description),
+        ('lange omschrijving', Payment.long_user_description),
+        ('saldo na boeking €', Payment.balance_after_mutation_value),
+        ('categorie', Category.name)
+    ]
+
+
+def _localize(value):
+    if isinstance(value, datetime) and value.tzinfo:
+        return value.astimezone(app.config['TZ'])
+    return value
+
+
+# Yields the rows of the export. Only the exported columns are selected, so
+# no Payment objects are created and kept in the session. yield_per also
+# makes psycopg2 use a server-side cursor.
+def _iter_rows(payments_query, table_args, columns):
+    query = payments_query.with_entities(
+        *[column for _, column in columns]
+    ).order_by(
+        *payment_table.get_order_by(table_args)
+    ).yield_per(EXPORT_BATCH_SIZE)
+
+    for row in query:
+        yield [_localize(value) for value in row]
+
+
+# File-like object which returns what is written to it, so csv.writer can
+# be used to format single rows
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _generate_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Amounts are exact decimals, which JSON writes as numbers
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def _generate_json(headers, rows):
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(
+            dict(zip(headers, row)), default=_json_default
+        )
+        separator = ','
+    yield ']'
+
+
+def _generate_xlsx(headers, rows):
+    with TemporaryFile() as xlsx_file:
+        # In constant_memory mode each row is written to disk as soon as the
+        # next row is started
+        workbook = xlsxwriter.Workbook(
+            xlsx_file,
+            {
+                'constant_memory': True,
+                'remove_timezone': True,
+                'default_date_format': 'dd-mm-yyyy hh:mm'
+            }
+        )
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, headers)
+        for row_number, row in enumerate(rows, 1):
+            worksheet.write_row(row_number, 0, row)
+        workbook.close()
+
+        xlsx_file.seek(0)
+        for chunk in iter(lambda: xlsx_file.read(EXPORT_CHUNK_SIZE), b''):
+            yield chunk
+
+
+_generators = {
+    'csv': _generate_csv,
+    'json': _generate_json,
+    'xlsx': _generate_xlsx
+}
+
+
+# Returns a streamed response containing the payments of payments_query,
+# filtered and sorted like the payment table (see
+# payment_table.parse_table_args), in the given export format
+def export_payments(payments_query, table_args, show_subproject,
+                    export_format, filename):
+    columns = _get_columns(show_subproject)
+    rows = _iter_rows(
+        payment_table.filter_payments(payments_query, table_args),
+        table_args,
+        columns
+    )
+
+    response = Response(
+        stream_with_context(
+            _generators[export_format](
+                [header for header, _ in columns], rows
+            )
+        ),
+        mimetype=EXPORT_MIMETYPES[export_format]
+    )
+    # Let nginx pass the rows on as they are generated instead of buffering
+    # the response
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Content-Disposition'] = (
+        'attachment; filename="%s"' % secure_filename(
+            '%s.%s' % (filename, export_format)
+        )
+    )
+    return response
@@ -1,10 +1,11 @@
 from datetime import datetime
 from flask import flash, redirect, url_for
 from sqlalchemy.exc import IntegrityError
-from werkzeug.utils import secure_filename
 import os
 
-from app import app, db
+from app import (
+    app, db, category_cache, jobs, page_data, thumbnails, totals, uploads
+)
 from app.forms import CategoryForm, PaymentForm, EditAttachmentForm
 from app.models import Category, Payment, File, User
 from app.util import flash_form_errors
@@ -43,6 +44,7 @@ def process_category_form(request):
     if category_form.remove.data:
         Category.query.filter_by(id=category_form.id.data).delete()
         db.session.commit()
+        category_cache.invalidate(project_id, subproject_id or None)
         flash(
             '<span class="text-default-green">Categorie "%s" is verwijderd</span>' % (
                 category_form.name.data
@@ -86,6 +88,8 @@ def process_category_form(request):
                     'andere naam<span>'
                 )
 
+        category_cache.invalidate(project_id, subproject_id or None)
+
         # Redirect back to clear form data
         return return_redirect(project_id, subproject_id)
     else:
@@ -104,10 +108,11 @@ def process_payment_form(request, project_or_subproject, project_owner, user_sub
         id=payment_form.id.data
     ).first()
     if temppayment:
-        if temppayment.subproject:
-            payment_form.category_id.choices = temppayment.subproject.make_category_select_options()
-        else:
-            payment_form.category_id.choices = temppayment.project.make_category_select_options()
+        payment_form.category_id.choices = (
+            category_cache.get_category_select_options(
+                *page_data.get_payment_category_key(temppayment)
+            )
+        )
 
         # Make sure the user is allowed to edit this payment
         # (especially needed when a normal users edits a subproject
@@ -132,8 +137,10 @@ def process_payment_form(request, project_or_subproject, project_owner, user_sub
     if payment_form.validate_on_submit():
         # Remove payment
         if payment_form.remove.data:
+            project_ids = totals.get_payment_project_ids([temppayment])
             Payment.query.filter_by(id=payment_form.id.data).delete()
             db.session.commit()
+            totals.refresh_project_totals(project_ids)
             flash(
                 '<span class="text-default-green">Transactie is verwijderd</span>'
             )
@@ -203,15 +210,26 @@ def process_payment_form(request, project_or_subproject, project_owner, user_sub
         flash_form_errors(payment_form, request)
 
 
-# Populate the payment forms which allows the user to edit it
+# Building a form for every payment makes pages of large projects slow, so
+# if there are more than LAZY_PAYMENT_FORMS_THRESHOLD editable payments the
+# forms are loaded one at a time when a payment is opened (0 disables this)
+def use_lazy_payment_forms(editable_payments_count):
+    threshold = app.config.get('LAZY_PAYMENT_FORMS_THRESHOLD', 0)
+    return bool(threshold) and editable_payments_count > threshold
+
+
+# Populate the payment forms which allows the user to edit it. The category
+# select options come from the category cache, so call
+# category_cache.get_all_category_select_options first to load the options
+# of all (sub)projects of the payments in one query.
 def create_payment_forms(payments, project_owner):
     payment_forms = {}
     for payment in payments:
-        # If a payment already contains a category, retrieve it to set
-        # this category as the selected category in the drop-down menu
+        # If a payment already contains a category, set this category as the
+        # selected category in the drop-down menu
         selected_category = ''
-        if payment.category:
-            selected_category = payment.category.id
+        if payment.category_id:
+            selected_category = payment.category_id
         payment_form = PaymentForm(prefix='payment_form', **{
             'short_user_description': payment.short_user_description,
             'long_user_description': payment.long_user_description,
@@ -228,12 +246,12 @@ def create_payment_forms(payments, project_owner):
 
         # A project with subprojects can contain multiple editable
         # payments on the project page, so we need to retrieve the
-        # categories for each payment (could be made more efficient,
-        # but this is readable)
-        if payment.subproject:
-            payment_form.category_id.choices = payment.subproject.make_category_select_options()
-        else:
-            payment_form.category_id.choices = payment.project.make_category_select_options()
+        # categories for each payment
+        payment_form.category_id.choices = (
+            category_cache.get_category_select_options(
+                *page_data.get_payment_category_key(payment)
+            )
+        )
 
         payment_form.route.choices = [
             ('subsidie', 'subsidie'),
@@ -256,23 +274,21 @@ def create_payment_forms(payments, project_owner):
 
 # Save attachment to disk
 def save_attachment(f, mediatype, db_object, folder):
-    filename = secure_filename(f.filename)
-    filename = '%s_%s' % (
-        datetime.now(app.config['TZ']).isoformat()[:19], filename
-    )
-    filepath = os.path.join(
-        os.path.abspath(
-            os.path.join(
-                app.instance_path, '../%s/%s' % (
-                    app.config['UPLOAD_FOLDER'],
-                    folder
-                )
-            )
-        ),
-        filename
+    filename, sha256, created = uploads.save_upload(f, folder)
+
+    # Don't attach the same file to a payment twice
+    if isinstance(db_object, Payment):
+        if db_object.attachments.filter_by(sha256=sha256).first():
+            return
+
+    # Files with the same content get their own row (so they can be edited
+    # and removed separately) but share the file on disk
+    new_file = File(
+        filename=filename,
+        mimetype=f.headers[1][1],
+        mediatype=mediatype,
+        sha256=sha256
     )
-    f.save(filepath)
-    new_file = File(filename=filename, mimetype=f.headers[1][1], mediatype=mediatype)
     db.session.add(new_file)
     db.session.commit()
 
@@ -286,6 +302,13 @@ def save_attachment(f, mediatype, db_object, folder):
         db_object.attachments.append(new_file)
         db.session.commit()
 
+    # Create the thumbnails shown on the pages in the background (files
+    # which were saved before already have them)
+    if created and new_file.mimetype in thumbnails.IMAGE_MIMETYPES:
+        jobs.enqueue(
+            jobs.JOB_CREATE_THUMBNAILS, file_id=new_file.id, folder=folder
+        )
+
 
 # Process filled in transaction attachment form
 def process_transaction_attachment_form(request, transaction_attachment_form, project_owner, user_subproject_ids, project_id=0, subproject_id=0):
@@ -299,7 +322,7 @@ def process_transaction_attachment_form(request, transaction_attachment_form, pr
         if not project_owner and not payment.subproject.id in user_subproject_ids:
             return
 
-        save_attachment(transaction_attachment_form.data_file.data, transaction_attachment_form.mediatype.data, payment, 'transaction-attachment')
+        save_attachment(transaction_attachment_form.data_file.data, transaction_attachment_form.mediatype.data, payment, uploads.PAYMENT_ATTACHMENT_FOLDER)
 
         # Redirect back to clear form data
         if subproject_id:
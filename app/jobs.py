@@ -0,0 +1,213 @@
+from datetime import datetime, timedelta
+from time import sleep
+import json
+
+from app import app, db, bunq_callbacks, thumbnails, util
+from app.models import Job, Project
+
+
+# A minimal job queue which stores its jobs in the database. Web requests
+# enqueue slow work (e.g., talking to Bunq) and return right away, while one
+# or more workers ('flask jobs worker') pick up the queued jobs. On
+# PostgreSQL multiple workers can run at the same time as each worker locks
+# the job it claims.
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+JOB_LINK_BUNQ_ACCOUNT = 'link-bunq-account'
+JOB_REFRESH_IBANS = 'refresh-ibans'
+JOB_REGISTER_BUNQ_CALLBACKS = 'register-bunq-callbacks'
+JOB_GET_NEW_PAYMENTS = 'get-new-payments'
+JOB_SAVE_CALLBACK_PAYMENT = 'save-callback-payment'
+JOB_CREATE_THUMBNAILS = 'create-thumbnails'
+
+# Shown on the project page
+JOB_DESCRIPTIONS = {
+    JOB_LINK_BUNQ_ACCOUNT: 'Bunq account koppelen',
+    JOB_REFRESH_IBANS: 'IBANs ophalen',
+    JOB_REGISTER_BUNQ_CALLBACKS: 'Bunq meldingen instellen',
+    JOB_GET_NEW_PAYMENTS: 'Transacties ophalen',
+    JOB_SAVE_CALLBACK_PAYMENT: 'Bunq melding verwerken',
+    JOB_CREATE_THUMBNAILS: 'Miniaturen maken'
+}
+JOB_STATUS_DESCRIPTIONS = {
+    JOB_QUEUED: 'in de wachtrij',
+    JOB_RUNNING: 'bezig',
+    JOB_DONE: 'klaar',
+    JOB_FAILED: 'mislukt'
+}
+
+# A running job which didn't finish within this many seconds is assumed to
+# belong to a worker that was killed and is queued again
+JOB_TIMEOUT = 3600
+# Maximum number of times a job is started
+JOB_MAX_ATTEMPTS = 3
+
+
+def _now():
+    return datetime.now(app.config['TZ'])
+
+
+def _link_bunq_account(project_id):
+    project = Project.query.get(project_id)
+    util.create_bunq_api_config(project.bunq_access_token, project_id)
+
+    enqueue(JOB_REFRESH_IBANS, project_id)
+    enqueue(JOB_REGISTER_BUNQ_CALLBACKS, project_id)
+    enqueue(JOB_GET_NEW_PAYMENTS, project_id)
+
+
+def _refresh_ibans(project_id):
+    util.get_all_monetary_account_active_ibans(project_id)
+
+
+def _register_bunq_callbacks(project_id):
+    bunq_callbacks.register_callbacks(project_id)
+
+
+def _get_new_payments(project_id):
+    util.get_new_payments(project_id)
+
+
+def _save_callback_payment(project_id, payment):
+    bunq_callbacks.save_callback_payment(project_id, payment)
+
+
+def _create_thumbnails(project_id, file_id, folder):
+    thumbnails.create_file_thumbnails(file_id, folder)
+
+
+_job_functions = {
+    JOB_LINK_BUNQ_ACCOUNT: _link_bunq_account,
+    JOB_REFRESH_IBANS: _refresh_ibans,
+    JOB_REGISTER_BUNQ_CALLBACKS: _register_bunq_callbacks,
+    JOB_GET_NEW_PAYMENTS: _get_new_payments,
+    JOB_SAVE_CALLBACK_PAYMENT: _save_callback_payment,
+    JOB_CREATE_THUMBNAILS: _create_thumbnails
+}
+
+
+# Add a job to the queue. If the same job is already waiting in the queue
+# then that job is returned instead of adding it again.
+def enqueue(job_type, project_id=None, **arguments):
+    if job_type not in _job_functions:
+        raise ValueError('Unknown job type "%s"' % job_type)
+
+    arguments = json.dumps(arguments, sort_keys=True)
+    job = Job.query.filter_by(
+        job_type=job_type,
+        project_id=project_id,
+        arguments=arguments,
+        status=JOB_QUEUED
+    ).first()
+    if job:
+        return job
+
+    job = Job(
+        job_type=job_type,
+        project_id=project_id,
+        arguments=arguments,
+        status=JOB_QUEUED,
+        attempts=0,
+        created=_now()
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+# Queue the running jobs of killed workers again, or mark them as failed if
+# they were already started too often
+def requeue_stale_jobs():
+    stale_jobs = Job.query.filter(
+        Job.status == JOB_RUNNING,
+        Job.started < _now() - timedelta(seconds=JOB_TIMEOUT)
+    ).all()
+    for job in stale_jobs:
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            job.status = JOB_QUEUED
+        else:
+            job.status = JOB_FAILED
+            job.error = 'Job did not finish within %s seconds' % JOB_TIMEOUT
+            job.finished = _now()
+    db.session.commit()
+    return len(stale_jobs)
+
+
+# Mark the oldest queued job as running and return it, or return None if
+# the queue is empty
+def _claim_next_job():
+    query = Job.query.filter_by(status=JOB_QUEUED).order_by(Job.id)
+    # Let concurrent workers skip the job this worker is claiming
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    job = query.first()
+    if not job:
+        db.session.commit()
+        return None
+
+    job.status = JOB_RUNNING
+    job.started = _now()
+    job.attempts += 1
+    db.session.commit()
+    return job
+
+
+def run_job(job):
+    try:
+        _job_functions[job.job_type](
+            job.project_id, **json.loads(job.arguments or '{}')
+        )
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(
+            'Job %s (%s, project %s) resulted in an exception:\n%s' % (
+                job.id, job.job_type, job.project_id, repr(e)
+            )
+        )
+        job.status = JOB_FAILED
+        job.error = repr(e)
+    else:
+        job.status = JOB_DONE
+        job.error = None
+    job.finished = _now()
+    db.session.commit()
+
+
+# Run the oldest queued job. Returns the job, or None if the queue is empty.
+def run_next_job():
+    job = _claim_next_job()
+    if job:
+        run_job(job)
+    return job
+
+
+# Run queued jobs until the queue is empty. Returns the number of jobs run.
+def run_pending_jobs():
+    requeue_stale_jobs()
+    jobs_count = 0
+    while run_next_job():
+        jobs_count += 1
+    return jobs_count
+
+
+# Keep running queued jobs, checking for new jobs every poll_interval
+# seconds when the queue is empty
+def work(poll_interval=5):
+    while True:
+        run_pending_jobs()
+        sleep(poll_interval)
+
+
+# Returns the jobs of a project which were created in the last day, newest
+# first, to show their status on the project page
+def get_project_jobs(project_id, limit=5):
+    return Job.query.filter(
+        Job.project_id == project_id,
+        Job.created > _now() - timedelta(days=1)
+    ).order_by(Job.id.desc()).limit(limit).all()
@@ -334,9 +334,10 @@ class Payment(db.Model):
     alias_type = db.Column(db.String(12))
     alias_value = db.Column(db.String(120), index=True)
     amount_currency = db.Column(db.String(12))
-    amount_value = db.Column(db.Float())
+    # Amounts are stored exactly (as Decimals) in euros with cents
+    amount_value = db.Column(db.Numeric(12, 2))
     balance_after_mutation_currency = db.Column(db.String(12))
-    balance_after_mutation_value = db.Column(db.Float())
+    balance_after_mutation_value = db.Column(db.Numeric(12, 2))
     counterparty_alias_name = db.Column(db.String(120))
     counterparty_alias_type = db.Column(db.String(12))
     counterparty_alias_value = db.Column(db.String(120), index=True)
@@ -360,6 +361,34 @@ class Payment(db.Model):
     # not implemented
     flag_suspicious_count = db.Column(db.Integer)
 
+    # The pages and payment tables show the payments of a (sub)project newest
+    # first (see payment_table.py and payment_rows.py). The partial indexes
+    # only contain the payments visible to anonymous visitors. Use 'flask
+    # database check-query-plans' to verify that these indexes are used.
+    __table_args__ = (
+        db.Index(
+            'ix_payment_subproject_id_created',
+            subproject_id, created.desc(), id.desc()
+        ),
+        db.Index(
+            'ix_payment_project_id_created',
+            project_id, created.desc(), id.desc()
+        ),
+        db.Index(
+            'ix_payment_subproject_id_created_visible',
+            subproject_id, created.desc(), id.desc(),
+            postgresql_where=hidden.isnot(True),
+            sqlite_where=hidden.isnot(True)
+        ),
+        db.Index(
+            'ix_payment_project_id_created_visible',
+            project_id, created.desc(), id.desc(),
+            postgresql_where=hidden.isnot(True),
+            sqlite_where=hidden.isnot(True)
+        ),
+        db.Index('ix_payment_category_id', category_id)
+    )
+
     attachments = db.relationship(
         'File',
         secondary=payment_attachment,
@@ -367,6 +396,8 @@ class Payment(db.Model):
     )
 
     def get_formatted_currency(self):
+        if self.amount_value is None:
+            return ''
         return locale.format(
             "%.2f", self.amount_value, grouping=True, monetary=True
         )
@@ -426,6 +457,12 @@ class File(db.Model):
     filename = db.Column(db.String(255), index=True)
     mimetype = db.Column(db.String(255))
     mediatype = db.Column(db.String(32))
+    # Whether thumbnails were created (True) or can't be created (False),
+    # see thumbnails.py
+    thumbnails = db.Column(db.Boolean)
+    # SHA-256 hex digest of the content, which is also the filename of
+    # uploads since it was added (see uploads.save_upload)
+    sha256 = db.Column(db.String(64), index=True)
 
 
 class Category(db.Model):
@@ -445,6 +482,80 @@ class Category(db.Model):
     )
 
 
+# Summary of the amounts awarded and spent per project, kept up to date by
+# app/totals.py whenever payments change so the pages don't have to sum all
+# payments on every request
+class ProjectTotals(db.Model):
+    project_id = db.Column(
+        db.Integer,
+        db.ForeignKey('project.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    awarded = db.Column(db.Numeric(12, 2), default=0)
+    spent = db.Column(db.Numeric(12, 2), default=0)
+    updated = db.Column(db.DateTime(timezone=True))
+
+
+# Summary of the amounts awarded and spent per subproject, see ProjectTotals
+class SubprojectTotals(db.Model):
+    subproject_id = db.Column(
+        db.Integer,
+        db.ForeignKey('subproject.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    project_id = db.Column(
+        db.Integer,
+        db.ForeignKey('project.id', ondelete='CASCADE'),
+        index=True
+    )
+    awarded = db.Column(db.Numeric(12, 2), default=0)
+    spent = db.Column(db.Numeric(12, 2), default=0)
+    updated = db.Column(db.DateTime(timezone=True))
+
+
+# Keeps track of which payments of a Bunq monetary account have been retrieved
+# so syncs can continue exactly where the previous sync stopped
+class MonetaryAccountSyncState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(
+        db.Integer, db.ForeignKey('project.id', ondelete='CASCADE')
+    )
+    monetary_account_id = db.Column(db.Integer(), index=True)
+    # Bank payment ids of the newest and oldest retrieved payments
+    newest_bank_payment_id = db.Column(db.Integer())
+    oldest_bank_payment_id = db.Column(db.Integer())
+    # True once all payments older than oldest_bank_payment_id are retrieved
+    backfill_complete = db.Column(db.Boolean, default=False)
+    last_success = db.Column(db.DateTime(timezone=True))
+    last_error = db.Column(db.Text())
+    last_error_time = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'monetary_account_id'),
+    )
+
+
+# Background job which is executed by a worker ('flask jobs worker') instead
+# of inside a web request, see app/jobs.py
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(64), index=True)
+    project_id = db.Column(
+        db.Integer,
+        db.ForeignKey('project.id', ondelete='CASCADE'),
+        index=True
+    )
+    # JSON encoded keyword arguments for the job function
+    arguments = db.Column(db.Text())
+    # One of 'queued', 'running', 'done' or 'failed'
+    status = db.Column(db.String(16), index=True, default='queued')
+    attempts = db.Column(db.Integer(), default=0)
+    error = db.Column(db.Text())
+    created = db.Column(db.DateTime(timezone=True))
+    started = db.Column(db.DateTime(timezone=True))
+    finished = db.Column(db.DateTime(timezone=True))
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
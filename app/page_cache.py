@@ -0,0 +1,225 @@
+from datetime import datetime
+from uuid import uuid4
+import hashlib
+import os
+import time
+
+from flask import g, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import app
+from app.models import (
+    Category, File, Funder, IBAN, Payment, Project, ProjectTotals, Subproject,
+    SubprojectTotals, User, UserStory
+)
+
+
+# Cache of rendered pages for anonymous visitors, stored as files in
+# PAGE_CACHE_DIR so all uWSGI processes (and the job worker, which shares
+# the directory) use and invalidate the same cache.
+#
+# Every entry records the cache generation it was rendered in. Committing a
+# change to one of the models in INVALIDATING_MODELS starts a new generation,
+# which makes all entries stale. Because the generation is read before
+# rendering, a page rendered while a change is committed is never served
+# after that change. Changes made outside SQLAlchemy's ORM (e.g., manual SQL)
+# aren't noticed, which is why entries also expire after PAGE_CACHE_TIMEOUT
+# seconds.
+#
+# The generation is also the version of the public pages used for HTTP
+# conditional requests: anonymous visitors (and nginx) get an ETag and
+# Last-Modified header and a 304 response without the page being rendered if
+# nothing changed since. A single version for the whole site is used instead
+# of one per project, because finding the project of every changed row
+# would need extra queries while committing, and changes are rare compared
+# to page views.
+
+
+# Models shown on public pages
+INVALIDATING_MODELS = (
+    Category, File, Funder, IBAN, Payment, Project, ProjectTotals, Subproject,
+    SubprojectTotals, User, UserStory
+)
+
+# Endpoints which support conditional requests from anonymous visitors
+CONDITIONAL_ENDPOINTS = ('index', 'project', 'subproject')
+
+_GENERATION_FILENAME = 'generation'
+
+
+def _get_cache_dir():
+    return app.config.get('PAGE_CACHE_DIR', 'cache')
+
+
+def _get_path(filename):
+    return os.path.join(_get_cache_dir(), filename)
+
+
+# Write a file atomically, so other processes never read half a file
+def _write(filename, content):
+    os.makedirs(_get_cache_dir(), exist_ok=True)
+    temp_path = _get_path('.%s.%s' % (filename, uuid4().hex))
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, _get_path(filename))
+
+
+def _read(filename):
+    try:
+        with open(_get_path(filename), encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def is_enabled():
+    return app.config.get('PAGE_CACHE_TIMEOUT', 300) > 0
+
+
+def get_generation():
+    generation = _read(_GENERATION_FILENAME)
+    if generation is None:
+        invalidate()
+        generation = _read(_GENERATION_FILENAME) or ''
+    return generation
+
+
+# Returns when the current generation started, in UTC without a timezone
+# (like werkzeug's request.if_modified_since)
+def get_last_modified():
+    try:
+        return datetime.utcfromtimestamp(
+            int(os.path.getmtime(_get_path(_GENERATION_FILENAME)))
+        )
+    except OSError:
+        return None
+
+
+# Returns the cached page stored under key, or None if it isn't cached or is
+# stale
+def get(key):
+    if not is_enabled():
+        return None
+
+    try:
+        modified = os.path.getmtime(_get_path(key))
+    except OSError:
+        return None
+    if modified < time.time() - app.config.get('PAGE_CACHE_TIMEOUT', 300):
+        return None
+
+    content = _read(key)
+    if content is None:
+        return None
+    generation, _, page = content.partition('\n')
+    if generation != get_generation():
+        return None
+    return page
+
+
+# Store a page under key. Pass the generation returned by get_generation
+# before the data of the page was loaded.
+def store(key, page, generation):
+    if not is_enabled():
+        return
+    try:
+        _write(key, '%s\n%s' % (generation, page))
+    except OSError as e:
+        app.logger.warning('Could not cache page "%s": %s' % (key, repr(e)))
+
+
+# Make all cached pages stale
+def invalidate():
+    try:
+        _write(_GENERATION_FILENAME, uuid4().hex)
+    except OSError as e:
+        app.logger.error('Could not invalidate page cache: %s' % repr(e))
+
+
+# Returns whether the current request is an anonymous request for a page
+# which supports conditional requests. Pages showing flashed messages are
+# excluded, as these messages are shown only once.
+def is_conditional_request():
+    return (
+        request.method in ('GET', 'HEAD')
+        and request.endpoint in CONDITIONAL_ENDPOINTS
+        and not current_user.is_authenticated
+        and not request.args
+        and '_flashes' not in session
+    )
+
+
+def _get_etag(generation):
+    return hashlib.sha1(
+        ('%s %s' % (generation, request.path)).encode('utf-8')
+    ).hexdigest()
+
+
+# Call before processing a conditional request. Returns a 304 response if
+# the visitor already has the current version of the page, otherwise None.
+# The version is determined before the page is rendered, so a change
+# committed while rendering results in a new version on the next request.
+def get_not_modified_response():
+    g.page_generation = get_generation()
+    g.page_last_modified = get_last_modified()
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(
+            _get_etag(g.page_generation)
+        )
+    elif request.if_modified_since and g.page_last_modified:
+        not_modified = g.page_last_modified <= request.if_modified_since
+    else:
+        not_modified = False
+
+    if not_modified:
+        return app.response_class(status=304)
+    return None
+
+
+# Add the ETag and Last-Modified headers to the response of a conditional
+# request. Browsers have to revalidate the page on every visit, while nginx
+# may reuse it for PROXY_CACHE_TIMEOUT seconds (see
+# docker/nginx/conf.d/default.conf).
+def add_validators(response):
+    if 'page_generation' not in g or response.status_code not in (200, 304):
+        return
+
+    response.set_etag(_get_etag(g.page_generation))
+    if g.page_last_modified:
+        response.last_modified = g.page_last_modified
+    response.headers['Cache-Control'] = 'public, max-age=0'
+
+    proxy_cache_timeout = app.config.get('PROXY_CACHE_TIMEOUT', 5)
+    if proxy_cache_timeout:
+        response.headers['X-Accel-Expires'] = str(proxy_cache_timeout)
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, INVALIDATING_MODELS):
+            session.info['page_cache_changed'] = True
+            return
+
+
+# Bulk updates and deletes via Query.update/delete don't flush instances
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _after_bulk(update_context):
+    mapper = getattr(update_context, 'mapper', None)
+    if mapper is None or issubclass(mapper.class_, INVALIDATING_MODELS):
+        update_context.session.info['page_cache_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('page_cache_changed', False):
+        invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('page_cache_changed', None)
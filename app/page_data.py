@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+from sqlalchemy import or_
+
+from app import db
+from app.models import (
+    Category, File, Subproject, payment_attachment, subproject_user
+)
+
+
+# The project and subproject pages show the payments of a (sub)project
+# together with their subproject, category and attachments. Most
+# relationships in models.py are lazy='dynamic', so using them in loops
+# results in one query per subproject or payment. The functions below load
+# everything a page needs in a fixed number of queries, regardless of the
+# number of payments.
+
+
+# Returns the subprojects of a project ordered by name (like
+# project.subprojects)
+def load_subprojects(project):
+    return Subproject.query.filter_by(
+        project_id=project.id
+    ).order_by(
+        Subproject.name.asc()
+    ).all()
+
+
+# Returns the ids of the given subprojects the user is part of
+def load_user_subproject_ids(user_id, subprojects):
+    subproject_ids = [subproject.id for subproject in subprojects]
+    if not subproject_ids:
+        return []
+
+    return [
+        subproject_id for subproject_id, in db.session.query(
+            subproject_user.c.subproject_id
+        ).filter(
+            subproject_user.c.user_id == user_id,
+            subproject_user.c.subproject_id.in_(subproject_ids)
+        )
+    ]
+
+
+# Returns a dict of payment_id -> list of attachments (File) for the given
+# payments
+def load_attachments(payments):
+    attachments = {payment.id: [] for payment in payments}
+    if not attachments:
+        return attachments
+
+    for payment_id, attachment in db.session.query(
+            payment_attachment.c.payment_id, File).join(
+                File, File.id == payment_attachment.c.file_id
+            ).filter(
+                payment_attachment.c.payment_id.in_(list(attachments))
+            ).order_by(File.id):
+        attachments[payment_id].append(attachment)
+
+    return attachments
+
+
+# A payment as shown in the payment table of the project and subproject
+# pages: its attachments, also split by mediatype, and whether the current
+# user may edit it
+PaymentView = namedtuple(
+    'PaymentView', ['payment', 'attachments', 'bonnen', 'media', 'can_edit']
+)
+
+
+# Returns PaymentViews of the given payments in the same order. The payments
+# are loaded with the queries of payment_table.py, which already leave out
+# hidden payments the user may not see. Users may edit all payments if they
+# are a project owner, otherwise only those of their subprojects.
+def load_payment_views(payments, project_owner, user_subproject_ids):
+    attachments = load_attachments(payments)
+    return [
+        PaymentView(
+            payment,
+            attachments[payment.id],
+            [a for a in attachments[payment.id] if a.mediatype == 'bon'],
+            [a for a in attachments[payment.id] if a.mediatype == 'media'],
+            bool(project_owner or payment.subproject_id in user_subproject_ids)
+        )
+        for payment in payments
+    ]
+
+
+# Returns the category select options (see
+# Project.make_category_select_options) of a project and of the given
+# subprojects as a dict keyed by (project_id, subproject_id), where
+# subproject_id is None for the categories of the project itself. Use
+# category_cache.get_all_category_select_options to reuse loaded options.
+def load_category_select_options(project_id, subproject_ids):
+    select_options = {(project_id, None): [('', '')]}
+    for subproject_id in subproject_ids:
+        select_options[(project_id, subproject_id)] = [('', '')]
+
+    categories = Category.query.filter(
+        or_(
+            Category.project_id == project_id,
+            Category.subproject_id.in_(list(subproject_ids))
+        )
+    ).order_by(Category.id)
+    for category in categories:
+        key = (project_id, category.subproject_id)
+        if key in select_options:
+            select_options[key].append((str(category.id), category.name))
+
+    return select_options
+
+
+# Returns the key of the category select options for the given payment
+def get_payment_category_key(payment):
+    if payment.subproject:
+        return (payment.subproject.project_id, payment.subproject_id)
+    return (payment.project_id, None)
@@ -0,0 +1,94 @@
+from collections import namedtuple
+
+from app.models import Category, Payment, Subproject
+
+
+# Read-only payments for the pages, payment tables and payments.json routes.
+# Loading Payment instances for every payment of a large project is slow and
+# uses a lot of memory: all columns are loaded and every instance is tracked
+# by the session. PaymentRows are plain tuples loaded by selecting only the
+# columns these views use, together with the name of the subproject and
+# category. Payments are changed by loading the Payment itself (see
+# form_processing.py).
+
+
+_PAYMENT_COLUMNS = (
+    Payment.id,
+    Payment.project_id,
+    Payment.subproject_id,
+    Payment.category_id,
+    Payment.amount_value,
+    Payment.balance_after_mutation_value,
+    Payment.alias_name,
+    Payment.counterparty_alias_name,
+    Payment.description,
+    Payment.short_user_description,
+    Payment.long_user_description,
+    Payment.created,
+    Payment.hidden,
+    Payment.type,
+    Payment.route
+)
+
+SubprojectRow = namedtuple('SubprojectRow', ['id', 'name', 'project_id'])
+CategoryRow = namedtuple('CategoryRow', ['id', 'name'])
+
+
+class PaymentRow(namedtuple(
+        'PaymentRow',
+        [column.key for column in _PAYMENT_COLUMNS] + ['subproject', 'category']
+)):
+    __slots__ = ()
+
+    # Formatted the same way as Payment
+    get_formatted_currency = Payment.get_formatted_currency
+    get_formatted_balance = Payment.get_formatted_balance
+
+
+# Payments are shown newest first; the id makes the order deterministic,
+# which is needed to paginate with an offset. The payment indexes in
+# models.py match this order.
+NEWEST_FIRST = (Payment.created.desc(), Payment.id.desc())
+
+
+# Returns the PaymentRows of a query on Payment which (outer) joins
+# Subproject and Category, e.g., payment_table.project_payments_query. The
+# payments are ordered by order_by and then newest first; offset and limit
+# select a page. This is used for all read-only payments, so they are loaded
+# the same way for every view.
+def load_payments(query, order_by=(), offset=0, limit=None):
+    query = query.order_by(None).order_by(*(tuple(order_by) + NEWEST_FIRST))
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+
+    rows = query.with_entities(
+        *_PAYMENT_COLUMNS,
+        Subproject.name.label('subproject_name'),
+        Subproject.project_id.label('subproject_project_id'),
+        Category.name.label('category_name')
+    )
+
+    # Payments of the same subproject or category share their tuple
+    subprojects = {None: None}
+    categories = {None: None}
+    payment_rows = []
+    for row in rows:
+        if row.subproject_id not in subprojects:
+            subprojects[row.subproject_id] = SubprojectRow(
+                row.subproject_id, row.subproject_name, row.subproject_project_id
+            )
+        if row.category_id not in categories:
+            categories[row.category_id] = CategoryRow(
+                row.category_id, row.category_name
+            )
+
+        payment_rows.append(
+            PaymentRow(
+                *row[:len(_PAYMENT_COLUMNS)],
+                subprojects[row.subproject_id],
+                categories[row.category_id]
+            )
+        )
+    return payment_rows
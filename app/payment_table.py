@@ -0,0 +1,282 @@
+from datetime import datetime, time, timedelta
+import re
+
+from flask import url_for
+from sqlalchemy import or_
+
+from app import app, db, payment_rows
+from app.models import Category, File, Payment, Subproject, payment_attachment
+
+
+# The payment tables on the project and subproject pages contain every
+# payment, which results in megabytes of HTML for projects running for
+# multiple years. Pages with more than SERVER_SIDE_PAYMENT_TABLE_THRESHOLD
+# payments use bootstrap-table's server-side mode instead: the table requests
+# one page of rows at a time from the payments.json routes, which search,
+# filter, sort and paginate the payments in SQL.
+
+
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 500
+
+# Sortable columns, keyed by the data-field of the column in the payment table
+SORT_COLUMNS = {
+    'initiatief': Subproject.name,
+    'bedrag': Payment.amount_value,
+    'ontvanger': Payment.counterparty_alias_name,
+    'initiatiefnemer': Payment.alias_name,
+    'omschrijving': Payment.short_user_description,
+    'datum': Payment.created
+}
+
+# Columns searched by the search box of the payment table
+SEARCH_COLUMNS = [
+    Payment.counterparty_alias_name,
+    Payment.alias_name,
+    Payment.short_user_description,
+    Payment.long_user_description,
+    Payment.description,
+    Subproject.name,
+    Category.name
+]
+
+
+# Returns whether a page with this many payments should use the server-side
+# payment table (0 disables this)
+def use_server_side_table(payments_count):
+    threshold = app.config.get('SERVER_SIDE_PAYMENT_TABLE_THRESHOLD', 0)
+    return bool(threshold) and payments_count > threshold
+
+
+# Payments joined with their subproject and category, so they can be searched
+# and sorted on
+def _payments_query():
+    return Payment.query.outerjoin(
+        Subproject, Payment.subproject_id == Subproject.id
+    ).outerjoin(
+        Category, Payment.category_id == Category.id
+    )
+
+
+# Hidden payments are only shown to project owners and to users of the
+# subproject the payment belongs to
+def _filter_visible(query, project_owner, user_subproject_ids):
+    if project_owner:
+        return query
+
+    visible = [Payment.hidden.isnot(True)]
+    if user_subproject_ids:
+        visible.append(Payment.subproject_id.in_(list(user_subproject_ids)))
+    return query.filter(or_(*visible))
+
+
+# Returns a query of the payments the current user can see on a project page,
+# i.e., the payments of its subprojects if the project contains subprojects
+# or otherwise the payments of the project itself. Used for the page, its
+# payment table and its exports; load the payments with
+# payment_rows.load_payments.
+def project_payments_query(project, project_owner, user_subproject_ids):
+    query = _payments_query()
+    if project.contains_subprojects:
+        # Filtering on the subproject ids instead of the joined
+        # Subproject.project_id lets the payment indexes be used
+        query = query.filter(
+            Payment.subproject_id.in_(
+                db.session.query(Subproject.id).filter(
+                    Subproject.project_id == project.id
+                )
+            )
+        )
+    else:
+        query = query.filter(Payment.project_id == project.id)
+    return _filter_visible(query, project_owner, user_subproject_ids)
+
+
+# Returns a query of the payments the current user can see on a subproject
+# page
+def subproject_payments_query(subproject, project_owner, user_subproject_ids):
+    return _filter_visible(
+        _payments_query().filter(Payment.subproject_id == subproject.id),
+        project_owner,
+        user_subproject_ids
+    )
+
+
+def _parse_int(value):
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def _parse_date(value):
+    if value in (None, ''):
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+# Parse the query string sent by bootstrap-table (limit, offset, sort, order
+# and search) and by the filters above the table (date_from, date_to,
+# category_id and subproject_id). Raises a ValueError on invalid values.
+def parse_table_args(args):
+    limit = _parse_int(args.get('limit'))
+    if limit is None:
+        limit = DEFAULT_LIMIT
+    offset = _parse_int(args.get('offset')) or 0
+    if limit < 1 or offset < 0:
+        raise ValueError('Invalid limit or offset')
+
+    return {
+        'limit': min(limit, MAX_LIMIT),
+        'offset': offset,
+        'sort': args.get('sort') if args.get('sort') in SORT_COLUMNS else None,
+        'order': 'asc' if args.get('order') == 'asc' else 'desc',
+        'search': args.get('search', '').strip(),
+        'date_from': _parse_date(args.get('date_from')),
+        'date_to': _parse_date(args.get('date_to')),
+        'category_id': _parse_int(args.get('category_id')),
+        'subproject_id': _parse_int(args.get('subproject_id'))
+    }
+
+
+def _start_of_day(date):
+    return app.config['TZ'].localize(datetime.combine(date, time()))
+
+
+# Apply the search and filters of the parsed table arguments to a payments
+# query
+def filter_payments(query, table_args):
+    if table_args['search']:
+        search = '%%%s%%' % re.sub(r'([\\%_])', r'\\\1', table_args['search'])
+        query = query.filter(
+            or_(*[
+                column.ilike(search, escape='\\')
+                for column in SEARCH_COLUMNS
+            ])
+        )
+
+    if table_args['date_from']:
+        query = query.filter(
+            Payment.created >= _start_of_day(table_args['date_from'])
+        )
+
+    # The end date is inclusive
+    if table_args['date_to']:
+        query = query.filter(
+            Payment.created < _start_of_day(
+                table_args['date_to'] + timedelta(days=1)
+            )
+        )
+
+    if table_args['category_id'] is not None:
+        query = query.filter(Payment.category_id == table_args['category_id'])
+
+    if table_args['subproject_id'] is not None:
+        query = query.filter(
+            Payment.subproject_id == table_args['subproject_id']
+        )
+
+    return query
+
+
+# Returns the order of the requested sort column, if any
+def _get_sort_order_by(table_args):
+    if not table_args['sort']:
+        return []
+    column = SORT_COLUMNS[table_args['sort']]
+    if table_args['order'] == 'asc':
+        return [column.asc()]
+    return [column.desc()]
+
+
+# Payments are ordered by the requested column and then newest first (like
+# the table without server-side mode, see payment_rows.NEWEST_FIRST)
+def get_order_by(table_args):
+    return _get_sort_order_by(table_args) + list(payment_rows.NEWEST_FIRST)
+
+
+# Returns the payments on the requested page of the table as PaymentRows
+def get_page(query, table_args):
+    return payment_rows.load_payments(
+        query,
+        _get_sort_order_by(table_args),
+        table_args['offset'],
+        table_args['limit']
+    )
+
+
+# Returns the number of payments of a query, without loading them
+def count(query):
+    return query.order_by(None).with_entities(
+        db.func.count(Payment.id)
+    ).scalar()
+
+
+# Returns the attachments of all payments of a query, newest payment first;
+# used for the 'alle media' overview when the payments themselves aren't
+# loaded
+def load_all_attachments(query):
+    payment_ids = query.order_by(None).with_entities(Payment.id).subquery()
+    return db.session.query(File).join(
+        payment_attachment, File.id == payment_attachment.c.file_id
+    ).join(
+        Payment, Payment.id == payment_attachment.c.payment_id
+    ).filter(
+        payment_attachment.c.payment_id.in_(payment_ids)
+    ).order_by(
+        Payment.created.desc(), Payment.id.desc(), File.id
+    ).all()
+
+
+# Returns the (category_id, name) options of the category filter above the
+# table from the category select options of a project and its subprojects
+# (see category_cache.get_all_category_select_options). Subproject categories
+# are suffixed with the name of their subproject.
+def get_category_filter_options(category_select_options, subprojects=()):
+    subproject_names = {
+        subproject.id: subproject.name for subproject in subprojects
+    }
+
+    category_filter_options = []
+    for (_, subproject_id), select_options in category_select_options.items():
+        for category_id, name in select_options:
+            if not category_id:
+                continue
+            if subproject_id in subproject_names:
+                name = '%s (%s)' % (name, subproject_names[subproject_id])
+            category_filter_options.append((category_id, name))
+
+    return category_filter_options
+
+
+# Returns the JSON representation of a payment (a page_data.PaymentView) in
+# the table; detail is the HTML shown when the row is opened. A missing
+# amount or date is left empty, like in the table on the page.
+def payment_to_row(payment_view, detail):
+    payment = payment_view.payment
+    amount = payment.amount_value
+    created = payment.created
+    return {
+        'id': payment.id,
+        'initiatief': payment.subproject.name if payment.subproject else None,
+        'initiatief_url': url_for(
+            'subproject',
+            project_id=payment.subproject.project_id,
+            subproject_id=payment.subproject_id
+        ) if payment.subproject else None,
+        'bedrag': float(amount) if amount is not None else None,
+        'bedrag_formatted': payment.get_formatted_currency(),
+        'ontvanger': payment.counterparty_alias_name,
+        'initiatiefnemer': payment.alias_name,
+        'omschrijving': payment.short_user_description,
+        'datum': created.strftime('%d-%m-\'%y') if created else '',
+        'created': created.isoformat() if created else None,
+        'bonnen': len(payment_view.bonnen),
+        'media': len(payment_view.media),
+        'betaalomschrijving': payment.description,
+        'lange_omschrijving': payment.long_user_description,
+        'saldo': payment.get_formatted_balance(),
+        'categorie': payment.category.name if payment.category else None,
+        'type': payment.type,
+        'hidden': bool(payment.hidden),
+        'detail': detail
+    }
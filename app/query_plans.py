@@ -0,0 +1,157 @@
+from app import db, payment_rows, payment_table
+from app.models import Payment, Project, Subproject
+
+
+# Checks that the queries of the project and subproject pages and their
+# payment tables use the payment indexes (see Payment.__table_args__), so
+# they stay index scans as the number of payments grows. Every query is
+# explained (EXPLAIN on PostgreSQL, EXPLAIN QUERY PLAN on SQLite) for the
+# project and subproject with the most payments, and its plan has to mention
+# one of the expected indexes.
+#
+# PostgreSQL prefers a sequential scan for small tables, e.g., in a
+# development database. Pass disable_seqscan to check which indexes would be
+# used for a larger table.
+
+
+SUBPROJECT_INDEXES = (
+    'ix_payment_subproject_id_created',
+    'ix_payment_subproject_id_created_visible'
+)
+PROJECT_INDEXES = (
+    'ix_payment_project_id_created',
+    'ix_payment_project_id_created_visible'
+)
+
+
+# Returns the id of the (sub)project with the most payments, where column is
+# Payment.project_id or Payment.subproject_id
+def _get_most_payments_id(column):
+    return db.session.query(column).filter(
+        column.isnot(None)
+    ).group_by(
+        column
+    ).order_by(
+        db.func.count().desc()
+    ).limit(1).scalar()
+
+
+def _get_page_query(query):
+    return query.order_by(*payment_rows.NEWEST_FIRST)
+
+
+def _get_table_page_query(query):
+    table_args = payment_table.parse_table_args({})
+    return query.order_by(
+        *payment_table.get_order_by(table_args)
+    ).limit(table_args['limit'])
+
+
+def _get_count_query(query):
+    return query.order_by(None).with_entities(db.func.count(Payment.id))
+
+
+# Returns the queries of a (sub)project as (description, query, expected
+# indexes) tuples. queries is a function returning the payments query of the
+# (sub)project given project_owner and user_subproject_ids (e.g.,
+# payment_table.project_payments_query). Project owners see all payments;
+# anonymous visitors only see payments that aren't hidden, which the
+# partial indexes are for.
+def _get_queries(description, queries, indexes):
+    owner_query = queries(True, [])
+    anonymous_query = queries(False, [])
+    return [
+        ('%s page' % description, _get_page_query(anonymous_query), indexes),
+        (
+            '%s page (project owner)' % description,
+            _get_page_query(owner_query),
+            indexes
+        ),
+        (
+            '%s payment table' % description,
+            _get_table_page_query(anonymous_query),
+            indexes
+        ),
+        (
+            '%s payment count' % description,
+            _get_count_query(anonymous_query),
+            indexes
+        )
+    ]
+
+
+# Returns the hot queries as (description, query, expected indexes) tuples.
+# The pages, payment tables and exports all use the queries of
+# payment_table.py.
+def get_hot_queries():
+    hot_queries = []
+
+    subproject_id = _get_most_payments_id(Payment.subproject_id)
+    subproject = Subproject.query.get(subproject_id) if subproject_id else None
+    if subproject:
+        hot_queries += _get_queries(
+            'subproject %s' % subproject.id,
+            lambda project_owner, user_subproject_ids: (
+                payment_table.subproject_payments_query(
+                    subproject, project_owner, user_subproject_ids
+                )
+            ),
+            SUBPROJECT_INDEXES
+        )
+
+    project_ids = set([
+        _get_most_payments_id(Payment.project_id),
+        subproject.project_id if subproject else None
+    ])
+    for project_id in sorted(project_ids - set([None])):
+        project = Project.query.get(project_id)
+        hot_queries += _get_queries(
+            'project %s' % project.id,
+            lambda project_owner, user_subproject_ids: (
+                payment_table.project_payments_query(
+                    project, project_owner, user_subproject_ids
+                )
+            ),
+            SUBPROJECT_INDEXES if project.contains_subprojects
+            else PROJECT_INDEXES
+        )
+
+    return hot_queries
+
+
+# Returns the query plan of a query as text
+def explain(query):
+    dialect = db.session.get_bind().dialect
+    sql = str(
+        query.statement.compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}
+        )
+    )
+    if dialect.name == 'sqlite':
+        # The last column of each row describes a step of the plan
+        return '\n'.join(
+            row[-1] for row in db.session.execute('EXPLAIN QUERY PLAN ' + sql)
+        )
+    return '\n'.join(row[0] for row in db.session.execute('EXPLAIN ' + sql))
+
+
+# Returns the result of checking the hot queries as (description, plan,
+# expected indexes, uses_index) tuples
+def check_query_plans(disable_seqscan=False):
+    results = []
+    dialect = db.session.get_bind().dialect
+    try:
+        if disable_seqscan and dialect.name == 'postgresql':
+            db.session.execute('SET LOCAL enable_seqscan = off')
+
+        for description, query, indexes in get_hot_queries():
+            plan = explain(query)
+            results.append((
+                description,
+                plan,
+                indexes,
+                any(index in plan for index in indexes)
+            ))
+    finally:
+        db.session.rollback()
+    return results
@@ -0,0 +1,124 @@
+from collections import deque
+from threading import Lock
+from time import monotonic, sleep
+import random
+
+
+# Token bucket which allows at most 'capacity' requests in every window of
+# 'period' seconds. A used token only returns to the bucket 'period' seconds
+# after it was taken, so bursts up to 'capacity' requests are allowed but the
+# limit also holds for any sliding window (which is how Bunq counts).
+#
+# Use call() to perform a request: it waits for a token and retries the
+# request with an exponential backoff (with jitter) if it raises one of
+# 'retry_exceptions' (e.g., the exception raised on a HTTP 429 response).
+# During a backoff all other requests using the same bucket wait as well.
+class TokenBucket(object):
+    def __init__(self, capacity, period, retry_exceptions=(), max_retries=5,
+                 backoff_base=1, backoff_max=60):
+        self.capacity = capacity
+        self.period = period
+        self.retry_exceptions = tuple(retry_exceptions)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = Lock()
+        # Times at which tokens were (or will be) taken
+        self._taken = deque()
+        self._backoff_until = 0
+        self._consecutive_throttles = 0
+
+        # Counters, see stats()
+        self._requests = 0
+        self._throttled = 0
+        self._wait_time = 0
+        self._backoff_time = 0
+
+    # Take a token, waiting until one is available. Returns the number of
+    # seconds waited.
+    def acquire(self):
+        with self._lock:
+            now = monotonic()
+            while self._taken and self._taken[0] <= now - self.period:
+                self._taken.popleft()
+
+            start = max(now, self._backoff_until)
+            if len(self._taken) >= self.capacity:
+                start = max(start, self._taken[-self.capacity] + self.period)
+            self._taken.append(start)
+
+            wait = start - now
+            backoff_wait = max(0, self._backoff_until - now)
+            self._requests += 1
+            self._backoff_time += backoff_wait
+            self._wait_time += wait - backoff_wait
+
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    # Register that the server told us to slow down. All requests using this
+    # bucket are paused for an exponentially growing (jittered) delay.
+    # Returns the delay in seconds.
+    def backoff(self):
+        with self._lock:
+            delay = min(
+                self.backoff_max,
+                self.backoff_base * 2 ** self._consecutive_throttles
+            )
+            # Use a random delay between half and the full delay so multiple
+            # clients don't retry at exactly the same moment
+            delay = random.uniform(delay / 2, delay)
+            self._consecutive_throttles += 1
+            self._throttled += 1
+            self._backoff_until = max(
+                self._backoff_until, monotonic() + delay
+            )
+        return delay
+
+    # Perform function(*args, **kwargs) within the rate limit, retrying it
+    # when it raises one of the retry_exceptions
+    def call(self, function, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = function(*args, **kwargs)
+            except self.retry_exceptions:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.backoff()
+                continue
+
+            with self._lock:
+                self._consecutive_throttles = 0
+            return result
+
+    # Returns the counters of this bucket: the number of requests, the number
+    # of throttled (e.g., HTTP 429) responses and the number of seconds spent
+    # waiting for a token, waiting for a backoff to end and in total
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'throttled': self._throttled,
+                'wait_time': self._wait_time,
+                'backoff_time': self._backoff_time,
+                'throttled_time': self._wait_time + self._backoff_time
+            }
+
+
+_limiters = {}
+_limiters_lock = Lock()
+
+
+# Returns the token bucket for the given key (e.g., a Bunq API context),
+# creating it if it doesn't exist yet
+def get_limiter(key, capacity, period, **kwargs):
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = TokenBucket(capacity, period, **kwargs)
+        return _limiters[key]
+
@@ -1,6 +1,6 @@
 from flask import (
     render_template, redirect, url_for, flash, session, request,
-    send_from_directory
+    abort, jsonify
 )
 from flask_login import login_required, login_user, logout_user, current_user
 
@@ -16,11 +16,15 @@ from app.email import send_password_reset_email
 from app.models import (
     User, Project, Subproject, Payment, UserStory, IBAN, File, Funder, Category
 )
-from app import util
+from app import (
+    bunq_callbacks, category_cache, export, jobs, page_cache, page_data,
+    payment_rows, payment_table, thumbnails, totals, uploads, util
+)
 from app.form_processing import (
     process_category_form, process_payment_form, create_payment_forms,
-    process_transaction_attachment_form, create_edit_attachment_forms,
-    process_edit_attachment_form, save_attachment
+    use_lazy_payment_forms, process_transaction_attachment_form,
+    create_edit_attachment_forms, process_edit_attachment_form,
+    save_attachment
 )
 from sqlalchemy.exc import IntegrityError
 
@@ -34,11 +38,15 @@ import jwt
 import re
 
 
-# Add 'Cache-Control': 'private' header if users are logged in
+# Add 'Cache-Control': 'private' header if users are logged in (unless the
+# view set its own, e.g., for uploads), or the headers needed for
+# conditional requests for anonymous visitors
 @app.after_request
 def after_request_callback(response):
     if current_user.is_authenticated:
-        response.headers['Cache-Control'] = 'private'
+        response.headers.setdefault('Cache-Control', 'private')
+    else:
+        page_cache.add_validators(response)
 
     return response
 
@@ -58,8 +66,10 @@ def before_request():
         return redirect(url_for('index'))
 
     # If the current user has no first name, last name or biography then
-    # send them to their profile page where they can add them
-    if current_user.is_authenticated and request.path != '/profiel-bewerken':
+    # send them to their profile page where they can add them (uploads are
+    # still served, as the profile page shows the user's image)
+    if (current_user.is_authenticated and request.path != '/profiel-bewerken'
+            and request.endpoint not in ('upload', 'thumbnail')):
         if (not current_user.first_name
                 or not current_user.last_name or not current_user.biography):
             flash(
@@ -68,6 +78,11 @@ def before_request():
             )
             return redirect(url_for('profile_edit'))
 
+    # Don't render public pages again for anonymous visitors who already
+    # have the current version
+    if page_cache.is_conditional_request():
+        return page_cache.get_not_modified_response()
+
 
 @app.route("/", methods=['GET', 'POST'])
 def index():
@@ -75,6 +90,20 @@ def index():
     if request.args.get('state'):
         return util.process_bunq_oauth_callback(request, current_user)
 
+    # All anonymous visitors get the same homepage, so serve it from the page
+    # cache (unless a message was flashed to this visitor)
+    use_page_cache = (
+        request.method == 'GET'
+        and not current_user.is_authenticated
+        and not request.args
+        and '_flashes' not in session
+    )
+    if use_page_cache:
+        page = page_cache.get('index')
+        if page is not None:
+            return page
+        page_cache_generation = page_cache.get_generation()
+
     # Process filled in edit admin form
     edit_admin_form = EditAdminForm(prefix="edit_admin_form")
 
@@ -183,7 +212,9 @@ def index():
     total_awarded = 0
     total_spent = 0
     project_data = []
-    # Retrieve data for each project
+    # Retrieve the projects the current user is allowed to see
+    projects = []
+    project_owners = {}
     for project in Project.query.all():
         project_owner = False
         if current_user.is_authenticated and (
@@ -194,8 +225,16 @@ def index():
         if project.hidden and not project_owner:
             continue
 
-        # Retrieve the amounts for this project
-        amounts = util.calculate_project_amounts(project.id)
+        projects.append(project)
+        project_owners[project.id] = project_owner
+
+    # Retrieve the amounts for all projects at once
+    all_amounts = totals.get_projects_amounts(projects)
+
+    # Retrieve data for each project
+    for project in projects:
+        project_owner = project_owners[project.id]
+        amounts = all_amounts[project.id]
         # Use budget for the awarded amount if available
         if project.budget:
             total_awarded += project.budget
@@ -217,7 +256,7 @@ def index():
             }
         )
 
-    return render_template(
+    page = render_template(
         'index.html',
         background=app.config['BACKGROUND'],
         use_square_borders=app.config['USE_SQUARE_BORDERS'],
@@ -231,6 +270,9 @@ def index():
         edit_admin_forms=edit_admin_forms,
         user_stories=UserStory.query.all()
     )
+    if use_page_cache:
+        page_cache.store('index', page, page_cache_generation)
+    return page
 
 
 @app.route("/project/<project_id>", methods=['GET', 'POST'])
@@ -374,6 +416,7 @@ def project(project_id):
                     alias_value=new_subproject_data['iban']
                 ).update({'subproject_id': subproject.id})
                 db.session.commit()
+            totals.refresh_project_totals([project.id])
             flash(
                 '<span class="text-default-green">Subproject "%s" is '
                 'toegevoegd</span>' % (
@@ -406,12 +449,26 @@ def project(project_id):
     if project.bunq_access_token:
         subproject_form.iban.choices = project.make_select_options()
 
+    subprojects = page_data.load_subprojects(project)
+    category_select_options = category_cache.get_all_category_select_options(
+        project.id, [subproject.id for subproject in subprojects]
+    )
+
     # Retrieve any subprojects a normal logged in user is part of
     user_subproject_ids = []
     if project.contains_subprojects and current_user.is_authenticated and not project_owner:
-        for subproject in project.subprojects:
-            if subproject.has_user(current_user.id):
-                user_subproject_ids.append(subproject.id)
+        user_subproject_ids = page_data.load_user_subproject_ids(
+            current_user.id, subprojects
+        )
+
+    # Large projects only render the payment table's rows one page at a
+    # time, see payment_table.py
+    payments_query = payment_table.project_payments_query(
+        project, project_owner, user_subproject_ids
+    )
+    server_side_table = payment_table.use_server_side_table(
+        payment_table.count(payments_query)
+    )
 
     new_payment_form = ''
     # Filled with all categories for each subproject; used by some JavaScript
@@ -425,8 +482,10 @@ def project(project_id):
         # Add subprojects that the user has access to
         if project.contains_subprojects:
             initialized_first_subproject_categories = False
-            for subproject in project.subprojects:
-                categories_dict[subproject.id] = subproject.make_category_select_options()
+            for subproject in subprojects:
+                categories_dict[subproject.id] = category_select_options[
+                    (project.id, subproject.id)
+                ]
                 new_payment_form.subproject_id.choices.append(
                     (subproject.id, subproject.name)
                 )
@@ -445,9 +504,15 @@ def project(project_id):
                 id=new_payment_form.subproject_id.data
             ).first()
             if tempsubproject:
-                new_payment_form.category_id.choices = tempsubproject.make_category_select_options()
+                new_payment_form.category_id.choices = (
+                    category_cache.get_category_select_options(
+                        tempsubproject.project_id, tempsubproject.id
+                    )
+                )
         else:
-            new_payment_form.category_id.choices = project.make_category_select_options()
+            new_payment_form.category_id.choices = (
+                category_cache.get_category_select_options(project.id)
+            )
 
 
         # Save new payment
@@ -478,6 +543,7 @@ def project(project_id):
             new_payment.updated = datetime.now()
             db.session.add(new_payment)
             db.session.commit()
+            totals.refresh_payment_totals([new_payment])
             flash(
                 '<span class="text-default-green">Transactie is toegevoegd</span>'
             )
@@ -489,40 +555,46 @@ def project(project_id):
 
     # Process/create (filled in) payment form
     payment_forms = {}
+    lazy_payment_form_ids = set()
     transaction_attachment_form = ''
     edit_attachment_forms = {}
     edit_attachment_form = ''
+    payment_views = None
+    if server_side_table:
+        payment_views = []
+
     if project_owner or user_subproject_ids:
         # Process filled in payment form
         payment_form_return = process_payment_form(request, project, project_owner, user_subproject_ids, is_subproject=False)
         if payment_form_return:
             return payment_form_return
 
+        if payment_views is None:
+            payment_views = page_data.load_payment_views(
+                payment_rows.load_payments(payments_query),
+                project_owner,
+                user_subproject_ids
+            )
+
         # Populate the payment forms which allows the user to edit it
         editable_payments = []
         editable_attachments = []
-        if project.contains_subprojects:
-            for subproject in project.subprojects:
-                if project_owner:
-                    editable_payments += subproject.payments
-                    for payment in subproject.payments:
-                        editable_attachments += payment.attachments
-                # If the user is not an admin/project owner then only allow it
-                # to edit payments from its subprojects
-                elif user_subproject_ids:
-                    for payment in subproject.payments:
-                        if payment.subproject_id in user_subproject_ids:
-                            editable_payments.append(payment)
-                            editable_attachments.append(payment.attachment)
+        for payment_view in payment_views:
+            # If the user is not an admin/project owner then only allow it
+            # to edit payments from its subprojects
+            if payment_view.can_edit:
+                editable_payments.append(payment_view.payment)
+                editable_attachments += payment_view.attachments
+
+        if use_lazy_payment_forms(len(editable_payments)):
+            lazy_payment_form_ids = set(
+                payment.id for payment in editable_payments
+            )
         else:
-            editable_payments = project.payments
-            for payment in project.payments:
-                editable_attachments += payment.attachments
-
-        payment_forms = create_payment_forms(
-            editable_payments,
-            project_owner
-        )
+            payment_forms = create_payment_forms(
+                editable_payments,
+                project_owner
+            )
 
         # Process new transaction attachment form
         transaction_attachment_form = TransactionAttachmentForm(
@@ -553,12 +625,12 @@ def project(project_id):
         # Fill in attachment form data which allow a user to edit it
         edit_attachment_forms = create_edit_attachment_forms(editable_attachments)
 
-    payments = []
-    if project.contains_subprojects:
-        for subproject in project.subprojects:
-            payments += subproject.payments
-    else:
-        payments += project.payments
+    if payment_views is None:
+        payment_views = page_data.load_payment_views(
+            payment_rows.load_payments(payments_query),
+            project_owner,
+            user_subproject_ids
+        )
 
     # Process filled in edit project owner form
     edit_project_owner_form = EditProjectOwnerForm(
@@ -725,6 +797,7 @@ def project(project_id):
 
                 projects.update(new_project_data)
                 db.session.commit()
+                totals.refresh_project_totals([changed_project.id])
 
                 flash(
                     '<span class="text-default-green">Project "%s" is '
@@ -839,7 +912,7 @@ def project(project_id):
             )
 
     # Retrieve the amounts for this project
-    amounts = util.calculate_project_amounts(project.id)
+    amounts = totals.get_project_amounts(project)
 
     project_data = {
         'id': project.id,
@@ -867,6 +940,18 @@ def project(project_id):
     if project.budget:
         budget = util.format_currency(project.budget)
 
+    # Show project owners what is happening in the background, e.g., the
+    # retrieval of payments after linking a Bunq account
+    project_jobs = []
+    if project_owner:
+        project_jobs = jobs.get_project_jobs(project.id)
+
+    category_filter_options = []
+    if server_side_table:
+        category_filter_options = payment_table.get_category_filter_options(
+            category_select_options, subprojects
+        )
+
     return render_template(
         'project.html',
         use_square_borders=app.config['USE_SQUARE_BORDERS'],
@@ -875,7 +960,13 @@ def project(project_id):
         project_data=project_data,
         amounts=amounts,
         budget=budget,
-        payments=payments,
+        subprojects=subprojects,
+        payment_views=payment_views,
+        all_media=payment_table.load_all_attachments(payments_query),
+        server_side_table=server_side_table,
+        category_filter_options=category_filter_options,
+        show_subproject=project.contains_subprojects,
+        lazy_payment_form_ids=lazy_payment_form_ids,
         project_form=project_form,
         edit_project_owner_forms=edit_project_owner_forms,
         add_user_form=AddUserForm(prefix='add_user_form'),
@@ -889,10 +980,12 @@ def project(project_id):
         new_funder_form=FunderForm(prefix="funder_form"),
         project_owner=project_owner,
         user_subproject_ids=user_subproject_ids,
-        timestamp=util.get_export_timestamp(),
         server_name=app.config['SERVER_NAME'],
         bunq_client_id=app.config['BUNQ_CLIENT_ID'],
-        base_url_auth=base_url_auth
+        base_url_auth=base_url_auth,
+        project_jobs=project_jobs,
+        job_descriptions=jobs.JOB_DESCRIPTIONS,
+        job_status_descriptions=jobs.JOB_STATUS_DESCRIPTIONS
     )
 
 
@@ -946,6 +1039,7 @@ def subproject(project_id, subproject_id):
     if subproject_form.remove.data:
         Subproject.query.filter_by(id=subproject_form.id.data).delete()
         db.session.commit()
+        totals.refresh_project_totals([project_id])
         flash(
             '<span class="text-default-green">Subproject "%s" is verwijderd</span>' % (
                 subproject_form.name.data
@@ -1010,6 +1104,7 @@ def subproject(project_id, subproject_id):
 
                 subprojects.update(new_subproject_data)
                 db.session.commit()
+                totals.refresh_project_totals([changed_subproject.project_id])
                 flash(
                     '<span class="text-default-green">Subproject "%s" is '
                     'bijgewerkt</span>' % (
@@ -1077,7 +1172,11 @@ def subproject(project_id, subproject_id):
         # if the selected value is valid. We don't know the subproject in the
         # case of an edited payment on a project page which contains subprojects,
         # so we need to retrieve this before running validate_on_submit
-        new_payment_form.category_id.choices = subproject.make_category_select_options()
+        new_payment_form.category_id.choices = (
+            category_cache.get_category_select_options(
+                subproject.project_id, subproject.id
+            )
+        )
 
         # Save new payment
         if new_payment_form.validate_on_submit():
@@ -1101,6 +1200,7 @@ def subproject(project_id, subproject_id):
             new_payment.updated = datetime.now()
             db.session.add(new_payment)
             db.session.commit()
+            totals.refresh_project_totals([subproject.project_id])
             flash(
                 '<span class="text-default-green">Transactie is toegevoegd</span>'
             )
@@ -1115,13 +1215,38 @@ def subproject(project_id, subproject_id):
     if payment_form_return:
         return payment_form_return
 
+    # Large subprojects only render the payment table's rows one page at a
+    # time, see payment_table.py
+    payments_query = payment_table.subproject_payments_query(
+        subproject, project_owner, user_subproject_ids
+    )
+    server_side_table = payment_table.use_server_side_table(
+        payment_table.count(payments_query)
+    )
+    if server_side_table:
+        payment_views = []
+    else:
+        payment_views = page_data.load_payment_views(
+            payment_rows.load_payments(payments_query),
+            project_owner,
+            user_subproject_ids
+        )
+    payments = [payment_view.payment for payment_view in payment_views]
+
     # Populate the payment forms which allows the user to edit it
     payment_forms = {}
+    lazy_payment_form_ids = set()
     if project_owner or user_in_subproject:
-        payment_forms = create_payment_forms(
-            subproject.payments,
-            project_owner
-        )
+        if use_lazy_payment_forms(len(payments)):
+            lazy_payment_form_ids = set(payment.id for payment in payments)
+        else:
+            category_cache.get_all_category_select_options(
+                subproject.project_id, [subproject.id]
+            )
+            payment_forms = create_payment_forms(
+                payments,
+                project_owner
+            )
 
     # Process filled in category form
     category_form_return = process_category_form(request)
@@ -1271,22 +1396,42 @@ def subproject(project_id, subproject_id):
             return edit_attachment_form_return
 
         # Fill in attachment form data which allow a user to edit it
-        attachments = []
-        for payment in subproject.payments:
-            attachments += payment.attachments
-        edit_attachment_forms = create_edit_attachment_forms(attachments)
+        edit_attachment_forms = create_edit_attachment_forms(
+            [
+                attachment
+                for payment_view in payment_views
+                for attachment in payment_view.attachments
+            ]
+        )
 
     # Retrieve the amounts for this subproject
-    amounts = util.calculate_subproject_amounts(subproject_id)
+    amounts = totals.get_subproject_amounts(subproject)
 
     budget = ''
     if subproject.budget:
         budget = util.format_currency(subproject.budget)
+
+    category_filter_options = []
+    if server_side_table:
+        category_filter_options = payment_table.get_category_filter_options({
+            (subproject.project_id, subproject.id): (
+                category_cache.get_category_select_options(
+                    subproject.project_id, subproject.id
+                )
+            )
+        })
+
     return render_template(
         'subproject.html',
         use_square_borders=app.config['USE_SQUARE_BORDERS'],
         footer=app.config['FOOTER'],
         subproject=subproject,
+        payment_views=payment_views,
+        all_media=payment_table.load_all_attachments(payments_query),
+        server_side_table=server_side_table,
+        category_filter_options=category_filter_options,
+        show_subproject=False,
+        lazy_payment_form_ids=lazy_payment_form_ids,
         amounts=amounts,
         budget=budget,
         subproject_form=subproject_form,
@@ -1298,7 +1443,6 @@ def subproject(project_id, subproject_id):
         add_user_form=AddUserForm(prefix='add_user_form'),
         project_owner=project_owner,
         user_in_subproject=user_in_subproject,
-        timestamp=util.get_export_timestamp(),
         category_forms=category_forms,
         category_form=CategoryForm(
             prefix="category_form",
@@ -1325,11 +1469,267 @@ def meest_gestelde_vragen():
         footer=app.config['FOOTER']
     )
 
-@app.route('/upload/<filename>')
+@app.route('/upload/<path:filename>')
 def upload(filename):
-    return send_from_directory(
-        app.config['UPLOAD_FOLDER'], filename
+    return uploads.send_upload(filename)
+
+
+@app.route(
+    '/thumbnail/<int:width>/<any(webp, jpeg):image_format>/<path:filename>'
+)
+def thumbnail(width, image_format, filename):
+    if width not in thumbnails.THUMBNAIL_WIDTHS:
+        abort(404)
+    return thumbnails.send_thumbnail(filename, width, image_format)
+
+
+# Returns the edit form of a single payment as an HTML fragment, used by the
+# payment tables when the forms are loaded on demand (see
+# use_lazy_payment_forms). The form is submitted to the page it is shown on.
+@app.route("/transactie/<int:payment_id>/formulier", methods=['GET'])
+def payment_form(payment_id):
+    payment = Payment.query.get(payment_id)
+    if not payment:
+        abort(404)
+
+    project = payment.project
+    if payment.subproject:
+        project = payment.subproject.project
+    if not project or not current_user.is_authenticated:
+        abort(404)
+
+    # Same permissions as on the project and subproject pages: project owners
+    # can edit all payments, other users only those of their subprojects
+    project_owner = current_user.admin or project.has_user(current_user.id)
+    if not project_owner and not (
+            payment.subproject
+            and payment.subproject.has_user(current_user.id)):
+        abort(404)
+
+    return render_template(
+        'partials/payment_form.html',
+        payment=payment,
+        payment_form=create_payment_forms([payment], project_owner)[
+            payment.id
+        ],
+        project_owner=project_owner,
+        show_subproject=project.contains_subprojects,
+        lazy_payment_form=True
+    )
+
+
+# Returns one page of a payment table in bootstrap-table's server-side format
+# (see payment_table.py). Each row contains the HTML of its detail view; edit
+# forms are loaded on demand via the 'payment_form' route.
+def _payment_table_json(payments_query, project_owner, user_subproject_ids,
+                        show_subproject):
+    table_args = _parse_table_args()
+    filtered_query = payment_table.filter_payments(payments_query, table_args)
+    payment_views = page_data.load_payment_views(
+        payment_table.get_page(filtered_query, table_args),
+        project_owner,
+        user_subproject_ids
+    )
+
+    # If the user is not an admin/project owner then only allow it to edit
+    # payments from its subprojects
+    editable_payment_ids = set(
+        payment_view.payment.id
+        for payment_view in payment_views
+        if payment_view.can_edit
     )
+    transaction_attachment_form = ''
+    if editable_payment_ids:
+        transaction_attachment_form = TransactionAttachmentForm(
+            prefix="transaction_attachment_form"
+        )
+    edit_attachment_forms = create_edit_attachment_forms(
+        [
+            attachment
+            for payment_view in payment_views if payment_view.can_edit
+            for attachment in payment_view.attachments
+        ]
+    )
+
+    rows = []
+    for payment_view in payment_views:
+        payment = payment_view.payment
+        detail = render_template(
+            'partials/payment_detail.html',
+            payment=payment,
+            bonnen=payment_view.bonnen,
+            media=payment_view.media,
+            can_edit_payment=payment_view.can_edit,
+            payment_forms={},
+            lazy_payment_form_ids=editable_payment_ids,
+            lazy_payment_form=True,
+            transaction_attachment_form=transaction_attachment_form,
+            edit_attachment_forms=edit_attachment_forms,
+            project_owner=project_owner,
+            show_subproject=show_subproject
+        )
+        rows.append(
+            payment_table.payment_to_row(payment_view, detail)
+        )
+
+    return jsonify(
+        total=payment_table.count(filtered_query),
+        totalNotFiltered=payment_table.count(payments_query),
+        rows=rows
+    )
+
+
+# Returns a project together with the query of the payments the current user
+# can see on its page, the same permissions as on the project page. Aborts
+# with a 404 if the user can't see the project.
+def _get_project_payments(project_id):
+    project = Project.query.get(project_id)
+    if not project:
+        abort(404)
+
+    project_owner = current_user.is_authenticated and (
+        current_user.admin or project.has_user(current_user.id)
+    )
+    if project.hidden and not project_owner:
+        abort(404)
+
+    user_subproject_ids = []
+    if project.contains_subprojects and current_user.is_authenticated and not project_owner:
+        user_subproject_ids = page_data.load_user_subproject_ids(
+            current_user.id, page_data.load_subprojects(project)
+        )
+
+    payments_query = payment_table.project_payments_query(
+        project, project_owner, user_subproject_ids
+    )
+    return project, payments_query, project_owner, user_subproject_ids
+
+
+# Same as _get_project_payments, but for a subproject
+def _get_subproject_payments(project_id, subproject_id):
+    subproject = Subproject.query.get(subproject_id)
+    if not subproject or subproject.project_id != project_id:
+        abort(404)
+
+    user_in_subproject = current_user.is_authenticated and subproject.has_user(
+        current_user.id
+    )
+    project_owner = current_user.is_authenticated and (
+        current_user.admin or subproject.project.has_user(current_user.id)
+    )
+    if subproject.hidden and not project_owner and not user_in_subproject:
+        abort(404)
+
+    user_subproject_ids = []
+    if user_in_subproject and not project_owner:
+        user_subproject_ids.append(subproject.id)
+
+    payments_query = payment_table.subproject_payments_query(
+        subproject, project_owner, user_subproject_ids
+    )
+    return subproject, payments_query, project_owner, user_subproject_ids
+
+
+def _parse_table_args():
+    try:
+        return payment_table.parse_table_args(request.args)
+    except ValueError:
+        abort(400)
+
+
+@app.route("/project/<int:project_id>/payments.json", methods=['GET'])
+def project_payments_json(project_id):
+    project, payments_query, project_owner, user_subproject_ids = (
+        _get_project_payments(project_id)
+    )
+    return _payment_table_json(
+        payments_query,
+        project_owner,
+        user_subproject_ids,
+        project.contains_subprojects
+    )
+
+
+@app.route(
+    "/project/<int:project_id>/subproject/<int:subproject_id>/payments.json",
+    methods=['GET']
+)
+def subproject_payments_json(project_id, subproject_id):
+    subproject, payments_query, project_owner, user_subproject_ids = (
+        _get_subproject_payments(project_id, subproject_id)
+    )
+    return _payment_table_json(
+        payments_query, project_owner, user_subproject_ids, False
+    )
+
+
+# Streams the payments of a project as a CSV, XLSX or JSON file, filtered
+# and sorted like the payment table
+@app.route(
+    "/project/<int:project_id>/export.<any(csv, xlsx, json):export_format>",
+    methods=['GET']
+)
+def project_export(project_id, export_format):
+    project, payments_query, _, _ = _get_project_payments(project_id)
+    return export.export_payments(
+        payments_query,
+        _parse_table_args(),
+        project.contains_subprojects,
+        export_format,
+        '%s-%s' % (
+            util.get_export_timestamp(), project.name.replace(' ', '_')
+        )
+    )
+
+
+@app.route(
+    "/project/<int:project_id>/subproject/<int:subproject_id>/"
+    "export.<any(csv, xlsx, json):export_format>",
+    methods=['GET']
+)
+def subproject_export(project_id, subproject_id, export_format):
+    subproject, payments_query, _, _ = _get_subproject_payments(
+        project_id, subproject_id
+    )
+    return export.export_payments(
+        payments_query,
+        _parse_table_args(),
+        False,
+        export_format,
+        '%s-%s-%s' % (
+            util.get_export_timestamp(),
+            subproject.project.name.replace(' ', '_'),
+            subproject.name.replace(' ', '_')
+        )
+    )
+
+
+# Receives the callbacks Bunq sends for new mutations on the monetary
+# accounts of a project, see bunq_callbacks.register_callbacks
+@app.route("/bunq-callback/<int:project_id>/<token>", methods=['POST'])
+def bunq_callback(project_id, token):
+    if not bunq_callbacks.is_valid_callback_token(project_id, token):
+        abort(404)
+
+    body = request.get_data()
+    if not bunq_callbacks.is_valid_signature(
+            project_id,
+            body,
+            request.headers.get(bunq_callbacks.SERVER_SIGNATURE_HEADER)):
+        app.logger.warn(
+            'Project %s: received Bunq callback with an invalid '
+            'signature' % (project_id)
+        )
+        abort(403)
+
+    # Save the payment in the background, so Bunq gets its response right
+    # away
+    payment = bunq_callbacks.get_callback_payment(body)
+    if payment:
+        jobs.enqueue(
+            jobs.JOB_SAVE_CALLBACK_PAYMENT, project_id, payment=payment
+        )
+    return '', 200
 
 
 @app.route("/reset-wachtwoord-verzoek", methods=['GET', 'POST'])
@@ -0,0 +1,206 @@
+from mimetypes import guess_type
+from tempfile import TemporaryFile
+from uuid import uuid4
+import os
+import shutil
+
+from botocore.exceptions import ClientError
+from flask import abort, redirect, send_file
+from werkzeug.security import safe_join
+from werkzeug.urls import url_quote
+import boto3
+
+from app import app
+
+
+# Storage of uploaded files. Files are identified by a key, their path
+# relative to the storage (e.g., 'transaction-attachment/<sha256>.pdf').
+# STORAGE_BACKEND selects where they are kept:
+#  - 'local' (default): in UPLOAD_FOLDER on the local disk, which all app
+#    processes (and nginx) need to share
+#  - 's3': in the S3_BUCKET bucket of an S3 compatible object store (e.g.,
+#    MinIO when S3_ENDPOINT_URL is set), so multiple app nodes can run
+#    without a shared disk. Downloads are redirected to a presigned URL of
+#    the object store.
+#
+# Both backends stream files in chunks when reading and writing, so the
+# memory used doesn't depend on the size of the files.
+
+
+# Number of bytes read and written at a time
+CHUNK_SIZE = 64 * 1024
+
+
+def _get_mimetype(key):
+    return guess_type(key)[0] or 'application/octet-stream'
+
+
+# Returns whether key is a relative path within the storage (e.g., no
+# '../')
+def is_valid_key(key):
+    return bool(key) and safe_join('.', key) is not None
+
+
+# Returns the absolute path of UPLOAD_FOLDER, which is relative to the
+# directory containing the app and instance folders
+def get_upload_folder():
+    return os.path.abspath(
+        os.path.join(app.instance_path, '..', app.config['UPLOAD_FOLDER'])
+    )
+
+
+class LocalStorage:
+    def _get_path(self, key):
+        if not is_valid_key(key):
+            raise ValueError('Invalid storage key "%s"' % key)
+        return os.path.join(get_upload_folder(), key)
+
+    def exists(self, key):
+        return os.path.isfile(self._get_path(key))
+
+    # Write the content of the file object stream to key. The file is
+    # written to a temporary file first, so it's never read half written.
+    def save(self, key, stream):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_path = '%s.%s' % (path, uuid4().hex)
+        try:
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, CHUNK_SIZE)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # Move the file at key to new_key, replacing any file at new_key
+    def rename(self, key, new_key):
+        new_path = self._get_path(new_key)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(self._get_path(key), new_path)
+
+    def remove(self, key):
+        os.remove(self._get_path(key))
+
+    # Returns a binary file object to read key from; raises
+    # FileNotFoundError if it doesn't exist
+    def open(self, key):
+        return open(self._get_path(key), 'rb')
+
+    # Returns the response sending key to the visitor. If
+    # UPLOAD_X_ACCEL_REDIRECT is set the file is sent by nginx (see
+    # docker/nginx/conf.d/default.conf), so no uWSGI process is busy during
+    # the download.
+    def send(self, key, cache_control):
+        if not self.exists(key):
+            abort(404)
+
+        x_accel_redirect = app.config.get('UPLOAD_X_ACCEL_REDIRECT')
+        if x_accel_redirect:
+            # nginx keeps the Content-Type and Cache-Control headers of this
+            # response and replaces the body with the file
+            response = app.response_class(mimetype=_get_mimetype(key))
+            response.headers['X-Accel-Redirect'] = url_quote(
+                x_accel_redirect.rstrip('/') + '/' + key
+            )
+        else:
+            response = send_file(self._get_path(key), conditional=True)
+
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+
+class S3Storage:
+    def __init__(self):
+        self.bucket = app.config['S3_BUCKET']
+        self.client = boto3.client(
+            's3',
+            endpoint_url=app.config.get('S3_ENDPOINT_URL'),
+            region_name=app.config.get('S3_REGION'),
+            aws_access_key_id=app.config.get('S3_ACCESS_KEY_ID'),
+            aws_secret_access_key=app.config.get('S3_SECRET_ACCESS_KEY')
+        )
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+        return True
+
+    # Write the content of the file object stream to key, using a multipart
+    # upload for large files. Objects only become visible once complete.
+    def save(self, key, stream):
+        self.client.upload_fileobj(
+            stream,
+            self.bucket,
+            key,
+            ExtraArgs={'ContentType': _get_mimetype(key)}
+        )
+
+    # Move the object at key to new_key, replacing any object at new_key. The
+    # object store has no rename, so the object is copied and then removed.
+    def rename(self, key, new_key):
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': key},
+            self.bucket,
+            new_key,
+            ExtraArgs={'ContentType': _get_mimetype(new_key)}
+        )
+        self.remove(key)
+
+    def remove(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    # Returns a binary file object to read key from; raises
+    # FileNotFoundError if it doesn't exist. The object is downloaded to a
+    # temporary file, as e.g. Pillow needs to seek in it.
+    def open(self, key):
+        f = TemporaryFile()
+        try:
+            self.client.download_fileobj(self.bucket, key, f)
+        except ClientError as e:
+            f.close()
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key)
+            raise
+        f.seek(0)
+        return f
+
+    # Returns a redirect to a presigned URL of key, so the object store sends
+    # the file. The redirect is cached for half the time the URL is valid,
+    # which lets browsers reuse their cached copy of the file.
+    def send(self, key, cache_control):
+        expires_in = app.config.get('S3_PRESIGNED_URL_EXPIRY', 3600)
+        response = redirect(
+            self.client.generate_presigned_url(
+                'get_object',
+                Params={
+                    'Bucket': self.bucket,
+                    'Key': key,
+                    'ResponseCacheControl': cache_control
+                },
+                ExpiresIn=expires_in
+            )
+        )
+        response.headers['Cache-Control'] = 'private, max-age=%s' % (
+            expires_in // 2
+        )
+        return response
+
+
+_backends = {
+    'local': LocalStorage,
+    's3': S3Storage
+}
+_storages = {}
+
+
+# Returns the storage selected by STORAGE_BACKEND
+def get_storage():
+    backend = app.config.get('STORAGE_BACKEND', 'local')
+    if backend not in _storages:
+        _storages[backend] = _backends[backend]()
+    return _storages[backend]
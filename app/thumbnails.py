@@ -0,0 +1,149 @@
+from io import BytesIO
+import mimetypes
+import os
+
+from flask import abort, url_for
+from PIL import Image, ImageOps
+
+from app import app, db, storage, uploads
+from app.models import File
+
+
+# Downscaled versions of uploaded images, which pages show instead of the
+# (often multiple megabytes large) originals. Every image gets a WebP
+# thumbnail (for browsers that support it) and a JPEG thumbnail in each of
+# THUMBNAIL_WIDTHS, stored in the 'thumbnails' folder of the storage (see
+# storage.py).
+#
+# Thumbnails are created by a job after the upload (see jobs.py) or, if a
+# thumbnail is requested before that (e.g., for images uploaded before
+# thumbnails existed), when it is first requested. File.thumbnails records
+# whether they were created (True) or the file can't be read as an image
+# (False).
+
+
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True})
+}
+# Mimetypes shown as images on the pages
+IMAGE_MIMETYPES = ('image/jpeg', 'image/jpg', 'image/png')
+
+# Not known to the mimetypes module of all Python versions
+mimetypes.add_type('image/webp', '.webp')
+
+
+# Returns the storage key of a thumbnail. filename is the storage key of the
+# original, e.g.,
+# 'user-image/2020-01-01T12:00:00_foto.jpg'.
+def get_thumbnail_filename(filename, width, image_format):
+    return os.path.join(
+        'thumbnails', str(width), '%s.%s' % (filename, image_format)
+    )
+
+
+def _save(image, filename, image_format):
+    pil_format, options = THUMBNAIL_FORMATS[image_format]
+    thumbnail = BytesIO()
+    image.save(thumbnail, pil_format, **options)
+    thumbnail.seek(0)
+    storage.get_storage().save(filename, thumbnail)
+
+
+# Create all thumbnails of an uploaded image. folder is the folder in the
+# storage the file was saved in (e.g., 'transaction-attachment').
+# Returns whether the thumbnails were created.
+def create_thumbnails(file, folder):
+    filename = os.path.join(folder, file.filename)
+    try:
+        with storage.get_storage().open(filename) as f, Image.open(f) as image:
+            # Phones store the rotation of photos in EXIF data
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        app.logger.warning(
+            'Could not create thumbnails of "%s": %s' % (filename, repr(e))
+        )
+        file.thumbnails = False
+        db.session.commit()
+        return False
+
+    # JPEG has no transparency, so use a white background
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        jpeg_image = Image.new('RGB', image.size, (255, 255, 255))
+        jpeg_image.paste(image, mask=image.split()[3])
+    else:
+        image = image.convert('RGB')
+        jpeg_image = image
+
+    for width in THUMBNAIL_WIDTHS:
+        # Images are never enlarged
+        size = (width, width * image.height // image.width or 1)
+        for image_format in THUMBNAIL_FORMATS:
+            thumbnail = image if image_format == 'webp' else jpeg_image
+            if thumbnail.width > width:
+                thumbnail = thumbnail.resize(size, Image.LANCZOS)
+            _save(
+                thumbnail,
+                get_thumbnail_filename(filename, width, image_format),
+                image_format
+            )
+
+    file.thumbnails = True
+    db.session.commit()
+    return True
+
+
+def create_file_thumbnails(file_id, folder):
+    file = File.query.get(file_id)
+    if file:
+        create_thumbnails(file, folder)
+
+
+# Returns whether pages should show thumbnails of the file instead of the
+# original
+@app.template_global()
+def has_thumbnails(file):
+    return file.mimetype in IMAGE_MIMETYPES and file.thumbnails is not False
+
+
+# Returns the srcset attribute with the thumbnails of the file in
+# image_format, to be used in templates
+@app.template_global()
+def thumbnail_srcset(folder, file, image_format):
+    return ', '.join(
+        '%s %sw' % (
+            url_for(
+                'thumbnail',
+                width=width,
+                image_format=image_format,
+                filename=os.path.join(folder, file.filename)
+            ),
+            width
+        )
+        for width in THUMBNAIL_WIDTHS
+    )
+
+
+# Returns the response for a thumbnail, creating the thumbnails of the
+# original first if needed. The original is sent if it has no thumbnails.
+def send_thumbnail(filename, width, image_format):
+    if not storage.is_valid_key(filename):
+        abort(404)
+
+    thumbnail_filename = get_thumbnail_filename(filename, width, image_format)
+    if not storage.get_storage().exists(thumbnail_filename):
+        file = File.query.filter_by(
+            filename=os.path.basename(filename)
+        ).first()
+        if not file:
+            abort(404)
+        # Check access before doing any work for the visitor
+        uploads.check_access(filename)
+        if file.thumbnails is False or not create_thumbnails(
+                file, os.path.dirname(filename)):
+            return uploads.send_upload(filename)
+
+    return uploads.send_upload(thumbnail_filename, original=filename)
@@ -0,0 +1,185 @@
+from datetime import datetime
+
+from app import app, db, aggregation, util
+from app.models import Project, Subproject, ProjectTotals, SubprojectTotals
+
+
+# The amounts awarded and spent per (sub)project are stored in the
+# project_totals and subproject_totals tables. Every piece of code that adds,
+# removes or relinks payments (or changes the IBAN of a (sub)project, which
+# changes which payments are counted) needs to call refresh_project_totals
+# for the affected projects. The pages then only read one row per
+# (sub)project instead of summing all payments on every request.
+
+
+# Returns the ids of the projects the given payments count towards
+def get_payment_project_ids(payments):
+    project_ids = set()
+    for payment in payments:
+        if payment.project_id:
+            project_ids.add(payment.project_id)
+        if payment.subproject_id and payment.subproject:
+            project_ids.add(payment.subproject.project_id)
+    return project_ids
+
+
+# Recalculate the stored totals of the given projects and of all their
+# subprojects
+def refresh_project_totals(project_ids):
+    project_ids = set([int(project_id) for project_id in project_ids if project_id])
+    if not project_ids:
+        return
+
+    projects = Project.query.filter(Project.id.in_(project_ids)).all()
+    subprojects = Subproject.query.filter(
+        Subproject.project_id.in_(project_ids)
+    ).all()
+    now = datetime.now(app.config['TZ'])
+
+    for project_id, (awarded, spent) in aggregation.calculate_projects_sums(
+            projects).items():
+        db.session.merge(
+            ProjectTotals(
+                project_id=project_id,
+                awarded=awarded,
+                spent=spent,
+                updated=now
+            )
+        )
+
+    subproject_project_ids = {
+        subproject.id: subproject.project_id for subproject in subprojects
+    }
+    for subproject_id, (awarded, spent) in aggregation.calculate_subprojects_sums(
+            subprojects).items():
+        db.session.merge(
+            SubprojectTotals(
+                subproject_id=subproject_id,
+                project_id=subproject_project_ids[subproject_id],
+                awarded=awarded,
+                spent=spent,
+                updated=now
+            )
+        )
+
+    db.session.commit()
+
+
+# Recalculate the stored totals of the projects the given payments belong to
+def refresh_payment_totals(payments):
+    refresh_project_totals(get_payment_project_ids(payments))
+
+
+# Remove all stored totals and calculate them again for all projects
+def rebuild_totals():
+    SubprojectTotals.query.delete()
+    ProjectTotals.query.delete()
+    db.session.commit()
+
+    refresh_project_totals([project.id for project in Project.query.all()])
+
+
+# Compare the stored totals with the live calculation in util and return a
+# list of human readable differences (an empty list means all is fine). The
+# amounts are exact decimals, so by default they have to match exactly.
+def verify_totals(tolerance=0):
+    differences = []
+
+    project_totals = {t.project_id: t for t in ProjectTotals.query.all()}
+    for project in Project.query.all():
+        stored = project_totals.get(project.id)
+        if not stored:
+            differences.append('Project %s: no stored totals' % project.id)
+            continue
+        amounts = util.calculate_project_amounts(project.id)
+        for field in ['awarded', 'spent']:
+            if abs(getattr(stored, field) - amounts[field]) > tolerance:
+                differences.append(
+                    'Project %s: stored %s is %s, calculated %s is %s' % (
+                        project.id,
+                        field,
+                        getattr(stored, field),
+                        field,
+                        amounts[field]
+                    )
+                )
+
+    subproject_totals = {
+        t.subproject_id: t for t in SubprojectTotals.query.all()
+    }
+    for subproject in Subproject.query.filter(
+            Subproject.project_id.isnot(None)):
+        stored = subproject_totals.get(subproject.id)
+        if not stored:
+            differences.append(
+                'Subproject %s: no stored totals' % subproject.id
+            )
+            continue
+        amounts = util.calculate_subproject_amounts(subproject.id)
+        for field in ['awarded', 'spent']:
+            if abs(getattr(stored, field) - amounts[field]) > tolerance:
+                differences.append(
+                    'Subproject %s: stored %s is %s, calculated %s is %s' % (
+                        subproject.id,
+                        field,
+                        getattr(stored, field),
+                        field,
+                        amounts[field]
+                    )
+                )
+
+    return differences
+
+
+# Retrieve the amounts of multiple projects from the stored totals. Returns
+# a dict of project_id -> amounts in the same shape as
+# util.calculate_project_amounts. Missing totals are calculated and stored.
+def get_projects_amounts(projects):
+    projects = list(projects)
+    if not projects:
+        return {}
+    project_ids = [project.id for project in projects]
+
+    totals = {
+        t.project_id: t for t in ProjectTotals.query.filter(
+            ProjectTotals.project_id.in_(project_ids)
+        )
+    }
+    missing_project_ids = [
+        project_id for project_id in project_ids if project_id not in totals
+    ]
+    if missing_project_ids:
+        refresh_project_totals(missing_project_ids)
+        totals.update({
+            t.project_id: t for t in ProjectTotals.query.filter(
+                ProjectTotals.project_id.in_(missing_project_ids)
+            )
+        })
+
+    return {
+        project.id: aggregation.format_project_amounts(
+            project, totals[project.id].awarded, totals[project.id].spent
+        )
+        for project in projects
+    }
+
+
+def get_project_amounts(project):
+    return get_projects_amounts([project])[project.id]
+
+
+# Retrieve the amounts of a subproject from the stored totals in the same
+# shape as util.calculate_subproject_amounts
+def get_subproject_amounts(subproject):
+    totals = SubprojectTotals.query.get(subproject.id)
+    if not totals:
+        refresh_project_totals([subproject.project_id])
+        totals = SubprojectTotals.query.get(subproject.id)
+
+    # Subprojects which are not linked to a project have no stored totals
+    if not totals:
+        return aggregation.calculate_subproject_amounts(subproject.id)
+
+    return aggregation.format_subproject_amounts(
+        subproject, totals.awarded, totals.spent
+    )
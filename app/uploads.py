@@ -0,0 +1,132 @@
+from uuid import uuid4
+import hashlib
+import os
+
+from flask import abort
+from flask_login import current_user
+from werkzeug.utils import secure_filename
+
+from app import storage
+from app.models import File, Payment, payment_attachment
+
+
+# Saving and serving of uploaded files (payment attachments and images). The
+# app only checks whether the visitor may see the file; the file itself is
+# sent by nginx or the object store (see storage.py).
+#
+# Uploaded files are stored by content: the filename is the SHA-256 digest
+# of the file (plus its extension). Files with the same content are saved
+# only once, and a file never changes, so browsers may cache them without
+# revalidating. Older uploads have a timestamped filename and are never
+# changed either.
+
+
+# One year, the maximum recommended by RFC 7234
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Folder of the payment attachments, the only uploads which can be hidden
+PAYMENT_ATTACHMENT_FOLDER = 'transaction-attachment'
+
+
+# Reads a file object while computing the SHA-256 digest of what was read
+class _HashingReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.sha256.update(chunk)
+        return chunk
+
+
+# Save an uploaded file (a werkzeug FileStorage) in folder (e.g.,
+# 'transaction-attachment'). The upload is hashed while it is written to a
+# temporary key, which is then renamed to its content address, or removed if
+# a file with the same content already exists. Returns the filename, the hex
+# digest and whether the file was new.
+def save_upload(f, folder):
+    upload_storage = storage.get_storage()
+    reader = _HashingReader(f.stream)
+    temp_key = '%s/%s.upload' % (folder, uuid4().hex)
+    upload_storage.save(temp_key, reader)
+
+    digest = reader.sha256.hexdigest()
+    extension = os.path.splitext(secure_filename(f.filename))[1].lower()
+    filename = digest + extension
+
+    key = '%s/%s' % (folder, filename)
+    created = not upload_storage.exists(key)
+    if created:
+        upload_storage.rename(temp_key, key)
+    else:
+        upload_storage.remove(temp_key)
+
+    return filename, digest, created
+
+
+def _get_project(payment):
+    if payment.subproject:
+        return payment.subproject.project
+    return payment.project
+
+
+# Returns whether anonymous visitors may see the payment
+def _is_public_payment(payment):
+    project = _get_project(payment)
+    return bool(project) and not (
+        project.hidden
+        or payment.hidden
+        or (payment.subproject and payment.subproject.hidden)
+    )
+
+
+# Returns whether the current user may see the payment, following the same
+# rules as the project and subproject pages and their payment tables
+def _can_view_payment(payment):
+    project = _get_project(payment)
+    if not project or not current_user.is_authenticated:
+        return False
+    if current_user.admin or project.has_user(current_user.id):
+        return True
+    if project.hidden or not payment.subproject:
+        return False
+    return payment.subproject.has_user(current_user.id)
+
+
+# Returns whether the upload may be cached by anyone ('public') or only by
+# the browser of the current user ('private'). Aborts with a 404 if the
+# current user may not see it. Only payment attachments can be hidden; an
+# attachment is visible if one of its payments is. Files in other folders
+# (e.g., user images) may have the same filename, so the folder is checked
+# first.
+def check_access(filename):
+    folder, _, basename = filename.rpartition('/')
+    if folder != PAYMENT_ATTACHMENT_FOLDER:
+        return 'public'
+
+    payments = Payment.query.join(
+        payment_attachment
+    ).join(
+        File
+    ).filter(
+        File.filename == basename
+    ).all()
+    if not payments or any(_is_public_payment(p) for p in payments):
+        return 'public'
+    if any(_can_view_payment(p) for p in payments):
+        return 'private'
+    abort(404)
+
+
+# Returns the response for the uploaded file at filename (its storage key).
+# For files derived from an upload (e.g., thumbnails), pass the upload as
+# original to check access to it instead.
+def send_upload(filename, original=None):
+    if not storage.is_valid_key(filename):
+        abort(404)
+
+    cache_control = '%s, max-age=%s, immutable' % (
+        check_access(original or filename), CACHE_MAX_AGE
+    )
+    return storage.get_storage().send(filename, cache_control)
@@ -1,28 +1,38 @@
 from babel.numbers import format_percent
 from flask import flash, redirect, url_for
 from os import urandom
-from os.path import abspath, dirname, exists, join
 from datetime import datetime
-from time import sleep
 import json
 import jwt
 import locale
 import os
 import requests
 import socket
-import sys
 
-from app import app, db
+from app import app, db, bunq_contexts, jobs, rate_limit, totals
 from app.email import send_invite
-from app.models import Payment, Project, Subproject, IBAN, User
+from app.models import (
+    Payment, Project, Subproject, IBAN, User, MonetaryAccountSyncState
+)
 
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from sqlalchemy.exc import IntegrityError
 from bunq.sdk.context.bunq_context import ApiContext
 from bunq.sdk.context.api_environment_type import ApiEnvironmentType
+from bunq.sdk.exception.too_many_requests_exception import (
+    TooManyRequestsException
+)
 from bunq.sdk.model.generated import endpoint
 
-sys.path.insert(0, abspath(join(dirname(__file__), '../tinker/tinker')))
-from libs.bunq_lib import BunqLib
+
+# Number of payments to retrieve per Bunq API request (200 is the maximum
+# allowed by Bunq)
+BUNQ_PAYMENTS_PAGE_SIZE = 200
+
+# Bunq allows max 3 (GET) requests per 3 seconds per API context
+BUNQ_RATE_LIMIT_REQUESTS = 3
+BUNQ_RATE_LIMIT_PERIOD = 3
 
 
 # Process Bunq OAuth callback (this will redirect to the project page)
@@ -91,12 +101,9 @@ def process_bunq_oauth_callback(request, current_user):
                     project.set_bunq_access_token(bunq_access_token)
                     db.session.commit()
 
-                    # Create Bunq API .conf file
-                    create_bunq_api_config(
-                        bunq_access_token, project.id
-                    )
-
-                    get_all_monetary_account_active_ibans(project.id)
+                    # Create the Bunq API .conf file, retrieve the IBANs and
+                    # the payments in the background
+                    jobs.enqueue(jobs.JOB_LINK_BUNQ_ACCOUNT, project.id)
 
                     flash(
                         '<span class="text-default-green">Bunq account succesvol '
@@ -140,6 +147,9 @@ def create_bunq_api_config(bunq_access_token, project_id):
         environment, bunq_access_token, socket.gethostname()
     ).save('%s-project-%s.conf' % (filename, project_id))
 
+    # Make sure the new .conf file is used from now on
+    bunq_contexts.invalidate(project_id)
+
 
 def get_bunq_api_config_filename(environment_type, project_id):
     filename_base = 'bunq-production'
@@ -149,13 +159,39 @@ def get_bunq_api_config_filename(environment_type, project_id):
     return '%s-project-%s.conf' % (filename_base, project_id)
 
 
+# Returns the rate limiter of the Bunq API context of the given project
+def get_bunq_rate_limiter(project_id):
+    return rate_limit.get_limiter(
+        get_bunq_api_config_filename(
+            app.config['BUNQ_ENVIRONMENT_TYPE'], project_id
+        ),
+        BUNQ_RATE_LIMIT_REQUESTS,
+        BUNQ_RATE_LIMIT_PERIOD,
+        retry_exceptions=[TooManyRequestsException]
+    )
+
+
+# Perform a Bunq API call for the given project within the rate limits of its
+# API context, retrying with a backoff when Bunq responds with HTTP 429
+def call_bunq(project_id, function, *args, **kwargs):
+    return get_bunq_rate_limiter(project_id).call(function, *args, **kwargs)
+
+
 def get_all_monetary_account_active(project_id):
-    environment_type = app.config['BUNQ_ENVIRONMENT_TYPE']
-    filename = get_bunq_api_config_filename(environment_type, project_id)
-    if not exists(filename):
+    if not bunq_contexts.load_api_context(project_id):
         return []
-    bunq_api = BunqLib(environment_type, conf=filename)
-    return bunq_api.get_all_monetary_account_active()
+
+    # Use the same number of monetary accounts as BunqLib
+    all_monetary_account_bank = call_bunq(
+        project_id,
+        endpoint.MonetaryAccountBank.list,
+        params={'count': 10}
+    ).value
+    return [
+        monetary_account_bank
+        for monetary_account_bank in all_monetary_account_bank
+        if monetary_account_bank.status == 'ACTIVE'
+    ]
 
 
 def get_all_monetary_account_active_ibans(project_id):
@@ -201,93 +237,234 @@ def _transform_payment(payment):
     return result
 
 
-def get_new_payments(project_id):
-    # Loop over all monetary accounts (i.e., all IBANs belonging to one
-    # Bunq account)
-    for monetary_account in get_all_monetary_account_active(project_id):
-        new_payments_count = 0
-        new_payments = True
-        payments = None
-        # Use a while loop because of pagination; stop when we find a
-        # payment that already exists in our database or if no new
-        # payments are found or in case of an error
-        while new_payments:
-            # Retrieve payments from Bunq
-            try:
-                if payments:
-                    params = payments.pagination.url_params_previous_page
-                else:
-                    params = {'count': 10}
+# Returns a dict which maps each IBAN linked to a project or subproject to a
+# (project_id, subproject_id, totals_project_id) tuple, used to link retrieved
+# payments. totals_project_id is the project these payments count towards
+# (the project of the subproject for subproject IBANs).
+def _get_iban_map():
+    iban_map = {}
+    for project_id, iban in db.session.query(
+            Project.id, Project.iban).filter(Project.iban.isnot(None)):
+        iban_map[iban] = (project_id, None, project_id)
+    for subproject_id, subproject_project_id, iban in db.session.query(
+            Subproject.id, Subproject.project_id, Subproject.iban).filter(
+                Subproject.iban.isnot(None)):
+        project_id, _, _ = iban_map.get(iban, (None, None, None))
+        iban_map[iban] = (project_id, subproject_id, subproject_project_id)
+    return iban_map
+
+
+# Save a page of transformed Bunq payments using a single bulk insert. Returns
+# the number of inserted payments and the ids of the projects these payments
+# count towards.
+def _save_payments(payments, iban_map):
+    bank_payment_ids = [payment['bank_payment_id'] for payment in payments]
+    existing_bank_payment_ids = set(
+        bank_payment_id for bank_payment_id, in db.session.query(
+            Payment.bank_payment_id
+        ).filter(Payment.bank_payment_id.in_(bank_payment_ids))
+    )
+
+    payment_columns = set(Payment.__table__.columns.keys())
+    new_payments = []
+    changed_project_ids = set()
+    for payment in payments:
+        if payment['bank_payment_id'] in existing_bank_payment_ids:
+            continue
+
+        project_id, subproject_id, totals_project_id = iban_map.get(
+            payment.get('alias_value'), (None, None, None)
+        )
+        if project_id:
+            payment['project_id'] = project_id
+        if subproject_id:
+            payment['subproject_id'] = subproject_id
+        if totals_project_id:
+            changed_project_ids.add(totals_project_id)
+        payment['route'] = 'subsidie'
+
+        # Remove the values that sometimes occur in Bunq payments (e.g.,
+        # 'scheduled_id' and 'batch_id') as we don't use them
+        new_payments.append(
+            {k: v for k, v in payment.items() if k in payment_columns}
+        )
+
+    inserted_count = 0
+    if new_payments:
+        # Make sure all rows contain the same columns, which is required for
+        # a multi-row insert
+        columns = set().union(*new_payments)
+        new_payments = [
+            {column: payment.get(column) for column in columns}
+            for payment in new_payments
+        ]
+
+        # On PostgreSQL, don't fail when a concurrent run already inserted
+        # one of these payments
+        if db.engine.dialect.name == 'postgresql':
+            statement = postgresql_insert(Payment.__table__).values(
+                new_payments
+            ).on_conflict_do_nothing(index_elements=['bank_payment_id'])
+        else:
+            statement = Payment.__table__.insert().values(new_payments)
+        inserted_count = db.session.execute(statement).rowcount
+        db.session.commit()
+
+    return inserted_count, changed_project_ids
+
+
+# Returns the sync state of the given monetary account, creating it if it
+# doesn't exist yet. A new sync state continues from the newest payment of
+# this monetary account which is already in the database, but walks through
+# the whole history once more to fill any gaps left by earlier syncs.
+def _get_sync_state(project_id, monetary_account_id):
+    sync_state = MonetaryAccountSyncState.query.filter_by(
+        project_id=project_id,
+        monetary_account_id=monetary_account_id
+    ).first()
+    if not sync_state:
+        newest_bank_payment_id = db.session.query(
+            func.max(Payment.bank_payment_id)
+        ).filter(
+            Payment.monetary_account_id == monetary_account_id
+        ).scalar()
+        sync_state = MonetaryAccountSyncState(
+            project_id=project_id,
+            monetary_account_id=monetary_account_id,
+            newest_bank_payment_id=newest_bank_payment_id,
+            backfill_complete=False
+        )
+        db.session.add(sync_state)
+        db.session.commit()
+    return sync_state
+
+
+# Retrieve one page of payments of a monetary account from Bunq and save the
+# new ones. Returns the Bunq response, the bank payment ids on the page, the
+# number of saved payments and the ids of the projects they count towards.
+def _sync_payments_page(project_id, monetary_account_id, params, iban_map):
+    payments = call_bunq(
+        project_id,
+        endpoint.Payment.list,
+        monetary_account_id=monetary_account_id,
+        params=params
+    )
+    transformed_payments = [
+        _transform_payment(payment) for payment in payments.value
+    ]
+    inserted_count, changed_project_ids = _save_payments(
+        transformed_payments, iban_map
+    )
+    bank_payment_ids = [
+        payment['bank_payment_id'] for payment in transformed_payments
+    ]
+    return payments, bank_payment_ids, inserted_count, changed_project_ids
+
+
+# Retrieve all payments of a monetary account which we don't have yet: first
+# the payments newer than the newest retrieved payment and then, until the
+# whole history is retrieved, the payments older than the oldest retrieved
+# payment. The sync state is saved after each page, so a sync which is
+# interrupted by an error continues at the same point the next time.
+# Returns the number of saved payments and the ids of the projects they count
+# towards.
+def _sync_monetary_account(project_id, monetary_account_id, iban_map):
+    sync_state = _get_sync_state(project_id, monetary_account_id)
+    new_payments_count = 0
+    changed_project_ids = set()
 
-                # Bunq allows max 3 requests per 3 seconds
-                sleep(1)
-                payments = endpoint.Payment.list(
-                    monetary_account_id=monetary_account._id_,
-                    params=params
+    try:
+        # Retrieve payments newer than the newest retrieved payment
+        params = None
+        if sync_state.newest_bank_payment_id:
+            params = {
+                'count': BUNQ_PAYMENTS_PAGE_SIZE,
+                'newer_id': sync_state.newest_bank_payment_id
+            }
+        while params:
+            (
+                payments, bank_payment_ids, inserted_count, saved_project_ids
+            ) = _sync_payments_page(
+                project_id, monetary_account_id, params, iban_map
+            )
+            new_payments_count += inserted_count
+            changed_project_ids.update(saved_project_ids)
+
+            params = None
+            if bank_payment_ids:
+                sync_state.newest_bank_payment_id = max(
+                    [sync_state.newest_bank_payment_id] + bank_payment_ids
+                )
+                if payments.pagination.has_next_page_assured():
+                    params = payments.pagination.url_params_next_page
+            db.session.commit()
+
+        # Retrieve payments older than the oldest retrieved payment until we
+        # have the whole history
+        params = None
+        if not sync_state.backfill_complete:
+            params = {'count': BUNQ_PAYMENTS_PAGE_SIZE}
+            if sync_state.oldest_bank_payment_id:
+                params['older_id'] = sync_state.oldest_bank_payment_id
+        while params:
+            (
+                payments, bank_payment_ids, inserted_count, saved_project_ids
+            ) = _sync_payments_page(
+                project_id, monetary_account_id, params, iban_map
+            )
+            new_payments_count += inserted_count
+            changed_project_ids.update(saved_project_ids)
+
+            params = None
+            if bank_payment_ids:
+                sync_state.oldest_bank_payment_id = min(
+                    [
+                        bank_payment_id for bank_payment_id in (
+                            [sync_state.oldest_bank_payment_id]
+                            + bank_payment_ids
+                        ) if bank_payment_id
+                    ]
                 )
-            except Exception as e:
-                app.logger.error(
-                    "Getting Bunq payments resulted in an exception:\n" + repr(e)
+                sync_state.newest_bank_payment_id = max(
+                    [sync_state.newest_bank_payment_id or 0]
+                    + bank_payment_ids
                 )
-                new_payments = False
-                continue
-
-            if not payments.value:
-                new_payments = False
-                continue
-
-            # Save payments to database
-            for full_payment in payments.value:
-                try:
-                    payment = _transform_payment(full_payment)
-                except Exception as e:
-                    app.logger.error(
-                        "Transforming a Bunq payment resulted in an exception:\n" + repr(e)
-                    )
-                    new_payments = False
-                    continue
-                try:
-                    existing_payment = Payment.query.filter_by(
-                        bank_payment_id=payment['bank_payment_id']
-                    ).first()
+            if bank_payment_ids and payments.pagination.has_previous_page():
+                params = payments.pagination.url_params_previous_page
+            else:
+                sync_state.backfill_complete = True
+            db.session.commit()
+
+        sync_state.last_success = datetime.now(app.config['TZ'])
+        sync_state.last_error = None
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(
+            'Project %s: syncing Bunq monetary account %s resulted in an '
+            'exception:\n%s' % (project_id, monetary_account_id, repr(e))
+        )
+        sync_state.last_error = repr(e)
+        sync_state.last_error_time = datetime.now(app.config['TZ'])
+        db.session.commit()
+
+    return new_payments_count, changed_project_ids
 
-                    if existing_payment:
-                        new_payments = False
-                    else:
-                        project = Project.query.filter_by(
-                            iban=payment['alias_value']
-                        ).first()
-                        if project:
-                            payment['project_id'] = project.id
-
-                        subproject = Subproject.query.filter_by(
-                            iban=payment['alias_value']
-                        ).first()
-                        if subproject:
-                            payment['subproject_id'] = subproject.id
-
-                        # Remove these values that sometimes occur in Bunq
-                        # payments as we don't use them
-                        if 'scheduled_id' in payment:
-                            del payment['scheduled_id']
-
-                        if 'batch_id' in payment:
-                            del payment['batch_id']
-
-                        p = Payment(**payment)
-                        p.route = 'subsidie'
-                        db.session.add(p)
-                        db.session.commit()
-                        new_payments_count += 1
-                except Exception as e:
-                    app.logger.error(
-                        "Saving a Bunq payment resulted in an exception:\n" + repr(e)
-                    )
-                    new_payments = False
-                    continue
 
-            if not payments.pagination.has_previous_page():
-                new_payments = False
+def get_new_payments(project_id):
+    # Keep track of the projects that received new payments so we can
+    # update their totals afterwards
+    changed_project_ids = set()
+
+    iban_map = _get_iban_map()
+
+    # Loop over all monetary accounts (i.e., all IBANs belonging to one
+    # Bunq account)
+    for monetary_account in get_all_monetary_account_active(project_id):
+        new_payments_count, saved_project_ids = _sync_monetary_account(
+            project_id, monetary_account._id_, iban_map
+        )
+        changed_project_ids.update(saved_project_ids)
 
         # Log the number of retrieved payments
         iban = ''
@@ -302,12 +479,21 @@ def get_new_payments(project_id):
             )
         )
 
+    totals.refresh_project_totals(changed_project_ids)
+
+
+# Forget which payments were retrieved for the monetary accounts of a
+# project, so the next sync walks through the whole history again
+def reset_sync_state(project_id):
+    MonetaryAccountSyncState.query.filter_by(project_id=project_id).delete()
+    db.session.commit()
+
 
 def human_format(num):
     magnitude = 0
     while abs(num) >= 1000:
         magnitude += 1
-        num /= 1000.0
+        num /= 1000
 
     if magnitude > 0:
         return '%s%s' % (locale.format("%.1f", num), ['', 'K', 'M'][magnitude])
@@ -0,0 +1,51 @@
+"""Store money as numeric
+
+Revision ID: 9c1e7b5d2a63
+Revises: 6f2d8a4c3b19
+Create Date: 2026-10-19 00:27:35.114208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e7b5d2a63'
+down_revision = '6f2d8a4c3b19'
+branch_labels = None
+depends_on = None
+
+
+MONEY_COLUMNS = [
+    ('payment', 'amount_value'),
+    ('payment', 'balance_after_mutation_value'),
+    ('project_totals', 'awarded'),
+    ('project_totals', 'spent'),
+    ('subproject_totals', 'awarded'),
+    ('subproject_totals', 'spent')
+]
+
+
+def upgrade():
+    # Round the existing amounts to cents, which is what Bunq and the
+    # payment form provide
+    for table, column in MONEY_COLUMNS:
+        op.alter_column(table, column,
+                   existing_type=postgresql.DOUBLE_PRECISION(precision=53),
+                   type_=sa.Numeric(precision=12, scale=2),
+                   existing_nullable=True,
+                   postgresql_using='round(%s::numeric, 2)' % column)
+
+    # The stored totals were summed as floats; remove them so they are
+    # summed again exactly when they are first needed (see totals.py)
+    op.execute('DELETE FROM subproject_totals')
+    op.execute('DELETE FROM project_totals')
+
+
+def downgrade():
+    for table, column in MONEY_COLUMNS:
+        op.alter_column(table, column,
+                   existing_type=sa.Numeric(precision=12, scale=2),
+                   type_=postgresql.DOUBLE_PRECISION(precision=53),
+                   existing_nullable=True)
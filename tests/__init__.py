@@ -1 +1,28 @@
+from tempfile import mkdtemp
+import atexit
+import shutil
+
+from app import app
+
+# Committing changes starts a new page cache generation, so keep the page
+# cache of the tests out of the cache of the app
+app.config['PAGE_CACHE_DIR'] = mkdtemp()
+atexit.register(shutil.rmtree, app.config['PAGE_CACHE_DIR'], True)
+
 from .database import TestDatabase
+from .aggregation import TestAggregation
+from .payments import TestSavePayments
+from .rate_limit import TestTokenBucket
+from .sync import TestSyncMonetaryAccount
+from .jobs import TestJobs
+from .bunq_callbacks import TestBunqCallbacks
+from .bunq_contexts import TestBunqContexts
+from .page_data import TestPageData
+from .payment_table import TestPaymentTable
+from .export import TestExport
+from .page_cache import TestPageCache
+from .uploads import TestUploads
+from .thumbnails import TestThumbnails
+from .storage import TestLocalStorage, TestS3Storage
+from .query_plans import TestQueryPlans
+from .benchmark import TestBenchmark
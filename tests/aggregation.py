@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+from decimal import Decimal
+import unittest
+
+from app import app, db, aggregation, totals, util
+from app.models import Project, Subproject, Payment
+
+
+class TestAggregation(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+
+        # A project with an IBAN and two subprojects
+        db.session.add(
+            Project(
+                name='testproject1',
+                iban='NL00BUNQ0000000001',
+                contains_subprojects=True
+            )
+        )
+        db.session.add(
+            Subproject(
+                name='testsubproject1',
+                project_id=1,
+                iban='NL00BUNQ0000000011',
+                budget=1000
+            )
+        )
+        db.session.add(
+            Subproject(
+                name='testsubproject2',
+                project_id=1,
+                iban='NL00BUNQ0000000012'
+            )
+        )
+        # A project without subprojects and with a budget
+        db.session.add(
+            Project(
+                name='testproject2',
+                contains_subprojects=False,
+                budget=5000
+            )
+        )
+        db.session.commit()
+
+        payments = [
+            # Project 1: incoming external, incoming from own subproject and
+            # outgoing to a subproject
+            (1, None, 2500.0, 'NL00BUNQ9999999999'),
+            (1, None, 100.5, 'NL00BUNQ0000000011'),
+            (1, None, -800.0, 'NL00BUNQ0000000011'),
+            # Subproject 1: incoming from project, incoming external,
+            # spending and a payment back to the project
+            (None, 1, 800.0, 'NL00BUNQ0000000001'),
+            (None, 1, 25.25, 'NL00BUNQ8888888888'),
+            (None, 1, -300.75, 'NL00BUNQ7777777777'),
+            (None, 1, -100.5, 'NL00BUNQ0000000001'),
+            # Subproject 2: manually added payments without counterparty
+            (None, 2, 50.0, None),
+            (None, 2, -20.0, None),
+            # Project 2
+            (2, None, 1200.0, 'NL00BUNQ6666666666'),
+            (2, None, -450.0, None),
+        ]
+        for project_id, subproject_id, amount, counterparty in payments:
+            db.session.add(
+                Payment(
+                    project_id=project_id,
+                    subproject_id=subproject_id,
+                    amount_value=amount,
+                    counterparty_alias_value=counterparty
+                )
+            )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_project_amounts_match_python_calculation(self):
+        for project in Project.query.all():
+            expected = util.calculate_project_amounts(project.id)
+            result = aggregation.calculate_project_amounts(project.id)
+            self.assertEqual(expected.keys(), result.keys())
+            for key in expected:
+                self.assertEqual(expected[key], result[key])
+
+    def test_subproject_amounts_match_python_calculation(self):
+        for subproject in Subproject.query.all():
+            expected = util.calculate_subproject_amounts(subproject.id)
+            result = aggregation.calculate_subproject_amounts(subproject.id)
+            self.assertEqual(expected.keys(), result.keys())
+            for key in expected:
+                self.assertEqual(expected[key], result[key])
+
+    def test_projects_amounts(self):
+        all_amounts = aggregation.calculate_projects_amounts(
+            Project.query.all()
+        )
+        self.assertEqual(set(all_amounts.keys()), {1, 2})
+        self.assertEqual(all_amounts[1]['awarded'], Decimal('2575.25'))
+        self.assertEqual(all_amounts[1]['spent'], Decimal('320.75'))
+        self.assertEqual(all_amounts[2]['awarded'], Decimal('1200.00'))
+        self.assertEqual(all_amounts[2]['spent'], Decimal('450.00'))
+
+    def test_sums_are_exact(self):
+        # 0.1 can't be represented exactly as a float
+        for i in range(10):
+            db.session.add(Payment(subproject_id=2, amount_value='0.10'))
+        db.session.commit()
+
+        self.assertEqual(
+            aggregation.calculate_subprojects_sums(
+                [Subproject.query.get(2)]
+            )[2],
+            (Decimal('51.00'), Decimal('20.00'))
+        )
+        self.assertEqual(
+            util.calculate_subproject_amounts(2)['awarded'], Decimal('51.00')
+        )
+
+    def test_stored_totals(self):
+        totals.rebuild_totals()
+        self.assertEqual(totals.verify_totals(), [])
+
+        # Add a payment to subproject 2 and refresh the totals
+        payment = Payment(
+            subproject_id=2,
+            amount_value=-30.0,
+            counterparty_alias_value='NL00BUNQ5555555555'
+        )
+        db.session.add(payment)
+        db.session.commit()
+        self.assertNotEqual(totals.verify_totals(), [])
+        totals.refresh_payment_totals([payment])
+        self.assertEqual(totals.verify_totals(), [])
+
+        project = Project.query.get(1)
+        self.assertEqual(
+            totals.get_project_amounts(project),
+            aggregation.calculate_project_amounts(1)
+        )
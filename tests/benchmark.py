@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import unittest
+
+from app import app, benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+
+    def test_run(self):
+        results = benchmark.run(
+            'sqlite://',
+            {
+                'projects': 2,
+                'subprojects': 2,
+                'payments': 20,
+                'categories': 2,
+                'attachments': 4
+            },
+            rounds=2
+        )
+
+        self.assertEqual(
+            [result.name for result in results][:6],
+            [
+                'index', 'project', 'subproject', 'project (admin)',
+                'subproject (admin)', 'login'
+            ]
+        )
+        for result in results:
+            self.assertEqual(result.rounds, 2)
+            self.assertTrue(0 < result.min <= result.median <= result.max)
+            self.assertGreater(result.queries, 0)
+
+        table = benchmark.format_results(results)
+        self.assertIn('Name (time in ms)', table)
+        self.assertIn('aggregation: rebuild totals', table)
+
+    def test_run_selected(self):
+        results = benchmark.run(
+            'sqlite://',
+            {'projects': 1, 'subprojects': 1, 'payments': 5},
+            rounds=1,
+            names=['sync']
+        )
+        self.assertEqual(
+            [result.name for result in results], ['sync: save payments page']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
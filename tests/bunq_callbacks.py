@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+from base64 import b64encode
+from unittest import mock
+import json
+import unittest
+
+from Cryptodome.Hash import SHA256
+from Cryptodome.PublicKey import RSA
+from Cryptodome.Signature import pkcs1_15
+
+from app import app, db, bunq_callbacks, jobs
+from app.models import Job, Payment, Project
+from .sync import FakePayment
+
+
+class TestBunqCallbacks(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server_key = RSA.generate(2048)
+        cls.other_key = RSA.generate(2048)
+
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+        db.session.add(Project(name='testproject', iban='NL00BUNQ0000000001'))
+        db.session.commit()
+
+        self.public_key_patch = mock.patch.object(
+            bunq_callbacks.bunq_contexts,
+            'get_server_public_key',
+            return_value=self.server_key.publickey()
+        )
+        self.public_key_patch.start()
+
+    def tearDown(self):
+        self.public_key_patch.stop()
+        db.session.remove()
+        db.drop_all()
+
+    def _body(self, category='MUTATION'):
+        return json.dumps({
+            'NotificationUrl': {
+                'category': category,
+                'object': {'Payment': {'id': 1}}
+            }
+        }).encode('utf-8')
+
+    def _sign(self, body, key=None):
+        return b64encode(
+            pkcs1_15.new(key or self.server_key).sign(SHA256.new(body))
+        ).decode('ascii')
+
+    def test_valid_signature(self):
+        body = self._body()
+        self.assertTrue(
+            bunq_callbacks.is_valid_signature(1, body, self._sign(body))
+        )
+
+    def test_tampered_body(self):
+        signature = self._sign(self._body())
+        self.assertFalse(
+            bunq_callbacks.is_valid_signature(
+                1, self._body(category='BILLING'), signature
+            )
+        )
+
+    def test_bad_signature(self):
+        body = self._body()
+        for signature in [
+                self._sign(body, self.other_key),
+                b64encode(b'not a signature').decode('ascii'),
+                'not base64!',
+                '',
+                None]:
+            self.assertFalse(
+                bunq_callbacks.is_valid_signature(1, body, signature)
+            )
+
+    def test_wrong_callback_token(self):
+        self.assertTrue(
+            bunq_callbacks.is_valid_callback_token(
+                1, bunq_callbacks.get_callback_token(1)
+            )
+        )
+        self.assertFalse(
+            bunq_callbacks.is_valid_callback_token(
+                1, bunq_callbacks.get_callback_token(2)
+            )
+        )
+
+        body = self._body()
+        response = app.test_client().post(
+            '/bunq-callback/1/%s' % bunq_callbacks.get_callback_token(2),
+            data=body,
+            headers={bunq_callbacks.SERVER_SIGNATURE_HEADER: self._sign(body)}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Payment.query.count(), 0)
+
+    def _post_callback(self, body):
+        return app.test_client().post(
+            '/bunq-callback/1/%s' % bunq_callbacks.get_callback_token(1),
+            data=body,
+            headers={bunq_callbacks.SERVER_SIGNATURE_HEADER: self._sign(body)}
+        )
+
+    def test_callback_is_queued(self):
+        # The payment is queued instead of saved during the callback, and
+        # a callback Bunq sends again while it is queued is queued once
+        for _ in range(2):
+            self.assertEqual(self._post_callback(self._body()).status_code, 200)
+        self.assertEqual(
+            self._post_callback(self._body(category='BILLING')).status_code,
+            200
+        )
+        job = Job.query.one()
+        self.assertEqual(job.job_type, jobs.JOB_SAVE_CALLBACK_PAYMENT)
+        self.assertEqual(job.project_id, 1)
+        self.assertEqual(Payment.query.count(), 0)
+
+        with mock.patch.object(
+                bunq_callbacks.endpoint.Payment,
+                'from_json',
+                return_value=FakePayment(1)):
+            self.assertEqual(jobs.run_pending_jobs(), 1)
+            # The same payment is only saved once
+            self.assertEqual(
+                bunq_callbacks.save_callback_payment(1, {'id': 1}), 0
+            )
+
+        self.assertEqual(Job.query.one().status, jobs.JOB_DONE)
+        payment = Payment.query.one()
+        self.assertEqual(payment.bank_payment_id, 1)
+        self.assertEqual(payment.project_id, 1)
+
+    def test_get_callback_payment(self):
+        self.assertEqual(
+            bunq_callbacks.get_callback_payment(self._body()), {'id': 1}
+        )
+        for body in [self._body(category='BILLING'), b'[]', b'not json']:
+            self.assertIsNone(bunq_callbacks.get_callback_payment(body))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from types import SimpleNamespace
+from unittest import mock
+import os
+import unittest
+
+from app import bunq_contexts
+
+
+class FakeApiContext(object):
+    def __init__(self, expiry_time, reset_event=None):
+        self.session_context = SimpleNamespace(expiry_time=expiry_time)
+        self.reset_event = reset_event
+        self.reset_count = 0
+
+    def reset_session(self):
+        if self.reset_event:
+            self.reset_event.wait(5)
+        self.reset_count += 1
+        self.session_context = SimpleNamespace(
+            expiry_time=datetime.now() + timedelta(hours=1)
+        )
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write('{"reset_count": %s}' % self.reset_count)
+
+
+class TestBunqContexts(unittest.TestCase):
+    def setUp(self):
+        self.conf_dir = TemporaryDirectory()
+        self.api_contexts = {}
+        for project_id in [1, 2]:
+            with open(self._get_filename(project_id), 'w') as f:
+                f.write('{}')
+
+        self.patches = [
+            mock.patch.object(
+                bunq_contexts, '_get_filename', self._get_filename
+            ),
+            mock.patch.object(
+                bunq_contexts.ApiContext,
+                'restore',
+                lambda filename: self.api_contexts[filename]
+            ),
+            mock.patch.object(
+                bunq_contexts.util,
+                'call_bunq',
+                lambda project_id, function, *args: function(*args)
+            )
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        bunq_contexts._api_contexts.clear()
+        self.conf_dir.cleanup()
+
+    def _get_filename(self, project_id):
+        return os.path.join(self.conf_dir.name, 'bunq-%s.conf' % project_id)
+
+    def test_reset_expiring_session(self):
+        api_context = FakeApiContext(datetime.now() + timedelta(seconds=10))
+        self.api_contexts[self._get_filename(1)] = api_context
+
+        for _ in range(2):
+            self.assertIs(bunq_contexts.get_api_context(1), api_context)
+        self.assertEqual(api_context.reset_count, 1)
+
+        # The .conf file is replaced, no temporary files are left behind
+        with open(self._get_filename(1)) as f:
+            self.assertEqual(f.read(), '{"reset_count": 1}')
+        self.assertEqual(
+            sorted(os.listdir(self.conf_dir.name)),
+            ['bunq-1.conf', 'bunq-2.conf']
+        )
+
+    def test_reset_does_not_block_other_projects(self):
+        reset_event = Event()
+        self.api_contexts[self._get_filename(1)] = FakeApiContext(
+            datetime.now(), reset_event
+        )
+        api_context = FakeApiContext(datetime.now() + timedelta(hours=1))
+        self.api_contexts[self._get_filename(2)] = api_context
+
+        thread = Thread(target=bunq_contexts.get_api_context, args=(1,))
+        thread.start()
+        try:
+            # Project 1 is waiting on Bunq while project 2 is looked up
+            self.assertIs(bunq_contexts.get_api_context(2), api_context)
+            self.assertTrue(thread.is_alive())
+        finally:
+            reset_event.set()
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import json
+import unittest
+
+from app import app, db, export, payment_table
+from app.models import Project, Subproject, Payment
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+
+        db.session.add(Project(id=1, name='test project'))
+        db.session.add(Subproject(id=1, name='testsubproject', project_id=1))
+        for i in range(3):
+            db.session.add(
+                Payment(
+                    subproject_id=1,
+                    amount_value=-i,
+                    short_user_description='betaling %s' % i,
+                    created=datetime(2020, 1, i + 1),
+                    hidden=i == 2,
+                    type='MANUAL'
+                )
+            )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def _export(self, export_format, project_owner=True, **args):
+        with app.test_request_context(query_string=args):
+            response = export.export_payments(
+                payment_table.project_payments_query(
+                    Project.query.get(1), project_owner, []
+                ),
+                payment_table.parse_table_args(args),
+                True,
+                export_format,
+                'export'
+            )
+            return response, response.get_data(as_text=True)
+
+    def test_csv(self):
+        response, data = self._export('csv', project_owner=False)
+        self.assertIn('export.csv', response.headers['Content-Disposition'])
+        lines = data.splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'initiatief', 'bedrag €'])
+        # The hidden payment is only exported for project owners
+        self.assertEqual(len(lines), 3)
+        self.assertIn('betaling 1', lines[1])
+
+    def test_json(self):
+        _, data = self._export('json', search='betaling 2')
+        rows = json.loads(data)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['omschrijving'], 'betaling 2')
+        self.assertEqual(rows[0]['initiatief'], 'testsubproject')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+from unittest import mock
+import unittest
+
+from app import app, db, jobs
+from app.models import Job, Project
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+        db.session.add(Project(id=1, name='testproject'))
+        db.session.commit()
+
+        self.calls = []
+        self.job_functions_patch = mock.patch.dict(
+            jobs._job_functions,
+            {
+                jobs.JOB_REFRESH_IBANS: self._record_call,
+                jobs.JOB_GET_NEW_PAYMENTS: self._fail
+            }
+        )
+        self.job_functions_patch.start()
+
+    def tearDown(self):
+        self.job_functions_patch.stop()
+        db.session.remove()
+        db.drop_all()
+
+    def _record_call(self, project_id, **arguments):
+        self.calls.append((project_id, arguments))
+
+    def _fail(self, project_id):
+        raise Exception('Bunq is down')
+
+    def test_enqueue_once(self):
+        job = jobs.enqueue(jobs.JOB_REFRESH_IBANS, 1, count=2)
+        self.assertEqual(jobs.enqueue(jobs.JOB_REFRESH_IBANS, 1, count=2), job)
+        self.assertEqual(Job.query.count(), 1)
+
+        # Once the job has run it can be queued again
+        jobs.run_pending_jobs()
+        self.assertEqual(self.calls, [(1, {'count': 2})])
+        self.assertNotEqual(jobs.enqueue(jobs.JOB_REFRESH_IBANS, 1, count=2), job)
+
+    def test_run_pending_jobs(self):
+        refresh_job = jobs.enqueue(jobs.JOB_REFRESH_IBANS, 1)
+        failing_job = jobs.enqueue(jobs.JOB_GET_NEW_PAYMENTS, 1)
+        self.assertEqual(jobs.run_pending_jobs(), 2)
+
+        self.assertEqual(refresh_job.status, jobs.JOB_DONE)
+        self.assertEqual(failing_job.status, jobs.JOB_FAILED)
+        self.assertIn('Bunq is down', failing_job.error)
+        self.assertEqual(failing_job.attempts, 1)
+        self.assertEqual(len(jobs.get_project_jobs(1)), 2)
+        self.assertEqual(jobs.run_pending_jobs(), 0)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+from tempfile import TemporaryDirectory
+import unittest
+
+from app import app, db, page_cache
+from app.models import Job, Project
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.cache_dir = TemporaryDirectory()
+        self.old_cache_dir = app.config.get('PAGE_CACHE_DIR')
+        app.config['PAGE_CACHE_DIR'] = self.cache_dir.name
+        app.config['PAGE_CACHE_TIMEOUT'] = 300
+        db.create_all()
+
+        db.session.add(Project(id=1, name='testproject'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        app.config['PAGE_CACHE_DIR'] = self.old_cache_dir
+        self.cache_dir.cleanup()
+
+    def _cache_page(self):
+        page_cache.store('index', '<html>', page_cache.get_generation())
+        self.assertEqual(page_cache.get('index'), '<html>')
+
+    def test_invalidated_by_commit(self):
+        self._cache_page()
+        Project.query.get(1).name = 'new name'
+        db.session.commit()
+        self.assertIsNone(page_cache.get('index'))
+
+    def test_invalidated_by_bulk_update(self):
+        self._cache_page()
+        Project.query.filter_by(id=1).update({'name': 'new name'})
+        db.session.commit()
+        self.assertIsNone(page_cache.get('index'))
+
+    def test_not_invalidated(self):
+        self._cache_page()
+        # Jobs aren't shown on public pages
+        db.session.add(Job(job_type='get-new-payments', status='queued'))
+        db.session.commit()
+        Project.query.get(1).name = 'new name'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(page_cache.get('index'), '<html>')
+
+    def test_stale_generation(self):
+        generation = page_cache.get_generation()
+        page_cache.invalidate()
+        page_cache.store('index', '<html>', generation)
+        self.assertIsNone(page_cache.get('index'))
+
+    def test_conditional_request(self):
+        with app.test_request_context('/project/1'):
+            self.assertIsNone(page_cache.get_not_modified_response())
+            response = app.response_class('<html>')
+            page_cache.add_validators(response)
+            etag = response.headers['ETag']
+
+        headers = {'If-None-Match': etag}
+        with app.test_request_context('/project/1', headers=headers):
+            self.assertEqual(
+                page_cache.get_not_modified_response().status_code, 304
+            )
+        with app.test_request_context('/project/2', headers=headers):
+            self.assertIsNone(page_cache.get_not_modified_response())
+
+        page_cache.invalidate()
+        with app.test_request_context('/project/1', headers=headers):
+            self.assertIsNone(page_cache.get_not_modified_response())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
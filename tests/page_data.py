@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import unittest
+
+from sqlalchemy import event
+
+from app import app, db, category_cache, page_data, payment_rows, payment_table
+from app.form_processing import create_payment_forms
+from app.models import Project, Subproject, Payment, Category, File
+
+
+class TestPageData(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['WTF_CSRF_ENABLED'] = False
+        db.create_all()
+
+        db.session.add(Project(id=1, name='testproject'))
+        for subproject_id in [1, 2]:
+            db.session.add(
+                Subproject(
+                    id=subproject_id,
+                    name='testsubproject%s' % subproject_id,
+                    project_id=1
+                )
+            )
+            db.session.add(
+                Category(name='category', subproject_id=subproject_id)
+            )
+        db.session.commit()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self._count)
+        db.session.remove()
+        db.drop_all()
+
+    def _count(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append(statement)
+
+    def _add_payments(self, count):
+        for i in range(count):
+            payment = Payment(
+                subproject_id=i % 2 + 1,
+                category_id=i % 2 + 1,
+                amount_value=-10,
+                created=datetime(2020, 1, i % 28 + 1),
+                type='MANUAL'
+            )
+            payment.attachments.append(
+                File(filename='bon%s.pdf' % i, mediatype='bon')
+            )
+            db.session.add(payment)
+        db.session.commit()
+
+    # Returns the number of queries used to load and render the payments
+    # data of the project page
+    def _count_page_queries(self):
+        db.session.expunge_all()
+        self.statements = []
+        with app.test_request_context():
+            project = Project.query.get(1)
+            subprojects = page_data.load_subprojects(project)
+            payment_views = page_data.load_payment_views(
+                payment_rows.load_payments(
+                    payment_table.project_payments_query(project, True, [])
+                ),
+                True,
+                []
+            )
+            category_cache.get_all_category_select_options(
+                project.id, [subproject.id for subproject in subprojects]
+            )
+            payment_forms = create_payment_forms(
+                [payment_view.payment for payment_view in payment_views], True
+            )
+            for payment, _, bonnen, _, _ in payment_views:
+                payment.subproject.name, payment.category.name
+                bonnen[0].filename
+                self.assertEqual(
+                    len(payment_forms[payment.id].category_id.choices), 2
+                )
+        return len(self.statements)
+
+    def test_constant_query_count(self):
+        self._add_payments(2)
+        query_count = self._count_page_queries()
+
+        self._add_payments(20)
+        self.assertEqual(self._count_page_queries(), query_count)
+
+    def test_payment_views(self):
+        self._add_payments(4)
+        Payment.query.filter_by(id=4).update({'hidden': True})
+        db.session.commit()
+
+        project = Project.query.get(1)
+
+        def load_payment_views(project_owner, user_subproject_ids):
+            return page_data.load_payment_views(
+                payment_rows.load_payments(
+                    payment_table.project_payments_query(
+                        project, project_owner, user_subproject_ids
+                    )
+                ),
+                project_owner,
+                user_subproject_ids
+            )
+
+        # Newest first, without the hidden payment for users who can't edit
+        # it
+        self.assertEqual(
+            [
+                (payment_view.payment.id, payment_view.can_edit)
+                for payment_view in load_payment_views(False, [1])
+            ],
+            [(3, True), (2, False), (1, True)]
+        )
+        self.assertEqual(len(load_payment_views(True, [])), 4)
+
+    def test_category_cache(self):
+        with app.test_request_context():
+            self.assertEqual(
+                category_cache.get_category_select_options(1, 1),
+                [('', ''), ('1', 'category')]
+            )
+            self.statements = []
+            category_cache.get_category_select_options(1, 1)
+            self.assertEqual(self.statements, [])
+
+            db.session.add(Category(name='new category', subproject_id=1))
+            db.session.commit()
+            category_cache.invalidate(1, 1)
+            self.assertEqual(
+                category_cache.get_category_select_options(1, 1)[-1],
+                ('3', 'new category')
+            )
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import unittest
+
+from werkzeug.datastructures import MultiDict
+
+from app import app, db, page_data, payment_rows, payment_table
+from app.models import Project, Subproject, Payment, Category
+
+
+class TestPaymentTable(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+
+        db.session.add(Project(id=1, name='testproject'))
+        for subproject_id in [1, 2]:
+            db.session.add(
+                Subproject(
+                    id=subproject_id,
+                    name='testsubproject%s' % subproject_id,
+                    project_id=1
+                )
+            )
+        db.session.add(Category(id=1, name='koffie', subproject_id=1))
+
+        for i in range(10):
+            db.session.add(
+                Payment(
+                    id=i + 1,
+                    subproject_id=i % 2 + 1,
+                    category_id=1 if i % 2 == 0 else None,
+                    amount_value=-i,
+                    short_user_description='betaling %s' % i,
+                    created=app.config['TZ'].localize(
+                        datetime(2020, 1, i + 1, 12)
+                    ),
+                    hidden=i == 9,
+                    type='MANUAL'
+                )
+            )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def _get_page(self, project_owner=True, user_subproject_ids=[], **args):
+        query = payment_table.project_payments_query(
+            Project.query.get(1), project_owner, user_subproject_ids
+        )
+        table_args = payment_table.parse_table_args(MultiDict(args))
+        filtered_query = payment_table.filter_payments(query, table_args)
+        return (
+            payment_table.count(filtered_query),
+            [
+                payment.id
+                for payment in payment_table.get_page(
+                    filtered_query, table_args
+                )
+            ]
+        )
+
+    def test_pagination(self):
+        self.assertEqual(
+            self._get_page(limit='3', offset='3'), (10, [7, 6, 5])
+        )
+
+    def test_sort(self):
+        self.assertEqual(
+            self._get_page(limit='2', sort='bedrag', order='asc'),
+            (10, [10, 9])
+        )
+
+    def test_hidden_payments(self):
+        self.assertEqual(self._get_page(project_owner=False)[0], 9)
+        self.assertEqual(
+            self._get_page(project_owner=False, user_subproject_ids=[2])[0],
+            10
+        )
+
+    def test_filters(self):
+        self.assertEqual(self._get_page(search='Betaling 3'), (1, [4]))
+        self.assertEqual(self._get_page(search='koffie')[0], 5)
+        self.assertEqual(self._get_page(category_id='1')[0], 5)
+        self.assertEqual(
+            self._get_page(date_from='2020-01-03', date_to='2020-01-04'),
+            (2, [4, 3])
+        )
+
+    def test_payment_rows(self):
+        rows = payment_table.get_page(
+            payment_table.project_payments_query(Project.query.get(1), True, []),
+            payment_table.parse_table_args(MultiDict({'limit': '4'}))
+        )
+        self.assertIsInstance(rows[0], payment_rows.PaymentRow)
+        self.assertEqual(
+            (rows[0].id, rows[0].subproject.name, rows[0].category),
+            (10, 'testsubproject2', None)
+        )
+        self.assertEqual(rows[1].category.name, 'koffie')
+        # Rows of the same subproject share its tuple
+        self.assertIs(rows[1].subproject, rows[3].subproject)
+
+    def test_payment_to_row_without_amount_and_date(self):
+        db.session.add(Payment(id=11, subproject_id=1, type='MANUAL'))
+        db.session.commit()
+        payment = payment_rows.load_payments(
+            Payment.query.filter_by(id=11)
+        )[0]
+        with app.test_request_context():
+            row = payment_table.payment_to_row(
+                page_data.PaymentView(payment, [], [], [], False), ''
+            )
+        self.assertEqual(
+            (row['bedrag'], row['bedrag_formatted'], row['datum']),
+            (None, '', '')
+        )
+        self.assertIsNone(row['created'])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            payment_table.parse_table_args(MultiDict({'limit': '0'}))
+        with self.assertRaises(ValueError):
+            payment_table.parse_table_args(MultiDict({'date_from': 'gisteren'}))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
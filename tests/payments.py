@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import unittest
+
+from app import app, db, util
+from app.models import Project, Subproject, Payment
+
+
+class TestSavePayments(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+
+        db.session.add(
+            Project(name='testproject', iban='NL00BUNQ0000000001')
+        )
+        db.session.add(
+            Subproject(
+                name='testsubproject',
+                project_id=1,
+                iban='NL00BUNQ0000000011'
+            )
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def _bunq_payment(self, bank_payment_id, alias_value):
+        return {
+            'bank_payment_id': bank_payment_id,
+            'alias_value': alias_value,
+            'amount_value': '-12.50',
+            'amount_currency': 'EUR',
+            'created': datetime(2021, 1, 1, 12, 0),
+            'type': 'BUNQ',
+            # Not a Payment column, should be ignored
+            'batch_id': 1
+        }
+
+    def test_save_payments(self):
+        iban_map = util._get_iban_map()
+        self.assertEqual(
+            iban_map,
+            {
+                'NL00BUNQ0000000001': (1, None, 1),
+                'NL00BUNQ0000000011': (None, 1, 1)
+            }
+        )
+
+        inserted_count, project_ids = util._save_payments(
+            [
+                self._bunq_payment(1, 'NL00BUNQ0000000001'),
+                self._bunq_payment(2, 'NL00BUNQ0000000011')
+            ],
+            iban_map
+        )
+        self.assertEqual(inserted_count, 2)
+        self.assertEqual(project_ids, {1})
+        self.assertEqual(Payment.query.get(1).project_id, 1)
+        self.assertEqual(Payment.query.get(2).subproject_id, 1)
+        self.assertEqual(Payment.query.get(2).route, 'subsidie')
+
+        # Saving a page with an already known payment only saves the new one
+        inserted_count, project_ids = util._save_payments(
+            [
+                self._bunq_payment(3, 'NL00BUNQ9999999999'),
+                self._bunq_payment(2, 'NL00BUNQ0000000011')
+            ],
+            iban_map
+        )
+        self.assertEqual(inserted_count, 1)
+        self.assertEqual(project_ids, set())
+        self.assertEqual(Payment.query.count(), 3)
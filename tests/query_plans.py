@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import unittest
+
+from app import app, db, query_plans
+from app.models import Project, Subproject, Payment
+
+
+class TestQueryPlans(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+
+        db.session.add(Project(id=1, name='project', contains_subprojects=True))
+        db.session.add(Subproject(id=1, name='subproject', project_id=1))
+        db.session.add(
+            Project(
+                id=2,
+                name='project zonder initiatieven',
+                contains_subprojects=False
+            )
+        )
+        for i in range(21):
+            db.session.add(
+                Payment(
+                    project_id=1 if i % 2 else 2,
+                    subproject_id=1 if i % 2 else None,
+                    amount_value=-10,
+                    created=datetime(2020, 1, i + 1),
+                    hidden=i % 5 == 0,
+                    type='MANUAL'
+                )
+            )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_hot_queries_use_indexes(self):
+        results = query_plans.check_query_plans()
+        self.assertEqual(
+            [description for description, _, _, _ in results],
+            [
+                '%s %s' % (description, query)
+                for description in ['subproject 1', 'project 1', 'project 2']
+                for query in [
+                    'page', 'page (project owner)', 'payment table',
+                    'payment count'
+                ]
+            ]
+        )
+        for description, plan, _, uses_index in results:
+            self.assertTrue(uses_index, '%s:\n%s' % (description, plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+from time import monotonic
+import unittest
+
+from app.rate_limit import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(3, 0.3)
+        start = monotonic()
+        for i in range(3):
+            self.assertEqual(bucket.acquire(), 0)
+        self.assertLess(monotonic() - start, 0.1)
+
+        # The fourth request has to wait until the first token returns
+        self.assertGreater(bucket.acquire(), 0.2)
+        self.assertGreaterEqual(monotonic() - start, 0.3)
+
+    def test_sliding_window(self):
+        bucket = TokenBucket(2, 0.2)
+        times = []
+        for i in range(6):
+            bucket.acquire()
+            times.append(monotonic())
+
+        # Never more than 2 requests in any window of 0.2 seconds
+        for i in range(2, len(times)):
+            self.assertGreaterEqual(times[i] - times[i - 2], 0.19)
+
+    def test_retry_with_backoff(self):
+        class TooManyRequests(Exception):
+            pass
+
+        bucket = TokenBucket(
+            3, 0.3,
+            retry_exceptions=[TooManyRequests],
+            max_retries=2,
+            backoff_base=0.05,
+            backoff_max=0.1
+        )
+        calls = []
+
+        def throttled_twice():
+            calls.append(monotonic())
+            if len(calls) <= 2:
+                raise TooManyRequests()
+            return 'ok'
+
+        self.assertEqual(bucket.call(throttled_twice), 'ok')
+        self.assertEqual(len(calls), 3)
+        stats = bucket.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['throttled'], 2)
+        self.assertGreater(stats['backoff_time'], 0)
+        self.assertAlmostEqual(
+            stats['throttled_time'],
+            stats['wait_time'] + stats['backoff_time']
+        )
+
+        # Give up after max_retries
+        calls.clear()
+
+        def always_throttled():
+            calls.append(monotonic())
+            raise TooManyRequests()
+
+        with self.assertRaises(TooManyRequests):
+            bucket.call(always_throttled)
+        self.assertEqual(len(calls), 3)
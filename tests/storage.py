@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+from io import BytesIO
+from tempfile import TemporaryDirectory
+import os
+import unittest
+
+from botocore.exceptions import ClientError
+
+from app import app, storage
+
+
+# Settings of the MinIO container in docker-compose-dev.yml
+S3_TEST_CONFIG = {
+    'S3_BUCKET': 'openpoen-test',
+    'S3_ACCESS_KEY_ID': 'minio',
+    'S3_SECRET_ACCESS_KEY': 'minio-secret'
+}
+
+
+class TestLocalStorage(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = TemporaryDirectory()
+        self.old_config = {
+            key: app.config.get(key)
+            for key in ['UPLOAD_FOLDER', 'UPLOAD_X_ACCEL_REDIRECT']
+        }
+        app.config['UPLOAD_FOLDER'] = self.upload_folder.name
+        app.config['UPLOAD_X_ACCEL_REDIRECT'] = '/protected-upload/'
+        self.storage = storage.LocalStorage()
+
+    def tearDown(self):
+        app.config.update(self.old_config)
+        self.upload_folder.cleanup()
+
+    def test_save_and_open(self):
+        key = 'transaction-attachment/bon.pdf'
+        self.assertFalse(self.storage.exists(key))
+        self.storage.save(key, BytesIO(b'bon'))
+        self.assertTrue(self.storage.exists(key))
+        with self.storage.open(key) as f:
+            self.assertEqual(f.read(), b'bon')
+
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open('transaction-attachment/factuur.pdf')
+
+    def test_rename_and_remove(self):
+        self.storage.save('transaction-attachment/bon.upload', BytesIO(b'bon'))
+        self.storage.rename(
+            'transaction-attachment/bon.upload', 'transaction-attachment/bon.pdf'
+        )
+        self.assertFalse(self.storage.exists('transaction-attachment/bon.upload'))
+        self.assertTrue(self.storage.exists('transaction-attachment/bon.pdf'))
+
+        self.storage.remove('transaction-attachment/bon.pdf')
+        self.assertFalse(self.storage.exists('transaction-attachment/bon.pdf'))
+
+    def test_send(self):
+        self.storage.save('user-image/foto.jpg', BytesIO(b'foto'))
+        with app.test_request_context():
+            response = self.storage.send('user-image/foto.jpg', 'public')
+        self.assertEqual(
+            response.headers['X-Accel-Redirect'],
+            '/protected-upload/user-image/foto.jpg'
+        )
+        self.assertEqual(response.headers['Cache-Control'], 'public')
+
+    def test_invalid_key(self):
+        self.assertFalse(storage.is_valid_key('../config.py'))
+        with self.assertRaises(ValueError):
+            self.storage.exists('/etc/passwd')
+
+
+# Runs the same tests against an S3 compatible object store, if
+# S3_TEST_ENDPOINT_URL is set (see README.md)
+class TestS3Storage(TestLocalStorage):
+    def setUp(self):
+        endpoint_url = os.environ.get('S3_TEST_ENDPOINT_URL')
+        if not endpoint_url:
+            self.skipTest('S3_TEST_ENDPOINT_URL is not set')
+
+        self.old_config = {
+            key: app.config.get(key)
+            for key in list(S3_TEST_CONFIG) + ['S3_ENDPOINT_URL']
+        }
+        app.config.update(S3_TEST_CONFIG, S3_ENDPOINT_URL=endpoint_url)
+        self.storage = storage.S3Storage()
+        try:
+            self.storage.client.create_bucket(Bucket=S3_TEST_CONFIG['S3_BUCKET'])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'BucketAlreadyOwnedByYou':
+                raise
+
+    def tearDown(self):
+        bucket = S3_TEST_CONFIG['S3_BUCKET']
+        objects = self.storage.client.list_objects_v2(Bucket=bucket)
+        for s3_object in objects.get('Contents', []):
+            self.storage.client.delete_object(
+                Bucket=bucket, Key=s3_object['Key']
+            )
+        app.config.update(self.old_config)
+
+    def test_rename_and_remove(self):
+        self.storage.save('transaction-attachment/bon.upload', BytesIO(b'bon'))
+        self.storage.rename(
+            'transaction-attachment/bon.upload', 'transaction-attachment/bon.pdf'
+        )
+        self.assertFalse(self.storage.exists('transaction-attachment/bon.upload'))
+        self.assertTrue(self.storage.exists('transaction-attachment/bon.pdf'))
+
+        self.storage.remove('transaction-attachment/bon.pdf')
+        self.assertFalse(self.storage.exists('transaction-attachment/bon.pdf'))
+
+    def test_send(self):
+        self.storage.save('user-image/foto.jpg', BytesIO(b'foto'))
+        with app.test_request_context():
+            response = self.storage.send('user-image/foto.jpg', 'public')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/user-image/foto.jpg?', response.headers['Location'])
+
+    def test_invalid_key(self):
+        self.assertFalse(self.storage.exists('user-image/onbekend.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
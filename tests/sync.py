@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+from unittest import mock
+import json
+import unittest
+
+from app import app, db, util
+from app.models import Payment, MonetaryAccountSyncState
+
+
+class FakePagination(object):
+    def __init__(self, count, older_id, newer_id):
+        self.count = count
+        self.older_id = older_id
+        self.newer_id = newer_id
+
+    def has_previous_page(self):
+        return self.older_id is not None
+
+    def has_next_page_assured(self):
+        return self.newer_id is not None
+
+    @property
+    def url_params_previous_page(self):
+        return {'count': self.count, 'older_id': self.older_id}
+
+    @property
+    def url_params_next_page(self):
+        return {'count': self.count, 'newer_id': self.newer_id}
+
+
+class FakePayment(object):
+    def __init__(self, bank_payment_id):
+        self.bank_payment_id = bank_payment_id
+
+    def to_json(self):
+        return json.dumps({
+            'id': self.bank_payment_id,
+            'monetary_account_id': 1,
+            'alias': {'value': 'NL00BUNQ0000000001'},
+            'amount': {'value': '-1.00', 'currency': 'EUR'}
+        })
+
+
+class FakeResponse(object):
+    def __init__(self, value, pagination):
+        self.value = value
+        self.pagination = pagination
+
+
+# Behaves like the Bunq payment list endpoint: newest payments first and
+# pagination using older_id and newer_id
+class FakeBunq(object):
+    def __init__(self, bank_payment_ids):
+        self.bank_payment_ids = sorted(bank_payment_ids, reverse=True)
+        self.fail_on_call = None
+        self.calls = 0
+
+    def list(self, monetary_account_id, params):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise Exception('Bunq is down')
+
+        count = params['count']
+        ids = self.bank_payment_ids
+        if 'older_id' in params:
+            page = [i for i in ids if i < params['older_id']][:count]
+        elif 'newer_id' in params:
+            page = [i for i in ids if i > params['newer_id']][-count:]
+        else:
+            page = ids[:count]
+
+        older_id = None
+        newer_id = None
+        if page and min(page) > min(ids):
+            older_id = min(page)
+        if page and max(page) < max(ids):
+            newer_id = max(page)
+        return FakeResponse(
+            [FakePayment(i) for i in page],
+            FakePagination(count, older_id, newer_id)
+        )
+
+
+class TestSyncMonetaryAccount(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+        self.page_size_patch = mock.patch.object(
+            util, 'BUNQ_PAYMENTS_PAGE_SIZE', 2
+        )
+        self.page_size_patch.start()
+
+    def tearDown(self):
+        self.page_size_patch.stop()
+        db.session.remove()
+        db.drop_all()
+
+    def _sync(self, fake_bunq):
+        with mock.patch.object(
+            util.endpoint.Payment, 'list', side_effect=fake_bunq.list
+        ):
+            return util._sync_monetary_account(1, 1, {})
+
+    def _sync_state(self):
+        return MonetaryAccountSyncState.query.filter_by(
+            project_id=1, monetary_account_id=1
+        ).first()
+
+    def test_backfill_and_new_payments(self):
+        fake_bunq = FakeBunq([1, 2, 3, 4, 5])
+        new_payments_count, _ = self._sync(fake_bunq)
+        self.assertEqual(new_payments_count, 5)
+        sync_state = self._sync_state()
+        self.assertEqual(sync_state.newest_bank_payment_id, 5)
+        self.assertEqual(sync_state.oldest_bank_payment_id, 1)
+        self.assertTrue(sync_state.backfill_complete)
+
+        # Only the new payments are requested on the next sync
+        fake_bunq.bank_payment_ids = [7, 6] + fake_bunq.bank_payment_ids
+        fake_bunq.calls = 0
+        new_payments_count, _ = self._sync(fake_bunq)
+        self.assertEqual(new_payments_count, 2)
+        self.assertEqual(fake_bunq.calls, 1)
+        self.assertEqual(self._sync_state().newest_bank_payment_id, 7)
+        self.assertEqual(Payment.query.count(), 7)
+
+    def test_new_payments_spanning_multiple_pages(self):
+        fake_bunq = FakeBunq([1, 2])
+        self._sync(fake_bunq)
+
+        fake_bunq.bank_payment_ids = [7, 6, 5, 4, 3] + fake_bunq.bank_payment_ids
+        fake_bunq.calls = 0
+        new_payments_count, _ = self._sync(fake_bunq)
+        self.assertEqual(new_payments_count, 5)
+        self.assertEqual(fake_bunq.calls, 3)
+        sync_state = self._sync_state()
+        self.assertEqual(sync_state.newest_bank_payment_id, 7)
+        self.assertIsNone(sync_state.last_error)
+
+    def test_resume_after_error(self):
+        fake_bunq = FakeBunq([1, 2, 3, 4, 5])
+        fake_bunq.fail_on_call = 2
+        new_payments_count, _ = self._sync(fake_bunq)
+        self.assertEqual(new_payments_count, 2)
+        sync_state = self._sync_state()
+        self.assertEqual(sync_state.oldest_bank_payment_id, 4)
+        self.assertFalse(sync_state.backfill_complete)
+        self.assertIn('Bunq is down', sync_state.last_error)
+
+        fake_bunq.fail_on_call = None
+        new_payments_count, _ = self._sync(fake_bunq)
+        self.assertEqual(new_payments_count, 3)
+        sync_state = self._sync_state()
+        self.assertTrue(sync_state.backfill_complete)
+        self.assertIsNone(sync_state.last_error)
+        self.assertEqual(
+            sorted(p.bank_payment_id for p in Payment.query),
+            [1, 2, 3, 4, 5]
+        )
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+from tempfile import TemporaryDirectory
+import os
+import unittest
+
+from PIL import Image
+
+from app import app, db, thumbnails
+from app.models import File
+
+
+class TestThumbnails(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+
+        self.upload_folder = TemporaryDirectory()
+        self.old_upload_folder = app.config['UPLOAD_FOLDER']
+        app.config['UPLOAD_FOLDER'] = self.upload_folder.name
+        os.mkdir(os.path.join(self.upload_folder.name, 'user-image'))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        app.config['UPLOAD_FOLDER'] = self.old_upload_folder
+        self.upload_folder.cleanup()
+
+    def _add_file(self, filename, mimetype):
+        file = File(filename=filename, mimetype=mimetype)
+        db.session.add(file)
+        db.session.commit()
+        return file
+
+    def _get_size(self, filename, width, image_format):
+        with Image.open(
+                os.path.join(
+                    self.upload_folder.name,
+                    thumbnails.get_thumbnail_filename(
+                        'user-image/' + filename, width, image_format
+                    )
+                )) as image:
+            return image.format, image.size
+
+    def test_create_thumbnails(self):
+        Image.new('RGBA', (480, 240)).save(
+            os.path.join(self.upload_folder.name, 'user-image', 'foto.png')
+        )
+        file = self._add_file('foto.png', 'image/png')
+
+        self.assertTrue(thumbnails.create_thumbnails(file, 'user-image'))
+        self.assertTrue(File.query.get(file.id).thumbnails)
+        for width, image_format, size in [
+            (160, 'webp', (160, 80)),
+            (320, 'jpeg', (320, 160)),
+            # Images are not enlarged
+            (640, 'jpeg', (480, 240))
+        ]:
+            self.assertEqual(
+                self._get_size('foto.png', width, image_format),
+                (image_format.upper(), size)
+            )
+
+    def test_invalid_image(self):
+        path = os.path.join(self.upload_folder.name, 'user-image', 'foto.jpg')
+        with open(path, 'w') as f:
+            f.write('geen foto')
+        file = self._add_file('foto.jpg', 'image/jpeg')
+
+        self.assertFalse(thumbnails.create_thumbnails(file, 'user-image'))
+        self.assertFalse(thumbnails.has_thumbnails(File.query.get(file.id)))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+from io import BytesIO
+from tempfile import TemporaryDirectory
+import hashlib
+import os
+import unittest
+
+from werkzeug.datastructures import FileStorage, Headers
+from werkzeug.exceptions import NotFound
+
+from app import app, db, form_processing, uploads
+from app.models import Project, Payment, File
+
+
+class TestUploads(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.create_all()
+
+        self.upload_folder = TemporaryDirectory()
+        self.old_config = {
+            key: app.config.get(key)
+            for key in ['UPLOAD_FOLDER', 'UPLOAD_X_ACCEL_REDIRECT']
+        }
+        app.config['UPLOAD_FOLDER'] = self.upload_folder.name
+        app.config['UPLOAD_X_ACCEL_REDIRECT'] = '/protected-upload/'
+        os.mkdir(
+            os.path.join(self.upload_folder.name, 'transaction-attachment')
+        )
+
+        db.session.add(Project(id=1, name='testproject'))
+        for i, hidden in enumerate([False, True]):
+            filename = '2020-01-01T12:00:0%s_bon.jpg' % i
+            path = os.path.join(
+                self.upload_folder.name, 'transaction-attachment', filename
+            )
+            with open(path, 'w') as f:
+                f.write('bon')
+            payment = Payment(project_id=1, hidden=hidden, type='MANUAL')
+            payment.attachments.append(
+                File(filename=filename, mimetype='image/jpeg')
+            )
+            db.session.add(payment)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        app.config.update(self.old_config)
+        self.upload_folder.cleanup()
+
+    def _send_upload(self, filename):
+        with app.test_request_context():
+            return uploads.send_upload('transaction-attachment/' + filename)
+
+    def test_x_accel_redirect(self):
+        response = self._send_upload('2020-01-01T12:00:00_bon.jpg')
+        self.assertEqual(
+            response.headers['X-Accel-Redirect'],
+            '/protected-upload/transaction-attachment/2020-01-01T12:00:00_bon.jpg'
+        )
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertEqual(
+            response.headers['Cache-Control'],
+            'public, max-age=31536000, immutable'
+        )
+
+    def test_hidden_attachment(self):
+        with self.assertRaises(NotFound):
+            self._send_upload('2020-01-01T12:00:01_bon.jpg')
+        with self.assertRaises(NotFound):
+            self._send_upload('../../etc/passwd')
+
+    def test_same_filename_in_other_folder(self):
+        # A user image with the filename of a hidden attachment is public
+        with app.test_request_context():
+            self.assertEqual(
+                uploads.check_access('user-image/2020-01-01T12:00:01_bon.jpg'),
+                'public'
+            )
+            with self.assertRaises(NotFound):
+                uploads.check_access(
+                    'transaction-attachment/2020-01-01T12:00:01_bon.jpg'
+                )
+
+    def test_save_upload(self):
+        digest = hashlib.sha256(b'factuur').hexdigest()
+        for name, created in [('Factuur.PDF', True), ('kopie.pdf', False)]:
+            self.assertEqual(
+                uploads.save_upload(
+                    FileStorage(BytesIO(b'factuur'), filename=name),
+                    'transaction-attachment'
+                ),
+                (digest + '.pdf', digest, created)
+            )
+        # Only the file itself is left, no temporary files
+        self.assertEqual(
+            sorted(os.listdir(
+                os.path.join(self.upload_folder.name, 'transaction-attachment')
+            )),
+            [
+                '2020-01-01T12:00:00_bon.jpg',
+                '2020-01-01T12:00:01_bon.jpg',
+                digest + '.pdf'
+            ]
+        )
+
+    def test_save_attachment_same_content(self):
+        payments = Payment.query.order_by(Payment.id).all()
+        for payment, mediatype in zip(
+                payments + payments, ['bon', 'media', 'bon', 'media']):
+            form_processing.save_attachment(
+                FileStorage(
+                    BytesIO(b'factuur'),
+                    filename='factuur.pdf',
+                    headers=Headers([
+                        ('Content-Disposition', 'form-data'),
+                        ('Content-Type', 'application/pdf')
+                    ])
+                ),
+                mediatype,
+                payment,
+                'transaction-attachment'
+            )
+        # Each payment gets its own row, attached once, but the rows share
+        # the file on disk
+        digest = hashlib.sha256(b'factuur').hexdigest()
+        files = File.query.filter_by(sha256=digest).order_by(File.id).all()
+        self.assertEqual(
+            [(f.filename, f.mediatype) for f in files],
+            [(digest + '.pdf', 'bon'), (digest + '.pdf', 'media')]
+        )
+        for payment in payments:
+            self.assertEqual(
+                payment.attachments.filter_by(sha256=digest).count(), 1
+            )
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)